@@ -0,0 +1,350 @@
+import os
+import mmap
+import struct
+import numpy as np
+import networkx as nx
+
+from fgutils.const import SYMBOL_KEY, BOND_KEY, AAM_KEY, LABELS_KEY, IS_LABELED_KEY
+from fgutils.chem.ps import atomic_sym2num, atomic_num2sym
+
+# Record layout (little endian):
+#
+#   header         "<4sBBHii" magic, version, flags, reserved, n_nodes, n_edges
+#   node ids       int32[n_nodes]             (only if _F_NODE_IDS)
+#   aam            int32[n_nodes]             (only if _F_AAM)
+#   edges          int32[2 * n_edges]
+#   atomic numbers uint8[n_nodes]             (bit 7 marks aromatic symbols)
+#   bond codes     int8[n_edges * (1|2)]      (2 * bond order, 2 per ITS edge)
+#   float mask     uint8[ceil(n_bonds / 8)]   (only if _F_MIXED_BONDS)
+#   padding        to a multiple of 4 bytes
+#   symbols        uint32 length + utf-8 data (only if _F_SYMBOLS)
+#   labels         uint32 length + utf-8 data (only if _F_LABELS)
+#
+# Streams are a sequence of records each prefixed with its uint64 length.
+
+_MAGIC = b"FGUG"
+_VERSION = 1
+_HEADER = struct.Struct("<4sBBHii")
+_LENGTH = struct.Struct("<Q")
+_STR_LENGTH = struct.Struct("<I")
+
+_F_ITS = 1
+_F_FLOAT_BONDS = 2
+_F_MIXED_BONDS = 4
+_F_NODE_IDS = 8
+_F_AAM = 16
+_F_SYMBOLS = 32
+_F_LABELS = 64
+
+_AROMATIC_BIT = 0x80
+_NO_AAM = np.iinfo(np.int32).min
+_SEP = "\0"
+
+
+def _encode_symbol(symbol) -> int:
+    if symbol in atomic_sym2num:
+        return atomic_sym2num[symbol]
+    if isinstance(symbol, str) and symbol.islower():
+        num = atomic_sym2num.get(symbol.capitalize(), 0)
+        if num > 0:
+            return num | _AROMATIC_BIT
+    return 0
+
+
+def _decode_symbol(code: int) -> str:
+    symbol = atomic_num2sym[code & ~_AROMATIC_BIT]
+    if code & _AROMATIC_BIT:
+        symbol = symbol.lower()
+    return symbol
+
+
+def _pad(n: int) -> int:
+    return (4 - n % 4) % 4
+
+
+def _encode_str_list(values: list[str]) -> bytes:
+    data = _SEP.join(values).encode("utf-8")
+    return _STR_LENGTH.pack(len(data)) + data
+
+
+def _decode_str_list(buffer, offset: int, count: int) -> tuple[list[str], int]:
+    (length,) = _STR_LENGTH.unpack_from(buffer, offset)
+    offset += _STR_LENGTH.size
+    end = offset + length
+    data = bytes(buffer[offset:end]).decode("utf-8")
+    values = data.split(_SEP) if count > 0 else []
+    return values, end
+
+
+def _get_bonds(edges) -> tuple[list, int]:
+    flags = 0
+    is_its = len(edges) > 0 and isinstance(edges[0][2], (tuple, list))
+    if is_its:
+        flags |= _F_ITS
+    bonds = []
+    for u, v, bond in edges:
+        if bond is None:
+            raise ValueError("Graph edge {} has no bond label.".format((u, v)))
+        if is_its:
+            bonds.extend(bond)
+        else:
+            bonds.append(bond)
+    return bonds, flags
+
+
+def _encode_strings(nodes, extra_symbols: list[str], flags: int) -> list[bytes]:
+    chunks = []
+    if flags & _F_SYMBOLS:
+        chunks.append(_encode_str_list(extra_symbols))
+    if flags & _F_LABELS:
+        labels = [",".join(d.get(LABELS_KEY, [])) for _, d in nodes]
+        chunks.append(_encode_str_list(labels))
+    return chunks
+
+
+def dumps(graph) -> bytes:
+    """Serialize a molecular graph or an ITS graph into the compact binary
+    graph format. The node labels ``SYMBOL_KEY``, ``AAM_KEY``, ``LABELS_KEY``
+    and ``IS_LABELED_KEY`` and the edge label ``BOND_KEY`` are stored. All
+    other labels are dropped. Bond orders are stored with a resolution of
+    0.5 which covers aromatic bonds and charges.
+
+    :param graph: The graph to serialize. This can also be an instance of
+        :py:class:`~fgutils.its.ITS`.
+
+    :returns: Returns the binary representation of the graph.
+    """
+    if not isinstance(graph, nx.Graph):
+        graph = graph.graph
+    nodes = list(graph.nodes(data=True))
+    edges = list(graph.edges(data=BOND_KEY))
+    n_nodes, n_edges = len(nodes), len(edges)
+    node_ids = [n for n, _ in nodes]
+    idx_map = {n: i for i, n in enumerate(node_ids)}
+
+    bonds, flags = _get_bonds(edges)
+    is_float = [isinstance(b, float) for b in bonds]
+    if len(bonds) > 0 and all(is_float):
+        flags |= _F_FLOAT_BONDS
+    elif any(is_float):
+        flags |= _F_MIXED_BONDS
+
+    if node_ids != list(range(n_nodes)):
+        if not all(isinstance(n, int) for n in node_ids):
+            raise TypeError("Binary graph format requires integer node ids.")
+        flags |= _F_NODE_IDS
+    aam = [d.get(AAM_KEY, None) for _, d in nodes]
+    if any(a is not None for a in aam):
+        flags |= _F_AAM
+    symbols = [d[SYMBOL_KEY] for _, d in nodes]
+    sym_codes = [_encode_symbol(s) for s in symbols]
+    extra_symbols = [str(s) for s, c in zip(symbols, sym_codes) if c == 0]
+    if len(extra_symbols) > 0:
+        flags |= _F_SYMBOLS
+    if any(LABELS_KEY in d for _, d in nodes):
+        flags |= _F_LABELS
+
+    chunks = [_HEADER.pack(_MAGIC, _VERSION, flags, 0, n_nodes, n_edges)]
+    if flags & _F_NODE_IDS:
+        chunks.append(np.array(node_ids, dtype="<i4").tobytes())
+    if flags & _F_AAM:
+        aam = [_NO_AAM if a is None else a for a in aam]
+        chunks.append(np.array(aam, dtype="<i4").tobytes())
+    edge_array = np.array(
+        [(idx_map[u], idx_map[v]) for u, v, _ in edges], dtype="<i4"
+    ).reshape(-1)
+    chunks.append(edge_array.tobytes())
+    chunks.append(np.array(sym_codes, dtype=np.uint8).tobytes())
+    chunks.append(np.rint(np.array(bonds, dtype=float) * 2).astype(np.int8).tobytes())
+    if flags & _F_MIXED_BONDS:
+        chunks.append(np.packbits(np.array(is_float, dtype=bool)).tobytes())
+    size = sum(len(c) for c in chunks)
+    chunks.append(b"\0" * _pad(size))
+    chunks.extend(_encode_strings(nodes, extra_symbols, flags))
+    return b"".join(chunks)
+
+
+def _decode_bonds(codes, flags, float_mask):
+    if flags & _F_FLOAT_BONDS:
+        return [c / 2 for c in codes]
+    bonds = []
+    for i, c in enumerate(codes):
+        if c % 2 == 0 and (float_mask is None or not float_mask[i]):
+            bonds.append(c // 2)
+        else:
+            bonds.append(c / 2)
+    return bonds
+
+
+def loads(buffer, offset: int = 0) -> nx.Graph:
+    """Deserialize a graph from the binary graph format. The buffer can be
+    any object supporting the buffer protocol, e.g., ``bytes`` or a memory
+    mapped file. The arrays are read directly from the buffer without
+    copying the record first.
+
+    :param buffer: The buffer holding the binary graph.
+    :param offset: (optional) The position of the record in the buffer.
+        (Default: 0)
+
+    :returns: Returns the graph. Bonds of ITS graphs are returned as tuples.
+    """
+    magic, version, flags, _, n_nodes, n_edges = _HEADER.unpack_from(buffer, offset)
+    if magic != _MAGIC:
+        raise ValueError("Buffer does not contain a binary graph at {}.".format(offset))
+    start = offset
+    if version != _VERSION:
+        raise ValueError("Unsupported binary graph version {}.".format(version))
+    offset += _HEADER.size
+    node_ids = range(n_nodes)
+    if flags & _F_NODE_IDS:
+        node_ids = np.frombuffer(buffer, "<i4", n_nodes, offset).tolist()
+        offset += 4 * n_nodes
+    aam = None
+    if flags & _F_AAM:
+        aam = np.frombuffer(buffer, "<i4", n_nodes, offset).tolist()
+        offset += 4 * n_nodes
+    edges = np.frombuffer(buffer, "<i4", 2 * n_edges, offset).tolist()
+    offset += 8 * n_edges
+    sym_codes = np.frombuffer(buffer, np.uint8, n_nodes, offset).tolist()
+    offset += n_nodes
+    n_bonds = 2 * n_edges if flags & _F_ITS else n_edges
+    codes = np.frombuffer(buffer, np.int8, n_bonds, offset).tolist()
+    offset += n_bonds
+    float_mask = None
+    if flags & _F_MIXED_BONDS:
+        mask_size = (n_bonds + 7) // 8
+        packed = np.frombuffer(buffer, np.uint8, mask_size, offset)
+        float_mask = np.unpackbits(packed, count=n_bonds).tolist()
+        offset += mask_size
+    offset += _pad(offset - start)
+    extra_symbols = []
+    if flags & _F_SYMBOLS:
+        n_extra = sym_codes.count(0)
+        extra_symbols, offset = _decode_str_list(buffer, offset, n_extra)
+    labels = None
+    if flags & _F_LABELS:
+        labels, offset = _decode_str_list(buffer, offset, n_nodes)
+
+    g = nx.Graph()
+    extra_symbols = iter(extra_symbols)
+    for i, n in enumerate(node_ids):
+        code = sym_codes[i]
+        symbol = _decode_symbol(code) if code > 0 else next(extra_symbols)
+        d = {SYMBOL_KEY: symbol}
+        if aam is not None and aam[i] != _NO_AAM:
+            d[AAM_KEY] = aam[i]
+        if labels is not None:
+            node_labels = labels[i].split(",") if labels[i] else []
+            d[LABELS_KEY] = node_labels
+            d[IS_LABELED_KEY] = len(node_labels) > 0
+        g.add_node(n, **d)
+    bonds = _decode_bonds(codes, flags, float_mask)
+    if flags & _F_ITS:
+        bonds = list(zip(bonds[0::2], bonds[1::2]))
+    g.add_edges_from(
+        (node_ids[edges[2 * i]], node_ids[edges[2 * i + 1]], {BOND_KEY: bonds[i]})
+        for i in range(n_edges)
+    )
+    return g
+
+
+def _open(file, mode):
+    if isinstance(file, (str, os.PathLike)):
+        return open(file, mode), True
+    return file, False
+
+
+def dump(graph, file):
+    """Write a single graph in binary graph format to a file.
+
+    :param graph: The graph to write.
+    :param file: A file path or a file object opened in binary mode.
+    """
+    f, close = _open(file, "wb")
+    try:
+        f.write(dumps(graph))
+    finally:
+        if close:
+            f.close()
+
+
+def load(file) -> nx.Graph:
+    """Read a single graph in binary graph format from a file.
+
+    :param file: A file path or a file object opened in binary mode.
+
+    :returns: Returns the graph.
+    """
+    f, close = _open(file, "rb")
+    try:
+        return loads(f.read())
+    finally:
+        if close:
+            f.close()
+
+
+def dump_stream(graphs, file) -> list[int]:
+    """Write a sequence of graphs as length-prefixed binary records.
+
+    :param graphs: An iterable of graphs.
+    :param file: A file path or a file object opened in binary mode.
+
+    :returns: Returns the list of record offsets relative to the start of
+        the stream. The offset points to the record and not to its length
+        prefix.
+    """
+    f, close = _open(file, "wb")
+    offsets = []
+    position = 0
+    try:
+        for graph in graphs:
+            data = dumps(graph)
+            f.write(_LENGTH.pack(len(data)))
+            f.write(data)
+            position += _LENGTH.size
+            offsets.append(position)
+            position += len(data)
+    finally:
+        if close:
+            f.close()
+    return offsets
+
+
+def iter_records(buffer, offset: int = 0):
+    """Iterate the records of a binary graph stream without decoding them.
+
+    :param buffer: The buffer holding the stream.
+    :param offset: (optional) The position where the stream starts.
+        (Default: 0)
+
+    :returns: Yields tuples ``(offset, length)`` for each record.
+    """
+    size = len(buffer)
+    while offset < size:
+        (length,) = _LENGTH.unpack_from(buffer, offset)
+        offset += _LENGTH.size
+        yield offset, length
+        offset += length
+
+
+def load_stream(file):
+    """Read graphs from a binary graph stream. If a file path is given the
+    file is memory mapped and records are decoded lazily.
+
+    :param file: A file path, a file object opened in binary mode or a
+        buffer.
+
+    :returns: Yields the graphs in the order they were written.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                for offset, _ in iter_records(buffer):
+                    yield loads(buffer, offset)
+        return
+    if hasattr(file, "read"):
+        file = file.read()
+    for offset, _ in iter_records(file):
+        yield loads(file, offset)
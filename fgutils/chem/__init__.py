@@ -4,4 +4,4 @@ from .ps import (
     get_electronegativity,
     get_num_valence_electrons,
 )
-from .valence import check_valence
+from .valence import check_valence, ValenceChecker
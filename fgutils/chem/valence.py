@@ -20,16 +20,71 @@ def _check_mol_valence(g: nx.Graph, exact=False) -> bool:
                 bond = int(2 * bond)
             covalent_bonds += bond
         valence = valence_electrons + covalent_bonds
-        if exact:
-            valid = valence == exp_valence
-        else:
-            # Need 0.5 tolerance for aromatic systems
-            valid = valence <= (exp_valence + 0.5)
-        if not valid:
+        if not _is_valid_valence(valence, exp_valence, exact):
             return False
     return True
 
 
+def _is_valid_valence(valence, exp_valence, exact=False) -> bool:
+    if exact:
+        return valence == exp_valence
+    # Need 0.5 tolerance for aromatic systems
+    return valence <= (exp_valence + 0.5)
+
+
+class ValenceChecker:
+    """Incremental valence check for ITS graphs that are built from one
+    reactant graph. The valence of every reactant atom is computed once on
+    construction. An ITS graph that changes the bonds of a few atoms can
+    then be checked by only looking at the valence change of these atoms.
+
+    :param g: The reactant molecular graph.
+    :param exact: (optional) If set to true the valence must be exact for all
+        atoms. (Default: False)
+    """
+
+    def __init__(self, g: nx.Graph, exact=False):
+        self.exact = exact
+        self.valence = {}
+        self.exp_valence = {}
+        self.is_valid = True
+        for n, d in g.nodes(data=True):
+            exp_valence = 8
+            if d[SYMBOL_KEY] == "H":
+                exp_valence = 2
+            sym = to_non_aromatic_symbol(d[SYMBOL_KEY])
+            valence = get_num_valence_electrons(sym)
+            for neighbor in g.neighbors(n):
+                bond = g.edges[n, neighbor][BOND_KEY]
+                if neighbor == n:
+                    bond = int(2 * bond)
+                valence += bond
+            self.valence[n] = valence
+            self.exp_valence[n] = exp_valence
+            if not _is_valid_valence(valence, exp_valence, exact):
+                self.is_valid = False
+
+    def check(self, delta: dict) -> bool:
+        """Check if the valence of both reactant and product is valid if the
+        bond orders around some atoms change.
+
+        :param delta: A dictionary with the atom as key and the change in
+            covalent bonds as value. Charge changes are counted twice like
+            in the ITS valence check.
+
+        :returns: Returns true if the valence is valid for all atoms in the
+            reactant and in the product.
+        """
+        if not self.is_valid:
+            return False
+        for n, d in delta.items():
+            if not _is_valid_valence(
+                self.valence[n] + d, self.exp_valence[n], self.exact
+            ):
+                return False
+        return True
+
+
 def _check_its_valence(its: nx.Graph | ITS, exact=False) -> bool:
     if isinstance(its, ITS):
         its = its.graph
@@ -0,0 +1,189 @@
+import math
+import sqlite3
+import hashlib
+import tempfile
+import networkx as nx
+import rdkit.Chem as Chem
+
+from fgutils.const import SYMBOL_KEY, BOND_KEY
+from fgutils.utils import to_non_aromatic_symbol
+
+
+def _get_bond_code(bond) -> int:
+    if isinstance(bond, (tuple, list)):
+        g_bond, h_bond = bond
+    else:
+        g_bond, h_bond = bond, bond
+    g_code = int(round(2 * g_bond)) + 16
+    h_code = int(round(2 * h_bond)) + 16
+    if g_code < 0 or g_code > 32 or h_code < 0 or h_code > 32:
+        raise ValueError("Bond {} is out of range for the exact key.".format(bond))
+    return 1 + 33 * g_code + h_code
+
+
+def _get_exact_key(g: nx.Graph) -> str:
+    mol = Chem.rdchem.RWMol()
+    idx_map = {}
+    for n, d in g.nodes(data=True):
+        symbol = d[SYMBOL_KEY]
+        atom = Chem.rdchem.Atom(to_non_aromatic_symbol(symbol))
+        atom.SetNoImplicit(True)
+        if symbol != to_non_aromatic_symbol(symbol):
+            atom.SetIsotope(1)
+        idx_map[n] = mol.AddAtom(atom)
+    for u, v, d in g.edges(data=True):
+        bond_atom = Chem.rdchem.Atom(0)
+        bond_atom.SetNoImplicit(True)
+        bond_atom.SetIsotope(_get_bond_code(d[BOND_KEY]))
+        idx = mol.AddAtom(bond_atom)
+        mol.AddBond(idx_map[u], idx, Chem.rdchem.BondType.SINGLE)
+        if u != v:
+            mol.AddBond(idx_map[v], idx, Chem.rdchem.BondType.SINGLE)
+    mol.UpdatePropertyCache(strict=False)
+    Chem.FastFindRings(mol)
+    return Chem.MolToSmiles(mol)
+
+
+def graph_key(g: nx.Graph, method="wl") -> str:
+    """Get a key to identify isomorphic graphs. Graphs are compared on the
+    node symbols and the edge bonds, e.g., the key of an ITS graph
+    identifies the reaction. Atom-atom maps and node labels are ignored.
+
+    The ``"wl"`` key is the 3 iteration Weisfeiler-Lehman hash. It is fast
+    but different graphs can have the same key. The ``"exact"`` key is a
+    canonical SMILES of the graph where each edge is replaced by a dummy
+    atom with the bond encoded as isotope. It is unique up to isomorphism
+    but slower.
+
+    :param g: The molecular graph or ITS graph.
+    :param method: (optional) The key type. One of ``"wl"`` or
+        ``"exact"``. (Default: "wl")
+
+    :returns: Returns the key string.
+    """
+    if method == "wl":
+        return nx.weisfeiler_lehman_graph_hash(
+            g, edge_attr=BOND_KEY, node_attr=SYMBOL_KEY, iterations=3
+        )
+    elif method == "exact":
+        return _get_exact_key(g)
+    else:
+        raise ValueError(
+            "Unknown key method '{}'. Use 'wl' or 'exact' instead.".format(method)
+        )
+
+
+class BloomFilter:
+    """Set of keys with a fixed memory footprint. Membership tests can
+    return false positives with the specified probability but never false
+    negatives, i.e., deduplicating with a bloom filter can drop some
+    unique graphs but never keeps a duplicate.
+
+    :param capacity: The expected number of keys.
+    :param error_rate: (optional) The false positive probability at
+        capacity. (Default: 0.001)
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 1e-3):
+        if capacity < 1:
+            raise ValueError("Bloom filter capacity must be positive.")
+        if error_rate <= 0 or error_rate >= 1:
+            raise ValueError("Bloom filter error rate must be in (0, 1).")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = int(
+            math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.__bits = bytearray((self.num_bits + 7) // 8)
+        self.__len = 0
+
+    def __get_indices(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.__bits[i >> 3] & (1 << (i & 7)) for i in self.__get_indices(key))
+
+    def add(self, key: str) -> bool:
+        """Add a key to the filter.
+
+        :param key: The key to add.
+
+        :returns: Returns true if the key was (probably) not in the filter.
+        """
+        is_new = False
+        for i in self.__get_indices(key):
+            if not self.__bits[i >> 3] & (1 << (i & 7)):
+                self.__bits[i >> 3] |= 1 << (i & 7)
+                is_new = True
+        if is_new:
+            self.__len += 1
+        return is_new
+
+    def __len__(self):
+        return self.__len
+
+
+class DiskSet:
+    """Set of keys stored in an SQLite database, i.e., the number of keys
+    is not limited by memory. Inserts are committed in batches.
+
+    :param path: (optional) The path of the database file. If not set a
+        temporary file is used. (Default: None)
+    :param batch_size: (optional) The number of inserts per commit.
+        (Default: 10000)
+    """
+
+    def __init__(self, path=None, batch_size: int = 10000):
+        if path is None:
+            self.__tmp_dir = tempfile.TemporaryDirectory()
+            path = "{}/seen.db".format(self.__tmp_dir.name)
+        else:
+            self.__tmp_dir = None
+        self.path = path
+        self.batch_size = batch_size
+        self.__pending = 0
+        self.__db = sqlite3.connect(path)
+        self.__db.execute(
+            "CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY) WITHOUT ROWID"
+        )
+
+    def __contains__(self, key: str) -> bool:
+        cursor = self.__db.execute("SELECT 1 FROM seen WHERE key = ?", (key,))
+        return cursor.fetchone() is not None
+
+    def add(self, key: str) -> bool:
+        """Add a key to the set.
+
+        :param key: The key to add.
+
+        :returns: Returns true if the key was not in the set.
+        """
+        cursor = self.__db.execute("INSERT OR IGNORE INTO seen VALUES (?)", (key,))
+        self.__pending += 1
+        if self.__pending >= self.batch_size:
+            self.__db.commit()
+            self.__pending = 0
+        return cursor.rowcount == 1
+
+    def __len__(self):
+        return self.__db.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def close(self):
+        """Commit pending inserts and close the database."""
+        if self.__db is not None:
+            self.__db.commit()
+            self.__db.close()
+            self.__db = None
+        if self.__tmp_dir is not None:
+            self.__tmp_dir.cleanup()
+            self.__tmp_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,11 +1,20 @@
 # Modified from https://github.com/klausweinbauer/AAMUtils/blob/main/aamutils/algorithm/aaming.py
 
+import itertools
 import collections
 import networkx as nx
+import rdkit.Chem.rdChemReactions as rdChemReactions
+import rdkit.Chem.rdmolops as rdmolops
 
 from fgutils.const import SYMBOL_KEY, AAM_KEY, BOND_KEY, IDX_MAP_KEY
-from fgutils.rdkit import smiles_to_graph, graph_to_smiles
-from fgutils.utils import complete_aam, get_unreachable_nodes, relabel_graph
+from fgutils.rdkit import smiles_to_graph, graph_to_smiles, its_to_mols
+from fgutils.utils import (
+    complete_aam,
+    get_unreachable_nodes,
+    relabel_graph,
+    parallel_imap,
+    get_num_jobs,
+)
 
 
 def _add_its_nodes(ITS, G, H, eta):
@@ -200,6 +209,71 @@ def remove_reagents(its):
     raise RuntimeError("No reaction center found.")
 
 
+class FailedConversion:
+    """Record describing a reaction that could not be converted.
+
+    :param index: The position of the reaction in the input.
+    :param smiles: The reaction SMILES.
+    :param error: The name of the exception type.
+    :param message: The error message.
+    """
+
+    def __init__(self, index: int, smiles: str, error: str, message: str):
+        self.index = index
+        self.smiles = smiles
+        self.error = error
+        self.message = message
+
+    def __str__(self):
+        return "Reaction {} '{}' failed with {}: {}".format(
+            self.index, self.smiles, self.error, self.message
+        )
+
+    def __repr__(self):
+        return "FailedConversion({})".format(str(self))
+
+
+def _its_from_smiles(index, smiles):
+    try:
+        return ITS.from_smiles(smiles)
+    except Exception as e:
+        return FailedConversion(index, smiles, type(e).__name__, str(e))
+
+
+def _its_from_smiles_worker(task):
+    offset, chunk = task
+    return [_its_from_smiles(offset + i, smiles) for i, smiles in enumerate(chunk)]
+
+
+def _iter_smiles_chunks(smiles, chunksize):
+    it = iter(smiles)
+    offset = 0
+    while True:
+        chunk = list(itertools.islice(it, chunksize))
+        if len(chunk) == 0:
+            break
+        yield offset, chunk
+        offset += len(chunk)
+
+
+def _iter_its_from_smiles(cls, smiles, n_jobs, on_error, chunksize):
+    results = parallel_imap(
+        _its_from_smiles_worker,
+        _iter_smiles_chunks(smiles, chunksize),
+        n_jobs=n_jobs,
+        max_pending=4 * get_num_jobs(n_jobs),
+    )
+    for result in itertools.chain.from_iterable(results):
+        if isinstance(result, FailedConversion):
+            if on_error == "raise":
+                raise ValueError(str(result))
+            elif on_error == "skip":
+                continue
+        elif cls is not ITS:
+            result = cls(result.graph)
+        yield result
+
+
 class ITS:
     """Imaginary Transition State graph class. Superposition graph of
     reactants and products in a chemical reaction.
@@ -264,6 +338,42 @@ class ITS:
         its = get_its(g, h)
         return cls(its)
 
+    @classmethod
+    def from_smiles_many(
+        cls, smiles, n_jobs: int | None = None, on_error="skip", chunksize=64
+    ):
+        """Construct ITS graphs from many atom-atom mapped reaction smiles.
+        The conversion runs in parallel processes and the results are
+        yielded in the order of the input. The input is read lazily and at
+        most four chunks per process are pending, i.e., the reactions and
+        ITS graphs are never all in memory.
+
+        :param smiles: An iterable of atom-atom mapped reaction smiles.
+        :param n_jobs: (optional) The number of processes. Use -1 for all
+            CPUs. (Default: None)
+        :param on_error: (optional) How to handle reactions that can not be
+            converted. Available options are:
+
+            * ``"skip"``: Failed reactions are left out of the result.
+            * ``"raise"``: A ValueError is raised for the first failed
+              reaction.
+            * ``"collect"``: The result contains a
+              :py:class:`~fgutils.its.FailedConversion` record at the
+              position of the failed reaction.
+
+            (Default: "skip")
+        :param chunksize: (optional) The number of reactions sent to a worker
+            at once. (Default: 64)
+
+        :returns: Yields the ITS graphs.
+        """
+        if on_error not in ["skip", "raise", "collect"]:
+            raise ValueError(
+                "Unknown value '{}' for on_error. ".format(on_error)
+                + 'Use "skip", "raise" or "collect" instead.'
+            )
+        return _iter_its_from_smiles(cls, smiles, n_jobs, on_error, chunksize)
+
     def to_smiles(self, ignore_aam=False, implicit_h=False) -> str:
         """Convert the ITS graph into a reaction smiles.
 
@@ -280,6 +390,24 @@ class ITS:
         )
         return smiles
 
+    def to_rdkit_reaction(self, ignore_aam=False) -> rdChemReactions.ChemicalReaction:
+        """Convert the ITS graph into an RDKit reaction. The reactant and
+        product molecules are built directly from the ITS graph without
+        splitting it into two graphs first. Each connected component becomes
+        one reactant or product template.
+
+        :param ignore_aam: If set to True the reaction has no atom-atom map.
+
+        :returns: Returns the reaction as RDKit ChemicalReaction.
+        """
+        g_mol, h_mol = its_to_mols(self.graph, ignore_aam=ignore_aam)
+        rxn = rdChemReactions.ChemicalReaction()
+        for mol in rdmolops.GetMolFrags(g_mol, asMols=True, sanitizeFrags=False):
+            rxn.AddReactantTemplate(mol)
+        for mol in rdmolops.GetMolFrags(h_mol, asMols=True, sanitizeFrags=False):
+            rxn.AddProductTemplate(mol)
+        return rxn
+
     def split(self) -> tuple[nx.Graph, nx.Graph]:
         """Split the ITS graph into reactant graph G and product graph H.
 
@@ -1,12 +1,22 @@
 from __future__ import annotations
 
+import csv
+import json
+import math
+import random
+import itertools
 import networkx as nx
 import inspect
 
 from fgutils.its import split_its
-from fgutils.parse import Parser
-from fgutils.const import IS_LABELED_KEY, LABELS_KEY, AAM_KEY
-from fgutils.utils import relabel_graph
+from fgutils.rdkit import graph_to_smiles
+from fgutils.store import GraphStoreWriter
+from fgutils.parse import Parser, tokenize
+from fgutils.const import IS_LABELED_KEY, LABELS_KEY, AAM_KEY, BOND_KEY, SYMBOL_KEY
+from fgutils.utils import relabel_graph, parallel_imap, get_num_jobs
+from fgutils.dedupe import graph_key
+from fgutils.chem.ps import get_num_valence_electrons
+from fgutils.chem.valence import _is_valid_valence
 
 
 class GraphSampler:
@@ -19,7 +29,10 @@ class GraphSampler:
 
     def __init__(self, unique=False):
         self.unique = unique
-        self.__hist = []
+        self.__hist = set()
+        self.__graphs = None
+        self.__graph_cnt = 0
+        self.__cursor = 0
 
     def sample(
         self, graphs: list[ProxyGraph], group_name=None
@@ -38,9 +51,17 @@ class GraphSampler:
             should stop.
         """
         if self.unique:
-            for g in graphs:
+            # Returned graphs are kept in a set and the search continues at
+            # the last position if the same (unchanged) list is sampled again.
+            if graphs is not self.__graphs or len(graphs) != self.__graph_cnt:
+                self.__graphs = graphs
+                self.__graph_cnt = len(graphs)
+                self.__cursor = 0
+            while self.__cursor < len(graphs):
+                g = graphs[self.__cursor]
+                self.__cursor += 1
                 if g not in self.__hist:
-                    self.__hist.append(g)
+                    self.__hist.add(g)
                     return [g]
             return None
         else:
@@ -50,6 +71,117 @@ class GraphSampler:
         return self.sample(graphs)
 
 
+class WeightedSampler(GraphSampler):
+    """
+    Sampler that draws k graphs with replacement. The probability of a graph
+    is proportional to its weight. The weight is read from the graph
+    properties, e.g., ``ProxyGraph("C", weight=2)``. Graphs without the
+    property have weight 1. The cumulative weights are computed once per
+    list of graphs, i.e., a draw is O(log n).
+
+    :param k: (optional) The number of graphs per call. (Default = 1)
+    :param weight_key: (optional) The name of the graph property with the
+        weight. (Default = "weight")
+    :param seed: (optional) The seed for the random number generator.
+    """
+
+    def __init__(self, k=1, weight_key="weight", seed=None):
+        super().__init__(unique=False)
+        self.k = k
+        self.weight_key = weight_key
+        self.__random = random.Random(seed)
+        self.__cache = (None, None)
+
+    def sample(
+        self, graphs: list[ProxyGraph], group_name=None
+    ) -> list[ProxyGraph] | None:
+        _graphs, cum_weights = self.__cache
+        if graphs is not _graphs or len(cum_weights) != len(graphs):
+            cum_weights = list(
+                itertools.accumulate(
+                    g.properties.get(self.weight_key, 1) for g in graphs
+                )
+            )
+            self.__cache = (graphs, cum_weights)
+        return self.__random.choices(graphs, cum_weights=cum_weights, k=self.k)
+
+
+class StratifiedSampler(GraphSampler):
+    """
+    Sampler that partitions the graphs into strata by a graph property and
+    draws up to k graphs without replacement from each stratum. The strata
+    are returned in the order of their first graph. Graphs without the
+    property form one stratum.
+
+    :param k: (optional) The number of graphs per stratum and call.
+        (Default = 1)
+    :param strata_key: (optional) The name of the graph property with the
+        stratum. (Default = "stratum")
+    :param seed: (optional) The seed for the random number generator.
+    """
+
+    def __init__(self, k=1, strata_key="stratum", seed=None):
+        super().__init__(unique=False)
+        self.k = k
+        self.strata_key = strata_key
+        self.__random = random.Random(seed)
+        self.__cache = (None, None)
+
+    def sample(
+        self, graphs: list[ProxyGraph], group_name=None
+    ) -> list[ProxyGraph] | None:
+        _graphs, strata = self.__cache
+        if graphs is not _graphs or sum(len(s) for s in strata) != len(graphs):
+            _strata = {}
+            for g in graphs:
+                key = g.properties.get(self.strata_key, None)
+                _strata.setdefault(key, []).append(g)
+            strata = list(_strata.values())
+            self.__cache = (graphs, strata)
+        result = []
+        for stratum in strata:
+            result.extend(self.__random.sample(stratum, min(self.k, len(stratum))))
+        return result
+
+
+class ReservoirSampler(GraphSampler):
+    """
+    Sampler that draws k distinct graphs uniformly at random in a single
+    pass over the graphs (reservoir sampling with geometric skips). Only the
+    k selected graphs are kept, i.e., the sampler also works for large
+    groups or iterables of graphs. The selected graphs are returned in
+    input order.
+
+    :param k: (optional) The number of graphs per call. (Default = 1)
+    :param seed: (optional) The seed for the random number generator.
+    """
+
+    def __init__(self, k=1, seed=None):
+        super().__init__(unique=False)
+        self.k = k
+        self.__random = random.Random(seed)
+
+    def __random_open(self) -> float:
+        value = 0.0
+        while value == 0.0:
+            value = self.__random.random()
+        return value
+
+    def sample(self, graphs, group_name=None) -> list[ProxyGraph] | None:
+        iterator = enumerate(graphs)
+        reservoir = list(itertools.islice(iterator, self.k))
+        if len(reservoir) == self.k and self.k > 0:
+            w = math.exp(math.log(self.__random_open()) / self.k)
+            while True:
+                skip = int(math.log(self.__random_open()) / math.log1p(-w))
+                item = next(itertools.islice(iterator, skip, None), None)
+                if item is None:
+                    break
+                reservoir[self.__random.randrange(self.k)] = item
+                w *= math.exp(math.log(self.__random_open()) / self.k)
+        return [g for _, g in sorted(reservoir, key=lambda x: x[0])]
+
+
 class ProxyGraph:
     """
     ProxyGraph is essentially a subgraph used to expand molecules. If the node
@@ -115,6 +247,18 @@ class ProxyGroup:
         self.sampler = GraphSampler(unique=unique) if sampler is None else sampler
         self.graphs = graphs
 
+    @property
+    def sampler(self):
+        """The sampler object or function. The sampler signature is
+        inspected once when the sampler is set."""
+        return self.__sampler
+
+    @sampler.setter
+    def sampler(self, value):
+        self.__sampler = value
+        argspec = inspect.getfullargspec(value)
+        self.__pass_group_name = "group_name" in argspec.args
+
     def __str__(self):
         s = "ProxyGroup {}\n".format(self.name)
         for g in self.graphs:
@@ -230,16 +374,219 @@ class ProxyGroup:
         :returns: A list of ProxyGraph objects or None if there is nothing more
             to sample.
         """
-        kwargs = {}
-        argspec = inspect.getfullargspec(self.sampler)
-        if "group_name" in argspec.args:
-            kwargs["group_name"] = self.name
-        result = self.sampler(self.graphs, **kwargs)
+        if self.__pass_group_name:
+            result = self.__sampler(self.graphs, group_name=self.name)
+        else:
+            result = self.__sampler(self.graphs)
         if result is not None and not isinstance(result, list):
             result = [result]
         return result
 
 
+def _is_exhaustive(group: ProxyGroup) -> bool:
+    return type(group.sampler) is GraphSampler and not group.sampler.unique
+
+
+class ProxyGrammar:
+    """Compiled form of the groups of a proxy. The groups are the
+    nonterminals and the group graphs are the productions of a context-free
+    graph grammar. Compiling validates the grammar once, i.e., labels that
+    do not refer to a group and groups that can not be fully expanded raise
+    an error before any sample is generated. A group can not be fully
+    expanded if none of its graphs leads to a graph without labeled nodes
+    or if it is part of a cycle of groups that use the default
+    :py:class:`~fgutils.proxy.GraphSampler`, which expands every graph of a
+    group. The validation only scans the node labels of the patterns, i.e.,
+    the patterns are not parsed. Each pattern is parsed once on first use
+    into a template with the group names of its labeled nodes in expansion
+    order (see :py:meth:`~fgutils.proxy.ProxyGrammar.get_template`). The
+    anchors of a subgraph are indices into its template and are resolved
+    when the subgraph is inserted.
+
+    :param groups: The mapping of group names to groups.
+    :param parser: The parser to convert patterns into structures.
+    :param core: (optional) The core group. If set, only the groups that
+        can be reached from the core graphs are compiled. (Default: None)
+    """
+
+    def __init__(
+        self,
+        groups: dict[str, ProxyGroup],
+        parser: Parser,
+        core: ProxyGroup | None = None,
+    ):
+        self.groups = groups
+        self.parser = parser
+        self.templates = {}
+        self.__group_names = {}
+        self.__min_sizes = {}
+        for name, group in groups.items():
+            if group.name != name:
+                raise ValueError(
+                    "Dictionary key '{}' does not match group name '{}'.".format(
+                        name, group.name
+                    )
+                )
+        if core is None:
+            names = list(groups.keys())
+        else:
+            names = self.__get_reachable(core)
+        dependencies = {
+            name: [self.get_group_names(g.pattern) for g in groups[name].graphs]
+            for name in names
+        }
+        self.__check_productive(dependencies)
+        self.__check_recursion(dependencies)
+
+    def __get_reachable(self, core: ProxyGroup) -> list[str]:
+        names = []
+        queue = [n for g in core.graphs for n in self.get_group_names(g.pattern)]
+        while len(queue) > 0:
+            name = queue.pop(0)
+            if name in names:
+                continue
+            names.append(name)
+            for g in self.groups[name].graphs:
+                queue.extend(self.get_group_names(g.pattern))
+        return names
+
+    def __check_productive(self, dependencies: dict[str, list[list[str]]]):
+        productive = set()
+        is_changed = True
+        while is_changed:
+            is_changed = False
+            for name, productions in dependencies.items():
+                if name not in productive and any(
+                    all(n in productive for n in p) for p in productions
+                ):
+                    productive.add(name)
+                    is_changed = True
+        for name in dependencies.keys():
+            if name not in productive:
+                raise ValueError(
+                    "Group '{}' can not be fully expanded. ".format(name)
+                    + "Each of its graphs depends on a recursive group."
+                )
+
+    def __check_recursion(self, dependencies: dict[str, list[list[str]]]):
+        dependency_graph = nx.DiGraph()
+        for name, productions in dependencies.items():
+            if not _is_exhaustive(self.groups[name]):
+                continue
+            for n in itertools.chain.from_iterable(productions):
+                if _is_exhaustive(self.groups[n]):
+                    dependency_graph.add_edge(name, n)
+        try:
+            cycle = nx.find_cycle(dependency_graph)
+        except nx.NetworkXNoCycle:
+            return
+        raise ValueError(
+            "Group '{}' is recursive and expands all its graphs. ".format(
+                cycle[0][0]
+            )
+            + "The number of samples is not finite. Use a different sampler "
+            + "for at least one group in the cycle {}.".format(
+                [u for u, _ in cycle]
+            )
+        )
+
+    def __get_group_name(self, pattern: str, labels: list[str]) -> str:
+        group_labels = [lbl for lbl in labels if lbl in self.groups.keys()]
+        if len(group_labels) == 0:
+            raise ValueError(
+                "Label {} in pattern '{}' does not refer to a group.".format(
+                    labels, pattern
+                )
+            )
+        if len(group_labels) > 1:
+            raise RuntimeError(
+                "Multiple group labels found on node ({}).".format(group_labels)
+            )
+        return group_labels[0]
+
+    def get_template(self, pattern: str) -> tuple:
+        """Get the compiled template of a pattern. Patterns that are not in
+        the grammar, e.g., from a sampler that creates new graphs, are
+        compiled on first use.
+
+        :param pattern: The graph pattern.
+
+        :returns: Returns a tuple with the list of node data, the list of
+            edges ``(u, v, data)`` and the list of labeled nodes ``(node,
+            group name)`` in expansion order.
+        """
+        template = self.templates.get(pattern, None)
+        if template is None:
+            g = self.parser(pattern)
+            nodes = [d for _, d in sorted(g.nodes(data=True), key=lambda x: x[0])]
+            edges = [(u, v, d) for u, v, d in g.edges(data=True)]
+            labeled = [i for i, d in enumerate(nodes) if d[IS_LABELED_KEY]]
+            group_nodes = list(zip(labeled, self.get_group_names(pattern)))
+            template = (nodes, edges, group_nodes)
+            self.templates[pattern] = template
+        return template
+
+    def get_group_names(self, pattern: str) -> list[str]:
+        """Get the group names of the labeled nodes of a pattern in
+        expansion order. The labels are read from the tokens of the pattern
+        without parsing it.
+
+        :param pattern: The graph pattern.
+
+        :returns: Returns the list of group names.
+        """
+        names = self.__group_names.get(pattern, None)
+        if names is None:
+            names = [
+                self.__get_group_name(pattern, value[1:-1].split(","))
+                for ttype, value, _ in tokenize(pattern)
+                if ttype == "NODE_LABEL"
+            ]
+            self.__group_names[pattern] = names
+        return names
+
+    def __get_pattern_size(self, pattern: str, sizes: dict, heavy_only: bool):
+        nodes, _, group_nodes = self.get_template(pattern)
+        group_idx = set(i for i, _ in group_nodes)
+        size = sum(
+            1
+            for i, d in enumerate(nodes)
+            if i not in group_idx and (not heavy_only or d[SYMBOL_KEY] != "H")
+        )
+        return size + sum(sizes.get(name, math.inf) for _, name in group_nodes)
+
+    def get_min_size(self, name: str, heavy_only: bool = False) -> int:
+        """Get the minimal number of atoms a group expands to. The minimum
+        is taken over all graphs of the group, i.e., it is a lower bound if
+        the samplers only return graphs of their group.
+
+        :param name: The group name.
+        :param heavy_only: (optional) If set to true hydrogen atoms are not
+            counted. (Default: False)
+
+        :returns: Returns the minimal number of atoms.
+        """
+        sizes = self.__min_sizes.get(heavy_only, None)
+        if sizes is None:
+            sizes = {}
+            is_changed = True
+            while is_changed:
+                is_changed = False
+                for n, group in self.groups.items():
+                    size = min(
+                        (
+                            self.__get_pattern_size(g.pattern, sizes, heavy_only)
+                            for g in group.graphs
+                        ),
+                        default=math.inf,
+                    )
+                    if size < sizes.get(n, math.inf):
+                        sizes[n] = size
+                        is_changed = True
+            self.__min_sizes[heavy_only] = sizes
+        return sizes[name]
+
+
 def _is_group_node(g: nx.Graph, idx: int, groups: dict[str, ProxyGroup]) -> bool:
     d = g.nodes[idx]
     return d[IS_LABELED_KEY] and any([lbl in groups.keys() for lbl in d[LABELS_KEY]])
@@ -280,22 +627,386 @@ def replace_node(graph, node, replacement_graph: ProxyGraph, parser: Parser):
     return graph
 
 
-def replace_next_node(graph, groups: dict[str, ProxyGroup], parser: Parser):
-    """Replace the next labeled node in graph with the respective group.
+class GraphBuilder:
+    """Array-backed graph for the repeated replacement of labeled nodes.
+    Nodes and edges are kept in flat lists and a replaced node is only
+    marked as removed, i.e., a replacement splices the subgraph in with
+    index offsets in the size of the subgraph instead of rebuilding the
+    whole graph. Replacements can be undone in reverse order, which allows
+    depth-first expansion without copying. The networkx graph is built once
+    by :py:meth:`~fgutils.proxy.GraphBuilder.to_graph`. The result is the
+    same as for repeated calls of :py:func:`~fgutils.proxy.replace_node`.
+    Node ids of the builder are positions in the node list, i.e., they are
+    not changed by replacements.
+
+    :param pattern: The pattern of the initial graph.
+    :param parser: The parser to convert patterns into structures.
+    :param grammar: (optional) The compiled grammar of the groups. If set,
+        the templates are taken from the grammar and the group names of
+        labeled nodes are known without scanning the labels, i.e., the
+        ``groups`` arguments are not required. (Default: None)
+    """
 
-    :param graph: The graph where a node should be replace by a subgraph.
-    :param groups: A mapping dictionary of groups to replace the labeled nodes
-        in the parent with. The dictionary keys must be the group name.
-    :param parser: The parser to use to convert the pattern into structure.
+    def __init__(
+        self, pattern: str, parser: Parser, grammar: ProxyGrammar | None = None
+    ):
+        self.parser = parser
+        self.grammar = grammar
+        self.__templates = {}
+        self.__nodes = []
+        self.__node_alive = []
+        self.__adj = []
+        self.__edges = []
+        self.__edge_alive = []
+        self.__labeled = []
+        self.__group_names = []
+        self.__append(self.__get_template(pattern))
+
+    def __get_template(self, pattern: str):
+        if self.grammar is not None:
+            return self.grammar.get_template(pattern)
+        template = self.__templates.get(pattern, None)
+        if template is None:
+            g = self.parser(pattern)
+            nodes = [d for _, d in sorted(g.nodes(data=True), key=lambda x: x[0])]
+            edges = [(u, v, d) for u, v, d in g.edges(data=True)]
+            labeled = [(i, None) for i, d in enumerate(nodes) if d[IS_LABELED_KEY]]
+            template = (nodes, edges, labeled)
+            self.__templates[pattern] = template
+        return template
+
+    def __add_edge(self, u: int, v: int, data: dict):
+        e = len(self.__edges)
+        self.__edges.append((u, v, data))
+        self.__edge_alive.append(True)
+        self.__adj[u].append(e)
+        if u != v:
+            self.__adj[v].append(e)
+
+    def __append(self, template) -> int:
+        nodes, edges, labeled = template
+        offset = len(self.__nodes)
+        for d in nodes:
+            self.__nodes.append(d)
+            self.__node_alive.append(True)
+            self.__adj.append([])
+            self.__group_names.append(None)
+        for i, name in labeled:
+            self.__labeled.append(offset + i)
+            self.__group_names[offset + i] = name
+        for u, v, d in edges:
+            self.__add_edge(offset + u, offset + v, d)
+        return offset
+
+    def get_labels(self, node: int) -> list[str]:
+        """Get the labels of a node."""
+        return self.__nodes[node][LABELS_KEY]
+
+    def get_node(self, node: int) -> dict:
+        """Get the data of a node. The data must not be changed because it
+        is shared with the template of the node."""
+        return self.__nodes[node]
+
+    def get_neighbors(self, node: int) -> list[tuple[int, dict]]:
+        """Get the neighbors of a node.
+
+        :param node: The node id.
+
+        :returns: Returns a list of tuples with the neighbor id and the edge
+            data. A self-loop is listed once with the node as neighbor.
+        """
+        return [
+            (self.__get_neighbor(e, node), self.__edges[e][2])
+            for e in self.__adj[node]
+            if self.__edge_alive[e]
+        ]
+
+    def is_group_node(
+        self, node: int, groups: dict[str, ProxyGroup] | None = None
+    ) -> bool:
+        """Check if a node is replaced by a group.
+
+        :param node: The node id.
+        :param groups: (optional) The mapping of group names to groups. Only
+            required if the builder has no grammar. (Default: None)
+
+        :returns: Returns true if the node is a group node.
+        """
+        if self.__group_names[node] is not None:
+            return True
+        return (
+            groups is not None
+            and self.__nodes[node][IS_LABELED_KEY]
+            and any(lbl in groups.keys() for lbl in self.__nodes[node][LABELS_KEY])
+        )
 
-    :returns: Returns a list of new graphs where the first labeled node is
-        replaced. None is returned if no replaceable labeled node is left.
+    def get_added_nodes(self, token: tuple | None = None) -> list[int]:
+        """Get the nodes that were added by a replacement.
+
+        :param token: (optional) The token returned by the replacement. If
+            not set, all nodes that are not replaced are returned.
+            (Default: None)
+
+        :returns: Returns the list of node ids.
+        """
+        start = 0 if token is None else token[1]
+        return [n for n in range(start, len(self.__nodes)) if self.__node_alive[n]]
+
+    def get_group_name(
+        self, node: int, groups: dict[str, ProxyGroup] | None = None
+    ) -> str:
+        """Get the name of the group that replaces a labeled node.
+
+        :param node: The id of the labeled node.
+        :param groups: (optional) The mapping of group names to groups. Only
+            required if the builder has no grammar. (Default: None)
+
+        :returns: Returns the group name.
+        """
+        name = self.__group_names[node]
+        if name is None:
+            name = _get_group_name(self.__nodes[node][LABELS_KEY], groups)
+        return name
+
+    def get_group_nodes(self, groups: dict[str, ProxyGroup] | None = None):
+        """Get the labeled nodes that are replaced by a group in the order
+        in which they are replaced.
+
+        :param groups: (optional) The mapping of group names to groups. Only
+            required if the builder has no grammar. (Default: None)
+
+        :returns: Yields the node ids.
+        """
+        for n in self.__labeled:
+            if self.__group_names[n] is not None or any(
+                lbl in groups.keys() for lbl in self.__nodes[n][LABELS_KEY]
+            ):
+                yield n
+
+    def get_next_group_node(
+        self, groups: dict[str, ProxyGroup] | None = None
+    ) -> int | None:
+        """Get the next labeled node that is replaced by a group.
+
+        :param groups: (optional) The mapping of group names to groups. Only
+            required if the builder has no grammar. (Default: None)
+
+        :returns: Returns the node id or None if no group node is left.
+        """
+        return next(self.get_group_nodes(groups), None)
+
+    def replace_node(self, node: int, replacement_graph: ProxyGraph) -> tuple:
+        """Replace a node by a subgraph. The edges of the node are connected
+        to the anchors of the subgraph like in
+        :py:func:`~fgutils.proxy.replace_node`.
+
+        :param node: The id of the node to replace.
+        :param replacement_graph: The subgraph that is inserted instead of
+            the node.
+
+        :returns: Returns a token to undo the replacement.
+        """
+        node_cnt = len(self.__nodes)
+        edge_cnt = len(self.__edges)
+        label_idx = None
+        if node in self.__labeled:
+            label_idx = self.__labeled.index(node)
+            del self.__labeled[label_idx]
+        label_cnt = len(self.__labeled)
+        node_edges = sorted(
+            (e for e in self.__adj[node] if self.__edge_alive[e]),
+            key=lambda e: (self.__get_neighbor(e, node), e),
+        )
+        offset = self.__append(self.__get_template(replacement_graph.pattern))
+        if len(self.__nodes) > offset:
+            anchors = replacement_graph.anchor
+            for i, e in enumerate(node_edges):
+                v = self.__get_neighbor(e, node)
+                if v != node:
+                    anchor = anchors[min(i, len(anchors) - 1)]
+                    self.__add_edge(offset + anchor, v, self.__edges[e][2])
+        for e in node_edges:
+            self.__edge_alive[e] = False
+        self.__node_alive[node] = False
+        return (node, node_cnt, edge_cnt, label_idx, label_cnt, node_edges)
+
+    def undo(self, token: tuple):
+        """Undo the last replacement.
+
+        :param token: The token returned by the replacement.
+        """
+        node, node_cnt, edge_cnt, label_idx, label_cnt, node_edges = token
+        for u, v, _ in self.__edges[edge_cnt:]:
+            for n in {u, v}:
+                if n < node_cnt:
+                    self.__adj[n].pop()
+        del self.__edges[edge_cnt:]
+        del self.__edge_alive[edge_cnt:]
+        del self.__nodes[node_cnt:]
+        del self.__node_alive[node_cnt:]
+        del self.__adj[node_cnt:]
+        del self.__group_names[node_cnt:]
+        del self.__labeled[label_cnt:]
+        if label_idx is not None:
+            self.__labeled.insert(label_idx, node)
+        for e in node_edges:
+            self.__edge_alive[e] = True
+        self.__node_alive[node] = True
+
+    def __get_neighbor(self, e: int, node: int) -> int:
+        u, v, _ = self.__edges[e]
+        return v if u == node else u
+
+    def to_graph(self, multigraph: bool | None = None) -> nx.Graph:
+        """Convert the builder into a networkx graph. The remaining nodes
+        are numbered consecutively in the order in which they were added.
+
+        :param multigraph: (optional) Flag to specify if the result is a
+            networkx.MultiGraph. If not set the parser setting is used.
+            (Default: None)
+
+        :returns: Returns the graph.
+        """
+        if multigraph is None:
+            multigraph = self.parser.use_multigraph
+        graph = nx.MultiGraph() if multigraph else nx.Graph()
+        ids = {}
+        for n, d in enumerate(self.__nodes):
+            if self.__node_alive[n]:
+                ids[n] = len(ids)
+                graph.add_node(ids[n], **{**d, LABELS_KEY: list(d[LABELS_KEY])})
+        edges = []
+        for e, (u, v, _) in enumerate(self.__edges):
+            if self.__edge_alive[e]:
+                u, v = ids[u], ids[v]
+                edges.append((min(u, v), max(u, v), e))
+        for u, v, e in sorted(edges):
+            graph.add_edge(u, v, **self.__edges[e][2])
+        return graph
+
+
+class ProxyConstraint:
+    """Base class for predicates on partial proxy graphs. A constraint is
+    checked during the depth-first expansion (see
+    :py:class:`~fgutils.proxy.Proxy`) each time a labeled node is replaced.
+    If the check fails, the branch is pruned, i.e., none of the samples
+    that would follow from the partial graph are built. A constraint must
+    therefore only fail if no completion of the partial graph can be
+    valid.
+
+    The partial graph is given as :py:class:`~fgutils.proxy.GraphBuilder`
+    with a compiled grammar. The edges of an atom that is not a group node
+    do not change in later replacements. Only if a neighboring group can
+    expand to an empty graph, the edge is removed. This makes checks on
+    the added atoms sufficient for many constraints.
     """
-    result_graphs = []
-    anchor = _get_next_group_node(graph, groups)
-    if anchor is None:
-        return None
-    anchor_labels = graph.nodes[anchor][LABELS_KEY]
+
+    def check(self, builder: GraphBuilder, nodes: list[int]) -> bool:
+        """Check a partial graph.
+
+        :param builder: The partial graph.
+        :param nodes: The nodes added by the last replacement. For the core
+            graph these are all nodes.
+
+        :returns: Returns false if the partial graph can never become
+            valid.
+        """
+        return True
+
+    def __call__(self, builder: GraphBuilder, nodes: list[int]) -> bool:
+        return self.check(builder, nodes)
+
+
+class MaxAtomCount(ProxyConstraint):
+    """Constraint on the number of atoms in a sample. The number of atoms
+    of a partial graph is bounded from below by its atoms plus the minimal
+    number of atoms of the remaining groups (see
+    :py:meth:`~fgutils.proxy.ProxyGrammar.get_min_size`).
+
+    :param max_count: The maximal number of atoms.
+    :param heavy_only: (optional) If set to true hydrogen atoms are not
+        counted. (Default: True)
+    """
+
+    def __init__(self, max_count: int, heavy_only: bool = True):
+        self.max_count = max_count
+        self.heavy_only = heavy_only
+
+    def check(self, builder: GraphBuilder, nodes: list[int]) -> bool:
+        cnt = 0
+        for n in builder.get_added_nodes():
+            if builder.is_group_node(n):
+                cnt += builder.grammar.get_min_size(
+                    builder.get_group_name(n), heavy_only=self.heavy_only
+                )
+            elif not self.heavy_only or builder.get_node(n)[SYMBOL_KEY] != "H":
+                cnt += 1
+            if cnt > self.max_count:
+                return False
+        return True
+
+
+class ValenceBound(ProxyConstraint):
+    """Constraint on the valence of the atoms in a sample. Like in
+    :py:func:`~fgutils.chem.valence.check_valence` the valence of an atom
+    must not exceed an octet (duplet for hydrogen). For ITS graphs the
+    valence is checked for the reactant and the product. The valence of an
+    atom is checked as soon as it is added to the partial graph. Bonds to
+    groups that can expand to an empty graph are not counted. Symbols that
+    are not elements are ignored.
+    """
+
+    def __init__(self):
+        self.__valence_electrons = {}
+
+    def __get_valence_electrons(self, symbol: str) -> int | None:
+        if symbol not in self.__valence_electrons:
+            try:
+                num = get_num_valence_electrons(symbol)
+            except KeyError:
+                num = None
+            self.__valence_electrons[symbol] = num
+        return self.__valence_electrons[symbol]
+
+    def check(self, builder: GraphBuilder, nodes: list[int]) -> bool:
+        for n in nodes:
+            if builder.is_group_node(n):
+                continue
+            symbol = builder.get_node(n)[SYMBOL_KEY]
+            valence = self.__get_valence_electrons(symbol)
+            if valence is None:
+                continue
+            g_valence, h_valence = valence, valence
+            for v, d in builder.get_neighbors(n):
+                if (
+                    builder.is_group_node(v)
+                    and builder.grammar.get_min_size(builder.get_group_name(v)) == 0
+                ):
+                    continue
+                bond = d[BOND_KEY]
+                g_bond, h_bond = bond if isinstance(bond, tuple) else (bond, bond)
+                if v == n:
+                    g_bond, h_bond = int(2 * g_bond), int(2 * h_bond)
+                g_valence += g_bond
+                h_valence += h_bond
+            exp_valence = 2 if symbol == "H" else 8
+            if not _is_valid_valence(g_valence, exp_valence) or not _is_valid_valence(
+                h_valence, exp_valence
+            ):
+                return False
+        return True
+
+
+def _check_constraints(
+    builder: GraphBuilder, constraints: list[ProxyConstraint] | None, token=None
+) -> bool:
+    if constraints is None or len(constraints) == 0:
+        return True
+    nodes = builder.get_added_nodes(token)
+    return all(c(builder, nodes) for c in constraints)
+
+
+def _get_group_name(anchor_labels: list[str], groups: dict[str, ProxyGroup]) -> str:
     group_labels = []
     for anchor_label in anchor_labels:
         if anchor_label in groups.keys():
@@ -311,9 +1022,36 @@ def replace_next_node(graph, groups: dict[str, ProxyGroup], parser: Parser):
                 group_name, groups[group_name].name
             )
         )
+    return group_name
+
+
+def _get_next_replacement(graph, groups: dict[str, ProxyGroup]):
+    anchor = _get_next_group_node(graph, groups)
+    if anchor is None:
+        return None
+    group_name = _get_group_name(graph.nodes[anchor][LABELS_KEY], groups)
     sub_graphs = groups[group_name].sample_graphs()
     if sub_graphs is None:
         raise StopIteration()
+    return anchor, sub_graphs
+
+
+def replace_next_node(graph, groups: dict[str, ProxyGroup], parser: Parser):
+    """Replace the next labeled node in graph with the respective group.
+
+    :param graph: The graph where a node should be replace by a subgraph.
+    :param groups: A mapping dictionary of groups to replace the labeled nodes
+        in the parent with. The dictionary keys must be the group name.
+    :param parser: The parser to use to convert the pattern into structure.
+
+    :returns: Returns a list of new graphs where the first labeled node is
+        replaced. None is returned if no replaceable labeled node is left.
+    """
+    result_graphs = []
+    replacement = _get_next_replacement(graph, groups)
+    if replacement is None:
+        return None
+    anchor, sub_graphs = replacement
     for sub_graph in sub_graphs:
         _graph = graph.copy()
         _graph = replace_node(_graph, anchor, sub_graph, parser)
@@ -321,6 +1059,64 @@ def replace_next_node(graph, groups: dict[str, ProxyGroup], parser: Parser):
     return result_graphs
 
 
+def _iter_graphs(
+    builder: GraphBuilder,
+    groups: dict[str, ProxyGroup],
+    multigraph=None,
+    constraints: list[ProxyConstraint] | None = None,
+):
+    anchor = builder.get_next_group_node(groups)
+    if anchor is None:
+        yield builder.to_graph(multigraph=multigraph)
+        return
+    group_name = builder.get_group_name(anchor, groups)
+    sub_graphs = groups[group_name].sample_graphs()
+    if sub_graphs is None:
+        yield None
+        return
+    for sub_graph in sub_graphs:
+        token = builder.replace_node(anchor, sub_graph)
+        if _check_constraints(builder, constraints, token):
+            for result in _iter_graphs(
+                builder, groups, multigraph=multigraph, constraints=constraints
+            ):
+                yield result
+                if result is None:
+                    return
+        builder.undo(token)
+
+
+def iter_graphs(
+    core: ProxyGraph,
+    groups: dict[str, ProxyGroup],
+    parser: Parser,
+):
+    """Replace labeled nodes in the core graph with groups. This is the
+    depth-first and lazy version of :py:func:`~fgutils.proxy.build_graphs`.
+    A graph is yielded as soon as all its labeled nodes are replaced and
+    only the partial graphs on the current expansion path are kept in
+    memory. The partial graphs are kept in a
+    :py:class:`~fgutils.proxy.GraphBuilder`. Labeled nodes are replaced in
+    the order in which they are added to the graph. If a group sampler has
+    nothing more to sample, the generator stops. In contrast to
+    :py:func:`~fgutils.proxy.build_graphs`, which produces no graph in this
+    case, the graphs that were completed before the sampler ran out are
+    already yielded.
+
+    :param core: The parent graph with labeled nodes.
+    :param groups: A list of groups to replace the labeled nodes in the core
+        graph with. The dictionary keys must be the group names.
+    :param parser: The parser that is used to convert graph patterns into
+        graphs.
+
+    :returns: Yields the graphs with replaced nodes.
+    """
+    for graph in _iter_graphs(GraphBuilder(core.pattern, parser), groups):
+        if graph is None:
+            return
+        yield graph
+
+
 def build_graphs(
     core: ProxyGraph,
     groups: dict[str, ProxyGroup],
@@ -352,10 +1148,85 @@ def build_graphs(
     return result_set
 
 
+def _count_pattern(
+    pattern: str, grammar: ProxyGrammar, counts: dict, visiting: set
+) -> int:
+    cnt = 1
+    for name in grammar.get_group_names(pattern):
+        cnt *= _count_group(name, grammar, counts, visiting)
+    return cnt
+
+
+def _count_group(name: str, grammar: ProxyGrammar, counts: dict, visiting: set) -> int:
+    if name in counts:
+        return counts[name]
+    if name in visiting:
+        raise ValueError(
+            "Group '{}' is recursive. The number of samples is not finite.".format(
+                name
+            )
+        )
+    group = grammar.groups[name]
+    if not _is_exhaustive(group):
+        raise ValueError(
+            "Samples can only be counted if all groups use the default "
+            + "non-unique GraphSampler. Group '{}' uses a different sampler.".format(
+                name
+            )
+        )
+    visiting.add(name)
+    cnt = sum(
+        _count_pattern(g.pattern, grammar, counts, visiting) for g in group.graphs
+    )
+    visiting.remove(name)
+    counts[name] = cnt
+    return cnt
+
+
+_shard_worker_state = {}
+
+
+def _init_shard_worker(proxy):
+    _shard_worker_state["proxy"] = proxy
+
+
+def _shard_worker(unit):
+    core_idx, choices = unit
+    proxy = _shard_worker_state["proxy"]
+    return [
+        (None if proxy.dedupe is None else graph_key(graph, proxy.dedupe), graph)
+        for graph in proxy._iter_unit(core_idx, choices)
+    ]
+
+
+def _is_its(graph: nx.Graph) -> bool:
+    return any(isinstance(b, tuple) for _, _, b in graph.edges(data=BOND_KEY))
+
+
+def _to_its_bonds(graph: nx.Graph) -> nx.Graph:
+    for u, v, b in graph.edges(data=BOND_KEY):
+        if not isinstance(b, tuple):
+            graph.edges[u, v][BOND_KEY] = (b, b)
+    return graph
+
+
+def _export_worker(graphs: list[nx.Graph]) -> list[str]:
+    smiles = []
+    for graph in graphs:
+        if _is_its(graph):
+            g, h = split_its(graph)
+            smiles.append("{}>>{}".format(graph_to_smiles(g), graph_to_smiles(h)))
+        else:
+            smiles.append(graph_to_smiles(graph))
+    return smiles
+
+
 class Proxy:
     """Proxy is a generator class. It extends a specific core graph by a set
-    of subgraphs (groups). This class implements the iterator interface so it
-    can be used in a for loop to generate samples::
+    of subgraphs (groups). Samples are generated depth-first (see
+    :py:func:`~fgutils.proxy.iter_graphs`), i.e., the first sample is
+    available immediately. This class implements the iterator interface so
+    it can be used in a for loop to generate samples::
 
         >>> proxy = Proxy("C{g}", ProxyGroup("g", ["C", "O", "N"]))
         >>> for graph in proxy:
@@ -364,12 +1235,34 @@ class Proxy:
         ['C', 'O']
         ['C', 'N']
 
+    The configuration is validated when the proxy is created (see
+    :py:class:`~fgutils.proxy.ProxyGrammar`). A ValueError is raised if a
+    label in a pattern that can be reached from the core does not refer to
+    a group, e.g., ``Proxy("C{x}", ProxyGroup("g", "C"))``. Such labels are
+    not kept as plain labeled nodes. Patterns are only parsed when they are
+    used, i.e., syntax errors are raised during generation.
+
     :param core: A pattern string or ProxyGroup representing the core graph.
         For example a specific functional group or a reaction center.
     :param groups: A list of groups to expand the core graph with.
     :param enable_aam: Flag to specify if the 'aam' label is set in the result
         graph. (Default = True)
     :param parser: (optional) The parser to convert patterns into structures.
+    :param dedupe: (optional) If set, isomorphic samples are only returned
+        once during iteration. Use ``True`` or ``"wl"`` to identify samples
+        by their WL hash or ``"exact"`` for an exact canonical key (see
+        :py:func:`~fgutils.dedupe.graph_key`). (Default = False)
+    :param seen: (optional) The set of keys of already returned samples. Use
+        a :py:class:`~fgutils.dedupe.BloomFilter` or a
+        :py:class:`~fgutils.dedupe.DiskSet` to bound the memory of very
+        large runs. The seen set is not pickled with the proxy. If not set,
+        an in-memory set is used. (Default = None)
+    :param constraints: (optional) A list of
+        :py:class:`~fgutils.proxy.ProxyConstraint` objects. The constraints
+        are checked on the partial graphs during expansion and branches
+        that can never satisfy a constraint are pruned, e.g.,
+        ``[ValenceBound(), MaxAtomCount(30)]``. Random access and counting
+        do not apply the constraints. (Default = None)
     """
 
     def __init__(
@@ -378,18 +1271,35 @@ class Proxy:
         groups: ProxyGroup | list[ProxyGroup] | dict[str, ProxyGroup],
         enable_aam: bool = True,
         parser: Parser | None = None,
+        dedupe: bool | str = False,
+        seen=None,
+        constraints: list[ProxyConstraint] | None = None,
     ):
         self.enable_aam = enable_aam
+        self.constraints = constraints
+        if dedupe is True:
+            dedupe = "wl"
+        if dedupe not in [False, None, "wl", "exact"]:
+            raise ValueError(
+                "Unknown dedupe method '{}'. Use 'wl' or 'exact' instead.".format(
+                    dedupe
+                )
+            )
+        self.dedupe = dedupe if dedupe else None
+        self.__seen = set() if seen is None else seen
+        self.__grammar = None
+        self.__core = None
+        self.__groups = None
+        if parser is None:
+            self.parser = Parser(use_multigraph=True)
+        else:
+            self.parser = parser
         self.core = (
             ProxyGroup("__core__", core, unique=True)
             if not isinstance(core, ProxyGroup)
             else core
         )
         self.groups = groups
-        if parser is None:
-            self.parser = Parser(use_multigraph=True)
-        else:
-            self.parser = parser
 
         self.__active_generator = self.__generate()
 
@@ -402,18 +1312,43 @@ class Proxy:
 
     @groups.setter
     def groups(self, value):
-        self.__groups = {}
+        groups = {}
         if isinstance(value, ProxyGroup):
-            self.__groups[value.name] = value
+            groups[value.name] = value
         elif isinstance(value, list):
             for group in value:
-                self.__groups[group.name] = group
+                groups[group.name] = group
         elif isinstance(value, dict) and isinstance(
             list(value.values())[0], ProxyGroup
         ):
-            self.__groups = value
+            groups = value
         else:
             raise TypeError("Invalid group type.")
+        self.__compile_grammar(self.__core, groups)
+        self.__groups = groups
+
+    @property
+    def grammar(self) -> ProxyGrammar:
+        """The compiled grammar of the core and the groups (see
+        :py:class:`~fgutils.proxy.ProxyGrammar`). The grammar is compiled
+        when the proxy is created and whenever the groups or the core are
+        set, i.e., an invalid configuration raises an error right away and
+        the proxy keeps its previous configuration."""
+        return self.__grammar
+
+    def __compile_grammar(self, core, groups):
+        if core is not None and groups is not None:
+            self.__grammar = ProxyGrammar(groups, self.parser, core=core)
+
+    @property
+    def core(self) -> ProxyGroup:
+        """The core group."""
+        return self.__core
+
+    @core.setter
+    def core(self, value):
+        self.__compile_grammar(value, self.__groups)
+        self.__core = value
 
     def __str__(self):
         s = "ReactionProxy | Core: {} Enable AAM: {}\n".format(
@@ -445,19 +1380,338 @@ class Proxy:
     def __generate(self):
         core_graphs = self.core.sample_graphs()
         while core_graphs is not None:
-            try:
-                for core_graph in core_graphs:
-                    graphs = build_graphs(core_graph, self.__groups, self.parser)
-                    for graph in graphs:
-                        if self.enable_aam:
-                            for n in graph.nodes:
-                                graph.nodes[n][AAM_KEY] = n + 1
-                        if isinstance(graph, nx.MultiGraph):
-                            graph = nx.Graph(graph)
+            for core_graph in core_graphs:
+                builder = self.__get_builder(core_graph.pattern)
+                if not _check_constraints(builder, self.constraints):
+                    continue
+                for graph in _iter_graphs(
+                    builder,
+                    self.__groups,
+                    multigraph=False,
+                    constraints=self.constraints,
+                ):
+                    if graph is None:
+                        return
+                    graph = self.__finalize(graph)
+                    if not self.__is_duplicate(graph):
                         yield graph
-                core_graphs = self.core.sample_graphs()
-            except StopIteration:
-                return
+            core_graphs = self.core.sample_graphs()
+
+    def __is_duplicate(self, graph, key=None) -> bool:
+        if self.dedupe is None:
+            return False
+        if key is None:
+            key = graph_key(graph, self.dedupe)
+        if key in self.__seen:
+            return True
+        self.__seen.add(key)
+        return False
+
+    def __finalize(self, graph):
+        if self.enable_aam:
+            for n in graph.nodes:
+                graph.nodes[n][AAM_KEY] = n + 1
+        if isinstance(graph, nx.MultiGraph):
+            graph = nx.Graph(graph)
+        return graph
+
+    def __get_counts(self) -> tuple[list[int], dict[str, int]]:
+        if type(self.core.sampler) is not GraphSampler or not self.core.sampler.unique:
+            raise ValueError(
+                "Samples can only be counted if the core group uses a unique "
+                + "GraphSampler."
+            )
+        counts = {}
+        core_counts = [
+            _count_pattern(g.pattern, self.grammar, counts, set())
+            for g in self.core.graphs
+        ]
+        return core_counts, counts
+
+    def __unrank(self, index: int, core_counts: list[int], counts: dict[str, int]):
+        total = sum(core_counts)
+        if index < 0:
+            index += total
+        if index < 0 or index >= total:
+            raise IndexError("Proxy index {} out of range.".format(index))
+        core_graph = self.core.graphs[-1]
+        for core_graph, cnt in zip(self.core.graphs, core_counts):
+            if index < cnt:
+                break
+            index -= cnt
+        builder = self.__get_builder(core_graph.pattern)
+        anchor = builder.get_next_group_node()
+        while anchor is not None:
+            group = self.__get_group(builder, anchor)
+            rest_cnt = 1
+            for n in builder.get_group_nodes():
+                if n != anchor:
+                    rest_cnt *= counts[builder.get_group_name(n)]
+            sub_graph = group.graphs[-1]
+            for sub_graph in group.graphs:
+                cnt = _count_pattern(sub_graph.pattern, self.grammar, counts, set())
+                if index < cnt * rest_cnt:
+                    break
+                index -= cnt * rest_cnt
+            builder.replace_node(anchor, sub_graph)
+            anchor = builder.get_next_group_node()
+        return self.__finalize(builder.to_graph(multigraph=False))
+
+    def __check_random_access(self):
+        if self.constraints is not None and len(self.constraints) > 0:
+            raise ValueError(
+                "Random access is not supported for proxies with constraints."
+            )
+
+    def __getitem__(self, index: int):
+        """Get the sample at a position in the iteration order without
+        generating the samples before it. The labeled node choices are
+        decoded from the index by mixed-radix unranking with the group
+        counts from :py:meth:`~fgutils.proxy.Proxy.count`. Random access
+        has the same requirements on the samplers as ``count()`` and does
+        not change the state of the proxy iteration.
+
+        :param index: The index of the sample. Negative indices count from
+            the end.
+
+        :returns: Returns the generated graph.
+        """
+        self.__check_random_access()
+        core_counts, counts = self.__get_counts()
+        return self.__unrank(index, core_counts, counts)
+
+    def sample(self, k: int, seed=None) -> list:
+        """Draw k distinct samples uniformly at random from all samples of
+        the proxy. The samples are decoded by index (see
+        :py:meth:`~fgutils.proxy.Proxy.__getitem__`), i.e., the samples
+        before a drawn index are never generated. With the same seed the
+        same samples are drawn, e.g., for reproducible train/test splits.
+
+        :param k: The number of samples.
+        :param seed: (optional) The seed for the random number generator.
+            (Default: None)
+
+        :returns: Returns the list of sampled graphs.
+        """
+        self.__check_random_access()
+        core_counts, counts = self.__get_counts()
+        indices = random.Random(seed).sample(range(sum(core_counts)), k)
+        return [self.__unrank(i, core_counts, counts) for i in indices]
+
+    def __get_builder(self, pattern: str) -> GraphBuilder:
+        return GraphBuilder(pattern, self.parser, grammar=self.grammar)
+
+    def __get_group(self, builder: GraphBuilder, node: int) -> ProxyGroup:
+        return self.__groups[builder.get_group_name(node)]
+
+    def __replay(self, core_idx: int, choices: tuple[int, ...]) -> GraphBuilder:
+        builder = self.__get_builder(self.core.graphs[core_idx].pattern)
+        for graph_idx in choices:
+            anchor = builder.get_next_group_node()
+            group = self.__get_group(builder, anchor)
+            builder.replace_node(anchor, group.graphs[graph_idx])
+        return builder
+
+    def __get_units(self, min_units: int) -> list[tuple[int, tuple[int, ...]]]:
+        self.__get_counts()
+        units = [(i, ()) for i in range(len(self.core.graphs))]
+        while len(units) < min_units:
+            is_expanded = False
+            _units = []
+            for core_idx, choices in units:
+                builder = self.__replay(core_idx, choices)
+                anchor = builder.get_next_group_node()
+                if anchor is None:
+                    _units.append((core_idx, choices))
+                    continue
+                group = self.__get_group(builder, anchor)
+                _units.extend(
+                    (core_idx, choices + (j,)) for j in range(len(group.graphs))
+                )
+                is_expanded = True
+            units = _units
+            if not is_expanded:
+                break
+        return units
+
+    def _iter_unit(self, core_idx: int, choices: tuple[int, ...]):
+        builder = self.__replay(core_idx, choices)
+        if not _check_constraints(builder, self.constraints):
+            return
+        for graph in _iter_graphs(
+            builder, self.__groups, multigraph=False, constraints=self.constraints
+        ):
+            yield self.__finalize(graph)
+
+    def iter_shard(self, shard_id: int, num_shards: int):
+        """Generate one partition of the samples. The sample space is split
+        into units by core graph and by the graphs chosen for the first
+        labeled nodes. The choices are refined level by level until there
+        are at least as many units as shards (or no labeled node is left).
+        The units are assigned round-robin to the shards, i.e., the shards
+        are disjoint and together contain all samples. Within a shard the
+        samples are generated in iteration order. Sharding has the same
+        requirements on the samplers as :py:meth:`~fgutils.proxy.Proxy.count`
+        and does not change the state of the proxy iteration. Samples are
+        not deduplicated within a shard.
+
+        :param shard_id: The index of the shard in ``[0, num_shards)``.
+        :param num_shards: The number of shards.
+
+        :returns: Yields the graphs of the shard.
+        """
+        if num_shards < 1 or shard_id < 0 or shard_id >= num_shards:
+            raise ValueError(
+                "Invalid shard {} for {} shards.".format(shard_id, num_shards)
+            )
+        units = self.__get_units(num_shards)
+        for core_idx, choices in units[shard_id::num_shards]:
+            yield from self._iter_unit(core_idx, choices)
+
+    def iter_parallel(
+        self, n_jobs: int | None = None, units_per_job: int = 16, chunksize: int = 1
+    ):
+        """Generate all samples in a process pool. The sample space is split
+        into sharding units (see :py:meth:`~fgutils.proxy.Proxy.iter_shard`)
+        once in the calling process and each worker gets the core graph and
+        group choices of a unit. The results are merged in unit order, i.e.,
+        the samples are returned in the same order as in sequential
+        iteration. If the proxy deduplicates
+        samples, the keys are computed by the workers and duplicates are
+        removed while merging. The proxy is sent to the workers and must be
+        picklable, e.g., custom samplers must be defined at module level.
+
+        :param n_jobs: (optional) The number of processes. Use -1 for all
+            CPUs. (Default: None)
+        :param units_per_job: (optional) The minimal number of units per
+            process. More units balance the load better. (Default: 16)
+        :param chunksize: (optional) The number of units sent to a worker at
+            once. (Default: 1)
+
+        :returns: Yields the generated samples.
+        """
+        units = self.__get_units(get_num_jobs(n_jobs) * units_per_job)
+        for samples in parallel_imap(
+            _shard_worker,
+            units,
+            n_jobs=n_jobs,
+            chunksize=chunksize,
+            initializer=_init_shard_worker,
+            initargs=(self,),
+        ):
+            for key, graph in samples:
+                if not self.__is_duplicate(graph, key=key):
+                    yield graph
+
+    def count(self) -> int:
+        """Compute the total number of samples the proxy generates without
+        building any graph. The number of instantiations of a group is the
+        sum over its graphs of the product of the instantiation counts of
+        the labeled nodes in the graph pattern. Group counts are computed
+        once per group. The count is only defined if the core group uses a
+        unique :py:class:`~fgutils.proxy.GraphSampler` and all other groups
+        use the default non-unique GraphSampler. The count does not depend
+        on the number of samples that were already generated.
+
+        :returns: Returns the number of samples.
+        """
+        return sum(self.__get_counts()[0])
+
+    def __iter_chunks(self, chunk_size: int):
+        chunk = []
+        for graph in self.__active_generator:
+            chunk.append(graph)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
+    def export(
+        self,
+        path,
+        fmt="jsonl",
+        n_jobs: int | None = None,
+        chunk_size: int = 1000,
+        id_fmt="{}",
+    ) -> int:
+        """Stream the samples of the proxy into a file. The samples are
+        taken from the proxy iteration, i.e., the export continues where the
+        iteration stopped and duplicates are skipped if the proxy
+        deduplicates samples. The samples are processed in chunks. The
+        SMILES conversion runs in a process pool and only a bounded number
+        of chunks is in memory at once. The following formats are
+        supported:
+
+        - ``"jsonl"``: One JSON object per line with the keys ``"index"``
+          and ``"reaction"`` (for ITS graphs) or ``"smiles"``.
+        - ``"csv"``: A CSV file with the same columns.
+        - ``"binary"``: A :py:class:`~fgutils.store.GraphStore` file with
+          the sample ids as keys. Reactions are stored as ITS graphs with
+          a ``(g_bond, h_bond)`` tuple on every edge.
+
+        Example::
+
+            >>> DielsAlderProxy().export("DA.jsonl", fmt="jsonl", n_jobs=-1)
+            10470
+
+        :param path: The output file path.
+        :param fmt: (optional) The output format. One of ``"jsonl"``,
+            ``"csv"`` or ``"binary"``. (Default: "jsonl")
+        :param n_jobs: (optional) The number of processes for the SMILES
+            conversion. Use -1 for all CPUs. (Default: None)
+        :param chunk_size: (optional) The number of samples per chunk.
+            (Default: 1000)
+        :param id_fmt: (optional) The format string for the sample ids. The
+            running sample index is passed to the format. (Default: "{}")
+
+        :returns: Returns the number of exported samples.
+        """
+        if fmt not in ["jsonl", "csv", "binary"]:
+            raise ValueError(
+                "Unknown export format '{}'. Use 'jsonl', 'csv' or 'binary' "
+                "instead.".format(fmt)
+            )
+        cnt = 0
+        if fmt == "binary":
+            with GraphStoreWriter(path) as writer:
+                for chunk in self.__iter_chunks(chunk_size):
+                    for graph in chunk:
+                        if _is_its(graph):
+                            graph = _to_its_bonds(graph)
+                        writer.add(graph, key=id_fmt.format(cnt))
+                        cnt += 1
+            return cnt
+        with open(path, "w", newline="") as f:
+            csv_writer = csv.writer(f) if fmt == "csv" else None
+            chunks = self.__iter_chunks(chunk_size)
+            first_chunk = next(chunks, None)
+            if first_chunk is None:
+                if csv_writer is not None:
+                    csv_writer.writerow(["index", "smiles"])
+                return 0
+            column = "reaction" if _is_its(first_chunk[0]) else "smiles"
+            if csv_writer is not None:
+                csv_writer.writerow(["index", column])
+            for smiles in parallel_imap(
+                _export_worker,
+                itertools.chain([first_chunk], chunks),
+                n_jobs=n_jobs,
+                max_pending=4 * get_num_jobs(n_jobs),
+            ):
+                lines = []
+                for smi in smiles:
+                    idx = id_fmt.format(cnt)
+                    if csv_writer is not None:
+                        lines.append([idx, smi])
+                    else:
+                        lines.append(json.dumps({"index": idx, column: smi}) + "\n")
+                    cnt += 1
+                if csv_writer is not None:
+                    csv_writer.writerows(lines)
+                else:
+                    f.writelines(lines)
+        return cnt
 
     def get_next(self):
         """Get the next sample.
@@ -472,6 +1726,17 @@ class Proxy:
     def __next__(self):
         return self.get_next()
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_Proxy__active_generator"]
+        del state["_Proxy__seen"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__seen = set()
+        self.__active_generator = self.__generate()
+
 
 class ReactionProxy(Proxy):
     """
@@ -483,6 +1748,13 @@ class ReactionProxy(Proxy):
     :param enable_aam: Flag to specify if the 'aam' label is set in the result
         graph. (Default = True)
     :param parser: (optional) The parser to convert patterns into structures.
+    :param dedupe: (optional) If set, isomorphic reactions (ITS graphs) are
+        only returned once (see :py:class:`~fgutils.proxy.Proxy`).
+        (Default = False)
+    :param seen: (optional) The set of keys of already returned reactions.
+        (Default = None)
+    :param constraints: (optional) A list of constraints to prune the
+        expansion (see :py:class:`~fgutils.proxy.Proxy`). (Default = None)
     """
 
     def __init__(
@@ -491,8 +1763,19 @@ class ReactionProxy(Proxy):
         groups: ProxyGroup | list[ProxyGroup] | dict[str, ProxyGroup],
         enable_aam: bool = True,
         parser: Parser | None = None,
+        dedupe: bool | str = False,
+        seen=None,
+        constraints: list[ProxyConstraint] | None = None,
     ):
-        super().__init__(core, groups, enable_aam, parser)
+        super().__init__(
+            core,
+            groups,
+            enable_aam,
+            parser,
+            dedupe=dedupe,
+            seen=seen,
+            constraints=constraints,
+        )
 
     def get_next(self):
         """
@@ -504,6 +1787,61 @@ class ReactionProxy(Proxy):
         """
         return split_its(super().get_next())
 
+    def __getitem__(self, index: int):
+        """Get the reaction sample at a position in the iteration order (see
+        :py:meth:`~fgutils.proxy.Proxy.__getitem__`).
+
+        :param index: The index of the sample.
+
+        :returns: A tuple of two graphs (G, H) representing the reaction G
+            \u2192 H.
+        """
+        return split_its(super().__getitem__(index))
+
+    def sample(self, k: int, seed=None) -> list:
+        """Draw k distinct reaction samples uniformly at random (see
+        :py:meth:`~fgutils.proxy.Proxy.sample`).
+
+        :param k: The number of samples.
+        :param seed: (optional) The seed for the random number generator.
+            (Default: None)
+
+        :returns: Returns a list of reaction tuples (G, H).
+        """
+        return [split_its(g) for g in super().sample(k, seed=seed)]
+
+    def iter_shard(self, shard_id: int, num_shards: int):
+        """Generate one partition of the reaction samples (see
+        :py:meth:`~fgutils.proxy.Proxy.iter_shard`).
+
+        :param shard_id: The index of the shard in ``[0, num_shards)``.
+        :param num_shards: The number of shards.
+
+        :returns: Yields the reaction tuples (G, H) of the shard.
+        """
+        for graph in super().iter_shard(shard_id, num_shards):
+            yield split_its(graph)
+
+    def iter_parallel(
+        self, n_jobs: int | None = None, units_per_job: int = 16, chunksize: int = 1
+    ):
+        """Generate all reaction samples in a process pool (see
+        :py:meth:`~fgutils.proxy.Proxy.iter_parallel`).
+
+        :param n_jobs: (optional) The number of processes. Use -1 for all
+            CPUs. (Default: None)
+        :param units_per_job: (optional) The minimal number of units per
+            process. (Default: 16)
+        :param chunksize: (optional) The number of units sent to a worker at
+            once. (Default: 1)
+
+        :returns: Yields the reaction tuples (G, H).
+        """
+        for graph in super().iter_parallel(
+            n_jobs=n_jobs, units_per_job=units_per_job, chunksize=chunksize
+        ):
+            yield split_its(graph)
+
 
 class MolProxy(Proxy):
     """
@@ -513,6 +1851,12 @@ class MolProxy(Proxy):
         For example a specific functional group.
     :param groups: A list of groups to expand the core graph with.
     :param parser: (optional) The parser to convert patterns into structures.
+    :param dedupe: (optional) If set, isomorphic molecules are only returned
+        once (see :py:class:`~fgutils.proxy.Proxy`). (Default = False)
+    :param seen: (optional) The set of keys of already returned molecules.
+        (Default = None)
+    :param constraints: (optional) A list of constraints to prune the
+        expansion (see :py:class:`~fgutils.proxy.Proxy`). (Default = None)
     """
 
     def __init__(
@@ -520,8 +1864,19 @@ class MolProxy(Proxy):
         core: str | list[str] | ProxyGroup,
         groups: ProxyGroup | list[ProxyGroup] | dict[str, ProxyGroup],
         parser: Parser | None = None,
+        dedupe: bool | str = False,
+        seen=None,
+        constraints: list[ProxyConstraint] | None = None,
     ):
-        super().__init__(core, groups, False, parser)
+        super().__init__(
+            core,
+            groups,
+            False,
+            parser,
+            dedupe=dedupe,
+            seen=seen,
+            constraints=constraints,
+        )
 
 
 def build_group_tree(
@@ -240,6 +240,13 @@ class DielsAlderProxy(ReactionProxy):
         negative samples, i.e., reactions where a Diels-Alder graph
         transformation rule is theoretically applicable but the reaction will
         never happen in reality. (Default = False)
+    :param dedupe: (optional) If set, isomorphic reactions are only returned
+        once (see :py:class:`~fgutils.proxy.Proxy`). (Default = False)
+    :param seen: (optional) The set of keys of already returned reactions.
+        (Default = None)
+    :param constraints: (optional) A list of constraints to prune the
+        expansion, e.g., ``[ValenceBound()]`` (see
+        :py:class:`~fgutils.proxy.Proxy`). (Default = None)
     """
 
     core_graphs = [
@@ -250,7 +257,14 @@ class DielsAlderProxy(ReactionProxy):
         ProxyGraph("{diene}1<0,1>{dienophile}<0,1>1", name="Inter Molecular Center"),
     ]
 
-    def __init__(self, enable_aam=True, neg_sample=False):
+    def __init__(
+        self,
+        enable_aam=True,
+        neg_sample=False,
+        dedupe=False,
+        seen=None,
+        constraints=None,
+    ):
         _groups = group_collection
         if neg_sample:
             _groups = group_collection.copy()
@@ -267,4 +281,7 @@ class DielsAlderProxy(ReactionProxy):
             core_group,
             common_groups + _groups,
             enable_aam=enable_aam,
+            dedupe=dedupe,
+            seen=seen,
+            constraints=constraints,
         )
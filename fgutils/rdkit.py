@@ -168,6 +168,76 @@ def graph_to_mol(g: nx.Graph, ignore_aam=False) -> Chem.rdchem.Mol:
     return mol
 
 
+def _add_its_bond(rw_mol, idx_map, H_cnts, side, n1, n2, bond):
+    if bond == 0:
+        return
+    if n1 not in idx_map:
+        H_cnts[n2][side] += 1
+    elif n2 not in idx_map:
+        H_cnts[n1][side] += 1
+    elif n1 == n2:
+        rw_mol.GetAtomWithIdx(idx_map[n1]).SetFormalCharge(int(-2 * bond))
+    else:
+        rw_mol.AddBond(idx_map[n1], idx_map[n2], RDKIT_BOND_ORDER_MAP[bond])
+
+
+def its_to_mols(
+    its: nx.Graph, ignore_aam=False
+) -> tuple[Chem.rdchem.Mol, Chem.rdchem.Mol]:
+    """Convert an ITS graph directly into the reactant and product RDKit
+    molecules. This is equivalent to splitting the ITS graph and converting
+    both graphs with :py:func:`~fgutils.rdkit.graph_to_mol` but it does not
+    copy the graph and counts the hydrogens of both sides in a single pass
+    over the ITS edges.
+
+    :param its: The ITS graph. The graph requires ``SYMBOL_KEY`` node labels
+        and ``BOND_KEY`` edge labels of the form ``(g_bond, h_bond)``. Like in
+        :py:func:`~fgutils.its.split_its`, a scalar bond is an unchanged bond
+        on both sides. The node label ``AAM_KEY`` is optional to annotate the
+        molecules with an atom-atom map.
+    :param ignore_aam: If set to true the atom-atom map will not be
+        initialized.
+
+    :returns: Returns the reactant and product molecule as tuple.
+    """
+    rw_mols = (Chem.rdchem.RWMol(), Chem.rdchem.RWMol())
+    idx_map = {}
+    for n, d in its.nodes(data=True):
+        _graph_to_smiles_node_check(n, d)
+        atom_symbol = to_non_aromatic_symbol(d[SYMBOL_KEY])
+        if atom_symbol == "H":
+            continue
+        aam = None
+        if not ignore_aam and AAM_KEY in d.keys() and d[AAM_KEY] >= 0:
+            aam = d[AAM_KEY]
+        for rw_mol in rw_mols:
+            atom = Chem.rdchem.Atom(atom_symbol)
+            if aam is not None:
+                atom.SetAtomMapNum(aam)
+            idx_map[n] = rw_mol.AddAtom(atom)
+
+    H_cnts = {n: [0, 0] for n in idx_map.keys()}
+    for n1, n2, d in its.edges(data=True):
+        if d is None:
+            raise ValueError("Graph edge {} has no data.".format((n1, n2)))
+        if n1 not in idx_map and n2 not in idx_map:
+            continue
+        bonds = d[BOND_KEY]
+        if not isinstance(bonds, (tuple, list)):
+            bonds = (bonds, bonds)
+        for i, rw_mol in enumerate(rw_mols):
+            _add_its_bond(rw_mol, idx_map, H_cnts, i, n1, n2, bonds[i])
+
+    mols = []
+    for i, rw_mol in enumerate(rw_mols):
+        for n, idx in idx_map.items():
+            rw_mol.GetAtomWithIdx(idx).SetNumExplicitHs(H_cnts[n][i])
+        mol = rw_mol.GetMol()
+        rdmolops.SanitizeMol(mol)
+        mols.append(mol)
+    return mols[0], mols[1]
+
+
 def graph_to_smiles(g: nx.Graph, implicit_h=False, ignore_aam=False) -> str:
     """Convert a molecular graph into a SMILES string. This function uses
     RDKit for SMILES generation.
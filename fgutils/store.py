@@ -0,0 +1,289 @@
+import os
+import mmap
+import struct
+import numpy as np
+
+from fgutils.its import ITS
+from fgutils.binary import dumps, loads, _LENGTH
+
+_OFFSET = struct.Struct("<qq")
+
+
+def _index_path(path) -> str:
+    return "{}.idx.npy".format(path)
+
+
+def _keys_path(path) -> str:
+    return "{}.keys.npy".format(path)
+
+
+def _key_ids_path(path) -> str:
+    return "{}.key_ids.npy".format(path)
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class GraphStoreWriter:
+    """Writer to incrementally fill a :py:class:`~fgutils.store.GraphStore`.
+    The graphs are appended to the data file in binary graph format. The
+    offsets and keys are streamed to temporary files and the index and the
+    sorted key table are written when the writer is closed. Only the key
+    table is sorted in memory. The writer can be used as context manager::
+
+        >>> with GraphStoreWriter("graphs.bin") as writer:
+        >>>     for key, its in CSVReactionLoader("data.csv", "rxn", "id", mode="ITS"):
+        >>>         writer.add(its, key=key)
+
+    :param path: The path of the data file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__file = open(path, "wb")
+        self.__offset_file = open("{}.idx.tmp".format(path), "wb")
+        self.__key_file = open("{}.keys.tmp".format(path), "wb")
+        self.__position = 0
+        self.__count = 0
+        self.__key_count = 0
+        self.__key_width = 1
+
+    def add(self, graph, key=None) -> int:
+        """Append a graph to the store.
+
+        :param graph: The molecular graph or ITS graph to add.
+        :param key: (optional) A unique key to access the graph. Keys must be
+            strings. If one graph has a key all graphs need a key.
+
+        :returns: Returns the integer id of the graph.
+        """
+        if self.__file is None:
+            raise RuntimeError("Graph store writer is already closed.")
+        if (key is None and self.__key_count > 0) or (
+            key is not None and self.__key_count != self.__count
+        ):
+            raise ValueError("Either all or no graphs in the store need a key.")
+        data = dumps(graph)
+        self.__file.write(_LENGTH.pack(len(data)))
+        self.__file.write(data)
+        self.__position += _LENGTH.size
+        self.__offset_file.write(_OFFSET.pack(self.__position, len(data)))
+        self.__position += len(data)
+        if key is not None:
+            key_data = str(key).encode("utf-8")
+            self.__key_file.write(_LENGTH.pack(len(key_data)))
+            self.__key_file.write(key_data)
+            self.__key_width = max(self.__key_width, len(key_data))
+            self.__key_count += 1
+        self.__count += 1
+        return self.__count - 1
+
+    def __read_keys(self) -> np.ndarray:
+        keys = np.empty(self.__key_count, dtype="S{}".format(self.__key_width))
+        with open("{}.keys.tmp".format(self.path), "rb") as f:
+            for i in range(self.__key_count):
+                (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+                keys[i] = f.read(length)
+        return keys
+
+    def __write_index(self):
+        tmp_path = "{}.idx.tmp".format(self.path)
+        if self.__count == 0:
+            np.save(_index_path(self.path), np.zeros((0, 2), dtype=np.int64))
+            return
+        tmp_offsets = np.memmap(tmp_path, dtype=np.int64, mode="r")
+        offsets = np.lib.format.open_memmap(
+            _index_path(self.path),
+            mode="w+",
+            dtype=np.int64,
+            shape=(self.__count, 2),
+        )
+        offsets[:] = tmp_offsets.reshape(-1, 2)
+        offsets.flush()
+        del offsets, tmp_offsets
+
+    def close(self):
+        """Flush the data file and write the index and the key table."""
+        if self.__file is None:
+            return
+        self.__file.close()
+        self.__offset_file.close()  # type: ignore
+        self.__key_file.close()  # type: ignore
+        self.__file = None
+        try:
+            keys, key_ids = None, None
+            if self.__key_count > 0:
+                keys = self.__read_keys()
+                key_ids = np.argsort(keys, kind="stable")
+                keys = keys[key_ids]
+                if np.any(keys[1:] == keys[:-1]):
+                    raise ValueError("Graph store keys must be unique.")
+            self.__write_index()
+            if keys is not None:
+                np.save(_keys_path(self.path), keys)
+                np.save(_key_ids_path(self.path), key_ids.astype(np.int64))
+            else:
+                _remove(_keys_path(self.path))
+                _remove(_key_ids_path(self.path))
+        finally:
+            _remove("{}.idx.tmp".format(self.path))
+            _remove("{}.keys.tmp".format(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class GraphStore:
+    """Read-only collection of graphs stored in a single binary file with an
+    offset index. Graphs are decoded lazily on access by integer id or by
+    key. The data file, the index and the sorted key table are memory
+    mapped, i.e., the store works on collections larger than memory and
+    processes reading the same store share the mapped pages. The store is a sequence and can be passed
+    where lists of graphs are expected, e.g., to
+    :py:class:`~fgutils.torch.ITSDataset`.
+
+    The memory map is opened on first access. Pickling the store (e.g. to
+    send it to worker processes) only transfers the path.
+
+    :param path: The path of the data file.
+    :param as_its: (optional) If set to true graphs are returned as
+        :py:class:`~fgutils.its.ITS` objects. (Default: False)
+    """
+
+    def __init__(self, path, as_its=False):
+        self.path = path
+        self.as_its = as_its
+        self.__offsets = None
+        self.__keys = None
+        self.__file = None
+        self.__buffer = None
+
+    @staticmethod
+    def write(path, graphs, keys=None, as_its=False):
+        """Write graphs into a new graph store.
+
+        :param path: The path of the data file.
+        :param graphs: An iterable of molecular graphs or ITS graphs.
+        :param keys: (optional) An iterable of unique keys. Must have the same
+            length as graphs.
+        :param as_its: (optional) Argument for the returned store.
+
+        :returns: Returns the GraphStore for the written file.
+        """
+        with GraphStoreWriter(path) as writer:
+            if keys is None:
+                for graph in graphs:
+                    writer.add(graph)
+            else:
+                keys = list(keys)
+                cnt = 0
+                for graph, key in zip(graphs, keys):
+                    writer.add(graph, key=key)
+                    cnt += 1
+                if cnt != len(keys):
+                    raise ValueError(
+                        "Number of keys must be equal to the number of graphs. "
+                        + "({} != {})".format(len(keys), cnt)
+                    )
+        return GraphStore(path, as_its=as_its)
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """The memory mapped index array of shape (n, 2) with the record
+        offset and length of each graph."""
+        if self.__offsets is None:
+            self.__offsets = np.load(_index_path(self.path), mmap_mode="r")
+        return self.__offsets
+
+    def __load_keys(self) -> tuple[np.ndarray, np.ndarray] | None:
+        if self.__keys is None and os.path.exists(_keys_path(self.path)):
+            self.__keys = (
+                np.load(_keys_path(self.path), mmap_mode="r"),
+                np.load(_key_ids_path(self.path), mmap_mode="r"),
+            )
+        return self.__keys
+
+    def keys(self) -> list[str] | None:
+        """Get the list of graph keys in id order or None if the store has
+        no keys. This decodes all keys, use
+        :py:meth:`~fgutils.store.GraphStore.index_of` to look up a single
+        key."""
+        table = self.__load_keys()
+        if table is None:
+            return None
+        keys = [""] * len(table[0])
+        for key, idx in zip(*table):
+            keys[idx] = key.decode("utf-8")
+        return keys
+
+    def index_of(self, key: str) -> int:
+        """Get the integer id of a graph key. The keys are stored as sorted
+        fixed-width table in a memory mapped file and the key is found by
+        binary search, i.e., the keys are not loaded into memory.
+
+        :param key: The graph key.
+
+        :returns: Returns the integer id.
+        """
+        table = self.__load_keys()
+        if table is None:
+            raise KeyError("Graph store has no keys.")
+        keys, key_ids = table
+        key_data = str(key).encode("utf-8")
+        if len(key_data) > keys.dtype.itemsize:
+            raise KeyError(key)
+        i = int(np.searchsorted(keys, np.array(key_data, dtype=keys.dtype)))
+        if i >= len(keys) or keys[i] != key_data:
+            raise KeyError(key)
+        return int(key_ids[i])
+
+    def __open(self):
+        if self.__buffer is None:
+            self.__file = open(self.path, "rb")
+            self.__buffer = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.__buffer
+
+    def close(self):
+        """Close the memory map. The store is reopened on the next access."""
+        if self.__buffer is not None:
+            self.__buffer.close()
+            self.__file.close()  # type: ignore
+        self.__buffer = None
+        self.__file = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index: int | str):
+        if isinstance(index, str):
+            index = self.index_of(index)
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("Graph store index {} out of range.".format(index))
+        offset = int(self.offsets[index, 0])
+        graph = loads(self.__open(), offset)
+        if self.as_its:
+            return ITS(graph)
+        return graph
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getstate__(self):
+        return {"path": self.path, "as_its": self.as_its}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], as_its=state["as_its"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
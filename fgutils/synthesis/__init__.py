@@ -1 +1,14 @@
-from .rule_application import apply_rule, ReactionRule, its_to_gml
+from .rule_application import (
+    apply_rule,
+    apply_rule_reverse,
+    apply_rules,
+    ReactionRule,
+    CompiledRule,
+    PreparedReactant,
+    its_to_gml,
+    export_gml_rules,
+    iter_gml_rules,
+)
+from .rule_library import RuleLibrary
+from .network import expand_network, ReactionNetwork
+from .templates import extract_templates, TemplateCluster
@@ -0,0 +1,320 @@
+import os
+import pickle
+import itertools
+import networkx as nx
+
+from fgutils.its import ITS
+from fgutils.dedupe import graph_key
+from fgutils.binary import dump_stream
+from fgutils.utils import parallel_imap, relabel_graph
+from .rule_application import ReactionRule, CompiledRule, apply_rules
+
+
+def mol_hash(g: nx.Graph) -> str:
+    """Get the hash used to identify molecules in a reaction network. The
+    hash is the exact key from :py:func:`~fgutils.dedupe.graph_key` on
+    element symbols and bond orders, i.e., two molecules have the same hash
+    if and only if they are isomorphic.
+
+    :param g: The molecular graph.
+
+    :returns: Returns the hash string.
+    """
+    return graph_key(g, "exact")
+
+
+class NetworkReaction:
+    """Reaction (hyperedge) in a reaction network.
+
+    :param educts: The sorted tuple of educt molecule ids.
+    :param products: The sorted tuple of product molecule ids.
+    :param rule: The name of the rule that produced the reaction.
+    :param its: The ITS graph of the reaction.
+    """
+
+    def __init__(self, educts: tuple, products: tuple, rule: str, its: ITS):
+        self.educts = educts
+        self.products = products
+        self.rule = rule
+        self.its = its
+
+    def __repr__(self):
+        return "NetworkReaction({} -> {}, rule={})".format(
+            list(self.educts), list(self.products), self.rule
+        )
+
+
+class ReactionNetwork:
+    """Reaction network, i.e., a directed hypergraph of molecules and
+    reactions. Molecules are identified by an integer id and deduplicated
+    by :py:func:`~fgutils.synthesis.network.mol_hash`.
+    """
+
+    def __init__(self):
+        self.molecules: list[nx.Graph] = []
+        self.generations: list[int] = []
+        self.reactions: list[NetworkReaction] = []
+        self.__mol_ids = {}
+        self.__reaction_keys = set()
+
+    def __len__(self):
+        return len(self.molecules)
+
+    def index_of(self, g: nx.Graph) -> int | None:
+        """Get the id of a molecule in the network.
+
+        :param g: The molecular graph.
+
+        :returns: Returns the molecule id or None if the molecule is not in
+            the network.
+        """
+        return self.__mol_ids.get(mol_hash(g), None)
+
+    def add_molecule(self, g: nx.Graph, generation: int, key=None) -> tuple[int, bool]:
+        """Add a molecule to the network.
+
+        :param g: The molecular graph.
+        :param generation: The generation in which the molecule was found.
+        :param key: (optional) The precomputed molecule hash.
+
+        :returns: Returns a tuple with the molecule id and a flag if the
+            molecule is new.
+        """
+        if key is None:
+            key = mol_hash(g)
+        if key in self.__mol_ids:
+            return self.__mol_ids[key], False
+        idx = len(self.molecules)
+        self.__mol_ids[key] = idx
+        self.molecules.append(g)
+        self.generations.append(generation)
+        return idx, True
+
+    def add_reaction(self, reaction: NetworkReaction) -> bool:
+        """Add a reaction to the network. Reactions with the same educts,
+        products and rule are only added once.
+
+        :param reaction: The reaction to add.
+
+        :returns: Returns true if the reaction is new.
+        """
+        key = (reaction.educts, reaction.products, reaction.rule)
+        if key in self.__reaction_keys:
+            return False
+        self.__reaction_keys.add(key)
+        self.reactions.append(reaction)
+        return True
+
+    def to_derivation_graph(self) -> nx.DiGraph:
+        """Convert the network into a bipartite directed graph. Molecule
+        nodes are the molecule ids and reaction nodes are tuples
+        ``("r", index)``.
+
+        :returns: Returns the derivation graph.
+        """
+        dg = nx.DiGraph()
+        for i, g in enumerate(self.molecules):
+            dg.add_node(i, graph=g, generation=self.generations[i])
+        for i, reaction in enumerate(self.reactions):
+            r = ("r", i)
+            dg.add_node(r, rule=reaction.rule)
+            for educt in reaction.educts:
+                dg.add_edge(educt, r)
+            for product in reaction.products:
+                dg.add_edge(r, product)
+        return dg
+
+
+_expand_worker_state = {}
+
+
+def _init_expand_worker(rules, rules_by_size):
+    _expand_worker_state["rules"] = rules
+    _expand_worker_state["rules_by_size"] = rules_by_size
+
+
+def _expand_worker(task):
+    educts, graphs = task
+    rules = _expand_worker_state["rules"]
+    rule_idx = _expand_worker_state["rules_by_size"][len(graphs)]
+    reactant = nx.disjoint_union_all(graphs)
+    results = apply_rules(
+        reactant, [rules[i] for i in rule_idx], unique=True, connected_only=True
+    )
+    reactions = []
+    for i, its_graphs in zip(rule_idx, results):
+        for its in its_graphs:
+            _, h = its.split()
+            products = []
+            for c in nx.connected_components(h):
+                product = relabel_graph(h.subgraph(c).copy())
+                products.append((mol_hash(product), product))
+            reactions.append((educts, i, its, products))
+    return reactions
+
+
+def _get_reactant_sets(frontier: list[int], pool: list[int], size: int):
+    # Each set is generated once from its smallest frontier molecule f. The
+    # remaining molecules are either not in the frontier or not smaller than f.
+    frontier = sorted(set(frontier))
+    frontier_set = set(frontier)
+    others = [i for i in pool if i not in frontier_set]
+    for j, f in enumerate(frontier):
+        candidates = sorted(others + frontier[j:])
+        for educts in itertools.combinations_with_replacement(candidates, size - 1):
+            yield tuple(sorted((f,) + educts))
+
+
+def _start_expansion(molecules, network):
+    if network is None:
+        network = ReactionNetwork()
+    generation = max(network.generations, default=-1) + 1
+    frontier = []
+    for g in molecules:
+        idx, is_new = network.add_molecule(g, generation)
+        if is_new:
+            frontier.append(idx)
+    frontier_set = set(frontier)
+    expanded = [i for i in range(len(network)) if i not in frontier_set]
+    return network, frontier, expanded, generation
+
+
+def expand_network(
+    molecules: list[nx.Graph],
+    rules: list[ReactionRule | CompiledRule],
+    generations: int = 1,
+    max_frontier: int | None = None,
+    n_jobs: int | None = None,
+    chunksize: int = 16,
+    checkpoint_dir=None,
+    network: ReactionNetwork | None = None,
+    resume: bool = False,
+) -> ReactionNetwork:
+    """Breadth-first forward expansion of a reaction network. In each
+    generation all rules are applied to all sets of reactant molecules that
+    contain at least one molecule found in the previous generation (the
+    frontier). A rule whose left graph has k connected components is
+    applied to sets of up to k molecules and all molecules in the set must
+    take part in the reaction. Product molecules are deduplicated by
+    :py:func:`~fgutils.synthesis.network.mol_hash`. The rule applications
+    of a generation run in a process pool.
+
+    Example::
+
+        >>> rule = ReactionRule(parse("C1<2,1>C<1,2>C<2,1>C<0,1>C<2,1>C<0,1>1"))
+        >>> network = expand_network([mol_smiles_to_graph("C=CC=C")], [rule])
+        >>> len(network.reactions)
+        1
+
+    :param molecules: The starting molecules (generation 0).
+    :param rules: The list of reaction rules.
+    :param generations: (optional) The number of generations to expand.
+        (Default: 1)
+    :param max_frontier: (optional) The maximum number of new molecules
+        that are expanded in the next generation. Molecules beyond this
+        limit are kept in the network but are never used as reactants.
+        (Default: None)
+    :param n_jobs: (optional) The number of processes. Use -1 for all CPUs.
+        (Default: None)
+    :param chunksize: (optional) The number of reactant sets sent to a
+        worker at once. (Default: 16)
+    :param checkpoint_dir: (optional) If set, the state of the expansion
+        is written to ``checkpoint.pkl`` in this directory after each
+        generation. Additionally, the frontier of each generation is written
+        to ``generation_<i>.bin``, which can be read with
+        :py:func:`~fgutils.binary.load_stream`. (Default: None)
+    :param network: (optional) An existing network to continue. The
+        starting molecules are added to this network and all molecules
+        already in the network are used as co-reactants. (Default: None)
+    :param resume: (optional) If set to true and ``checkpoint_dir``
+        contains a checkpoint, the interrupted expansion is continued from
+        the last completed generation. The starting molecules and
+        ``network`` are ignored in this case and ``generations`` is the
+        total number of generations of the run. (Default: False)
+
+    :returns: Returns the reaction network.
+    """
+    compiled_rules = [
+        r if isinstance(r, CompiledRule) else CompiledRule(r) for r in rules
+    ]
+    rule_sizes = [nx.number_connected_components(r.rule.l) for r in compiled_rules]
+    max_size = max(rule_sizes, default=0)
+    rules_by_size = {
+        size: [i for i, s in enumerate(rule_sizes) if s >= size]
+        for size in range(1, max_size + 1)
+    }
+    checkpoint_path = None
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        checkpoint_path = os.path.join(checkpoint_dir, "checkpoint.pkl")
+    if resume and checkpoint_path is not None and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "rb") as f:
+            state = pickle.load(f)
+        network = state["network"]
+        frontier = state["frontier"]
+        expanded = state["expanded"]
+        generation = state["generation"]
+        completed = state["completed"]
+    else:
+        network, frontier, expanded, generation = _start_expansion(molecules, network)
+        completed = 0
+
+    def _write_checkpoint():
+        if checkpoint_path is None:
+            return
+        path = os.path.join(checkpoint_dir, "generation_{}.bin".format(generation))
+        dump_stream([network.molecules[i] for i in frontier], path)
+        state = {
+            "network": network,
+            "frontier": frontier,
+            "expanded": expanded,
+            "generation": generation,
+            "completed": completed,
+        }
+        tmp_path = checkpoint_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f)
+        os.replace(tmp_path, checkpoint_path)
+
+    if completed == 0:
+        _write_checkpoint()
+    for _ in range(completed, generations):
+        if len(frontier) == 0:
+            break
+        generation += 1
+        expanded.extend(frontier)
+        tasks = (
+            (educts, [network.molecules[i] for i in educts])
+            for size in range(1, max_size + 1)
+            for educts in _get_reactant_sets(frontier, expanded, size)
+        )
+        new_molecules = []
+        for reactions in parallel_imap(
+            _expand_worker,
+            tasks,
+            n_jobs=n_jobs,
+            chunksize=chunksize,
+            initializer=_init_expand_worker,
+            initargs=(compiled_rules, rules_by_size),
+        ):
+            for educts, rule_idx, its, products in reactions:
+                product_ids = []
+                for key, product in products:
+                    idx, is_new = network.add_molecule(product, generation, key=key)
+                    if is_new:
+                        new_molecules.append(idx)
+                    product_ids.append(idx)
+                network.add_reaction(
+                    NetworkReaction(
+                        educts,
+                        tuple(sorted(product_ids)),
+                        compiled_rules[rule_idx].name,
+                        its,
+                    )
+                )
+        frontier = new_molecules
+        if max_frontier is not None:
+            frontier = frontier[:max_frontier]
+        completed += 1
+        _write_checkpoint()
+    return network
@@ -1,17 +1,46 @@
+import os
 import re
+import itertools
+import collections
 import networkx as nx
 
-from fgutils.chem.valence import _check_its_valence
-from fgutils.its import ITS, split_its
+from fgutils.chem.valence import ValenceChecker
+from fgutils.its import ITS, split_its, prune_its_to_rc
 from fgutils.const import SYMBOL_KEY, BOND_KEY
+from fgutils.utils import parallel_imap, get_num_jobs
+from fgutils.dedupe import graph_key
 
 _BOND_MAP = {"-": 1, "=": 2, ":": 1.5, "#": 3}
 _BOND_MAP_INV = {v: k for k, v in _BOND_MAP.items()}
 
+_GML_TOKEN = re.compile(
+    r"(?P<space>\s+)|(?P<comment>#.*)|(?P<open>\[)|(?P<close>\])"
+    + r'|"(?P<string>[^"]*)"'
+    + r"|(?P<number>[-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)"
+    + r"|(?P<key>[a-zA-Z_]\w*)"
+)
+_GML_LABEL = re.compile(r"^(?P<symbol>[a-zA-Z*][a-z]*)(?P<charge>\d*[+-]|[+-]\d+)?$")
+
+
+def _get_charge(g: nx.Graph, n) -> int:
+    if g.has_edge(n, n):
+        return int(round(-2 * g.edges[n, n][BOND_KEY]))
+    return 0
+
+
+def _get_gml_label(symbol: str, charge: int) -> str:
+    if charge == 0:
+        return symbol
+    return "{}{}{}".format(
+        symbol, abs(charge) if abs(charge) > 1 else "", "+" if charge > 0 else "-"
+    )
+
 
 def _get_gml_edge_str(g: nx.Graph, prefix: str) -> list[str]:
     gml_str = []
     for u, v, d in g.edges(data=True):
+        if u == v:
+            continue
         line = '{}edge [ source {} target {} label "{}" ]'.format(
             prefix, u, v, _BOND_MAP_INV[d[BOND_KEY]]
         )
@@ -19,17 +48,21 @@ def _get_gml_edge_str(g: nx.Graph, prefix: str) -> list[str]:
     return gml_str
 
 
-def _get_gml_node_str(g: nx.Graph, prefix: str) -> list[str]:
+def _get_gml_node_str(g: nx.Graph, nodes, prefix: str) -> list[str]:
     gml_str = []
-    for u, d in g.nodes(data=True):
-        line = '{}node [ id {} label "{}" ]'.format(prefix, u, d[SYMBOL_KEY])
+    for u in nodes:
+        label = _get_gml_label(g.nodes[u][SYMBOL_KEY], _get_charge(g, u))
+        line = '{}node [ id {} label "{}" ]'.format(prefix, u, label)
         gml_str.append(line)
     return gml_str
 
 
 def its_to_gml(its: nx.Graph, rule_id: str, indent=4) -> list[str]:
     """Convert an ITS graph into DPO GML string format. The ITS graph needs
-    SYMBOL_KEY node features and BOND_KEY edge features.
+    SYMBOL_KEY node features and BOND_KEY edge features. Charges (self-loop
+    edges) are written as part of the node label, e.g. ``O-``. Nodes that
+    change their charge are written to the left and right graph instead of
+    the context.
 
     :param its: The ITS graph to convert to GML.
     :param rule_id: The DPO rule id.
@@ -39,22 +72,169 @@ def its_to_gml(its: nx.Graph, rule_id: str, indent=4) -> list[str]:
         in the GML file.
     """
     g, h = split_its(its)
+    changed = [n for n in its.nodes if _get_charge(g, n) != _get_charge(h, n)]
+    context = [n for n in its.nodes if n not in changed]
     i_str = " " * indent
     gml = ["rule ["]
     gml.append('{}ruleID "{}"'.format(i_str, rule_id))
     gml.append("{}left [".format(i_str))
     gml.extend(_get_gml_edge_str(g, 2 * i_str))
+    gml.extend(_get_gml_node_str(g, changed, 2 * i_str))
     gml.append("{}]".format(i_str))
     gml.append("{}context [".format(i_str))
-    gml.extend(_get_gml_node_str(g, 2 * i_str))
+    gml.extend(_get_gml_node_str(g, context, 2 * i_str))
     gml.append("{}]".format(i_str))
     gml.append("{}right [".format(i_str))
     gml.extend(_get_gml_edge_str(h, 2 * i_str))
+    gml.extend(_get_gml_node_str(h, changed, 2 * i_str))
     gml.append("{}]".format(i_str))
     gml.append("]")
     return gml
 
 
+def _normalize_rc(rc: nx.Graph) -> nx.Graph:
+    g = nx.Graph()
+    for n, sym in rc.nodes(data=SYMBOL_KEY):  # type: ignore
+        g.add_node(n, **{SYMBOL_KEY: sym})
+    for u, v, bond in rc.edges(data=BOND_KEY):  # type: ignore
+        g.add_edge(u, v, **{BOND_KEY: (float(bond[0]), float(bond[1]))})
+    return g
+
+
+def get_rc_hash(rc: nx.Graph) -> str:
+    """Get a canonical hash of a reaction center graph. Bonds are compared
+    as float tuples, i.e., list and tuple bonds or integer and float bond
+    orders give the same hash. The hash is the exact key from
+    :py:func:`~fgutils.dedupe.graph_key`, i.e., two reaction centers have the
+    same hash if and only if they are isomorphic.
+
+    :param rc: The reaction center graph.
+
+    :returns: Returns the hash string.
+    """
+    return graph_key(_normalize_rc(rc), "exact")
+
+
+def _reaction_to_rc(reaction, radius: int, insert_hydrogens=True) -> nx.Graph:
+    if isinstance(reaction, str):
+        its = ITS.from_smiles(reaction).graph
+    elif isinstance(reaction, ITS):
+        its = reaction.graph
+    else:
+        its = reaction
+    its = nx.convert_node_labels_to_integers(its)
+    return prune_its_to_rc(its, radius=radius, insert_hydrogens=insert_hydrogens)
+
+
+def _export_gml_rule(idx, reaction, radius, rule_id):
+    try:
+        rc = _reaction_to_rc(reaction, radius)
+        gml = "\n".join(its_to_gml(rc, rule_id.format(idx)))
+        return idx, get_rc_hash(rc), gml
+    except Exception as e:
+        return idx, None, "{}: {}".format(type(e).__name__, e)
+
+
+def _export_gml_worker(args):
+    offset, chunk, radius, rule_id = args
+    return [
+        _export_gml_rule(offset + i, reaction, radius, rule_id)
+        for i, reaction in enumerate(chunk)
+    ]
+
+
+def _iter_export_tasks(reactions, chunksize, radius, rule_id):
+    it = iter(reactions)
+    offset = 0
+    while True:
+        chunk = list(itertools.islice(it, chunksize))
+        if len(chunk) == 0:
+            break
+        yield offset, chunk, radius, rule_id
+        offset += len(chunk)
+
+
+def export_gml_rules(
+    file,
+    reactions,
+    radius: int = 0,
+    unique=True,
+    n_jobs: int | None = None,
+    chunksize: int = 64,
+    rule_id: str = "{}",
+    on_error="skip",
+) -> list[int]:
+    """Extract reaction rules from reactions and write them to a GML file.
+    The reaction center with context (see
+    :py:func:`~fgutils.its.prune_its_to_rc`) of each reaction is converted
+    into a GML rule in worker processes. The rules are written to the file
+    in the order of the input as soon as they are ready. At most four
+    chunks per process are pending at once, i.e., the reactions are never
+    all in memory.
+
+    Example::
+
+        >>> reader = CSVReactionLoader("data.csv", "rxn", mode="SMILES")
+        >>> export_gml_rules("rules.gml", reader, radius=1, n_jobs=-1)
+
+    :param file: The output file path or a file object opened for writing.
+    :param reactions: An iterable of atom-atom mapped reaction smiles, ITS
+        objects or ITS graphs.
+    :param radius: (optional) The context radius around the reaction
+        center. (Default: 0)
+    :param unique: (optional) If set to true, a rule is only written for
+        the first reaction with a given reaction center hash (see
+        :py:func:`~fgutils.synthesis.rule_application.get_rc_hash`).
+        (Default: True)
+    :param n_jobs: (optional) The number of processes. Use -1 for all CPUs.
+        (Default: None)
+    :param chunksize: (optional) The number of reactions sent to a worker
+        at once. (Default: 64)
+    :param rule_id: (optional) The format string for the rule id. It is
+        formatted with the index of the reaction in the input.
+        (Default: "{}")
+    :param on_error: (optional) How to handle reactions that can not be
+        converted. Use ``"skip"`` to leave them out or ``"raise"`` to raise
+        a ValueError. (Default: "skip")
+
+    :returns: Returns the input indices of the reactions that were written
+        as rules.
+    """
+    if on_error not in ["skip", "raise"]:
+        raise ValueError(
+            "Unknown value '{}' for on_error. ".format(on_error)
+            + 'Use "skip" or "raise" instead.'
+        )
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "w") as f:
+            return export_gml_rules(
+                f, reactions, radius, unique, n_jobs, chunksize, rule_id, on_error
+            )
+    known_hashes = set()
+    written = []
+    results = itertools.chain.from_iterable(
+        parallel_imap(
+            _export_gml_worker,
+            _iter_export_tasks(reactions, chunksize, radius, rule_id),
+            n_jobs=n_jobs,
+            max_pending=4 * get_num_jobs(n_jobs),
+        )
+    )
+    for idx, rc_hash, gml in results:
+        if rc_hash is None:
+            if on_error == "raise":
+                raise ValueError("Failed to export reaction {}. {}".format(idx, gml))
+            continue
+        if unique:
+            if rc_hash in known_hashes:
+                continue
+            known_hashes.add(rc_hash)
+        file.write(gml)
+        file.write("\n")
+        written.append(idx)
+    return written
+
+
 class DPORule:
     """Double Pushout Rule class.
 
@@ -77,130 +257,222 @@ class DPORule:
         """Method to convert the DPO rule representation to a reaction center
         graph, i.e., the superposition of L and R on C. The reaction center
         graph is a node and edge labeled graph. The ``BOND_KEY`` edge label
-        encodes the bond change in the reaction.
+        encodes the bond change in the reaction. Nodes in L and R that are
+        not in C must have the same element in both graphs, i.e., only
+        their charge can change.
 
         :returns: Returns the reaction center graph.
         """
         rc = nx.Graph()
-        for n, d in self.context.nodes(data=True):
-            rc.add_node(n, **d)
-        assert len(self.context.edges) == 0
-        for n, d in self.left.nodes(data=True):
-            if not rc.has_node(n):
-                raise ValueError(
-                    "Node {}:{} is not in context.".format(n, d[SYMBOL_KEY])
-                )
-        for u, v, d in self.left.edges(data=True):
-            rc.add_edge(u, v, **{BOND_KEY: [d[BOND_KEY], 0]})
-        for u, v, d in self.right.edges(data=True):
+        self.__add_rc_nodes(rc)
+        self.__add_rc_edges(rc)
+        return rc
+
+    def __add_rc_nodes(self, rc: nx.Graph):
+        for g in [self.context, self.left, self.right]:
+            for n, sym in g.nodes(data=SYMBOL_KEY):  # type: ignore
+                if sym is None:
+                    continue
+                if not rc.has_node(n):
+                    rc.add_node(n, **{SYMBOL_KEY: sym})
+                elif rc.nodes[n][SYMBOL_KEY] != sym:
+                    raise ValueError(
+                        "Node {} changes its label from {} to {}.".format(
+                            n, rc.nodes[n][SYMBOL_KEY], sym
+                        )
+                    )
+        for g, other in [(self.left, self.right), (self.right, self.left)]:
+            for n, sym in g.nodes(data=SYMBOL_KEY):  # type: ignore
+                if sym is None or self.context.has_node(n):
+                    continue
+                if other.nodes.get(n, {}).get(SYMBOL_KEY, None) is None:
+                    raise ValueError("Node {}:{} is not in context.".format(n, sym))
+        for g in [self.context, self.left, self.right]:
+            for n in g.nodes:
+                if not rc.has_node(n):
+                    raise ValueError("Node {} has no label.".format(n))
+
+    def __add_rc_edges(self, rc: nx.Graph):
+        for u, v, bond in self.context.edges(data=BOND_KEY):  # type: ignore
+            rc.add_edge(u, v, **{BOND_KEY: [bond, bond]})
+        for u, v, bond in self.left.edges(data=BOND_KEY):  # type: ignore
+            if rc.has_edge(u, v):
+                raise ValueError("Edge {}-{} is in context and left.".format(u, v))
+            rc.add_edge(u, v, **{BOND_KEY: [bond, 0]})
+        for u, v, bond in self.right.edges(data=BOND_KEY):  # type: ignore
+            if self.context.has_edge(u, v):
+                raise ValueError("Edge {}-{} is in context and right.".format(u, v))
             if rc.has_edge(u, v):
-                rc.edges[u, v][BOND_KEY][1] = d[BOND_KEY]
+                rc.edges[u, v][BOND_KEY][1] = bond
             else:
-                rc.add_edge(u, v, **{BOND_KEY: [0, d[BOND_KEY]]})
-        return rc
+                rc.add_edge(u, v, **{BOND_KEY: [0, bond]})
+
+
+def _iter_gml_lines(src):
+    if isinstance(src, os.PathLike) or (
+        isinstance(src, str) and src.endswith(".gml")
+    ):
+        with open(src, "r") as f:
+            yield from f
+    elif isinstance(src, str):
+        yield from src.splitlines()
+    else:
+        yield from src
 
 
-def _is_start(line):
-    p = re.compile(r"^rule \[$")
-    return p.match(line) is not None
+def _iter_gml_elements(lines):
+    # Yields the top-level (key, value) pairs of a GML document. List values
+    # are lists of (key, value) pairs. Only one top-level element is kept in
+    # memory at a time.
+    stack = []
+    key = None
+    for line_no, line in enumerate(lines, 1):
+        pos = 0
+        while pos < len(line):
+            m = _GML_TOKEN.match(line, pos)
+            if m is None:
+                raise ValueError(
+                    "Invalid GML token '{}' in line {}.".format(
+                        line[pos:].strip(), line_no
+                    )
+                )
+            pos = m.end()
+            kind = m.lastgroup
+            if kind == "space" or kind == "comment":
+                continue
+            elif kind == "key" and key is None:
+                key = m.group("key")
+                continue
+            elif kind == "close" and key is None:
+                if len(stack) == 0:
+                    raise ValueError("Unexpected ']' in line {}.".format(line_no))
+                element = stack.pop()
+            elif key is None:
+                raise ValueError(
+                    "Expected GML key but found '{}' in line {}.".format(
+                        m.group(0), line_no
+                    )
+                )
+            elif kind == "open":
+                stack.append((key, []))
+                key = None
+                continue
+            elif kind == "string":
+                element = (key, m.group("string"))
+            elif kind == "number":
+                number = m.group("number")
+                is_int = "." not in number and "e" not in number.lower()
+                element = (key, int(number) if is_int else float(number))
+            else:
+                raise ValueError(
+                    "Expected value for GML key '{}' in line {}.".format(key, line_no)
+                )
+            key = None
+            if len(stack) > 0:
+                stack[-1][1].append(element)
+            else:
+                yield element
+    if len(stack) > 0 or key is not None:
+        raise ValueError("Unexpected end of GML input.")
 
 
-def _match_id(line):
-    p = re.compile(r"^\s*ruleID \"(?P<ruleID>[a-zA-Z\d]+)\"$")
-    m = p.match(line)
-    if m:
-        return m.group("ruleID")
-    return None
+def _parse_gml_label(label) -> tuple[str, int]:
+    m = _GML_LABEL.match(str(label))
+    if m is None:
+        raise ValueError("Invalid GML node label '{}'.".format(label))
+    charge = m.group("charge")
+    if charge is None:
+        return m.group("symbol"), 0
+    sign = -1 if "-" in charge else 1
+    digits = charge.strip("+-")
+    return m.group("symbol"), sign * (int(digits) if digits else 1)
 
 
-def _match_graph(line):
-    p = re.compile(r"^\s*(?P<name>[a-z]+) \[$")
-    m = p.match(line)
-    if m:
-        return m.group("name")
-    return None
+def _parse_gml_graph(items) -> nx.Graph:
+    g = nx.Graph()
+    for key, value in items:
+        if key not in ["node", "edge"] or not isinstance(value, list):
+            raise ValueError("Expected node or edge in graph not '{}'.".format(key))
+        attrs = dict(value)
+        if key == "node":
+            symbol, charge = _parse_gml_label(attrs["label"])
+            g.add_node(attrs["id"], **{SYMBOL_KEY: symbol})
+            if charge != 0:
+                g.add_edge(attrs["id"], attrs["id"], **{BOND_KEY: 0.5 * -charge})
+        else:
+            if attrs["label"] not in _BOND_MAP:
+                raise ValueError("Invalid GML edge label '{}'.".format(attrs["label"]))
+            g.add_edge(
+                attrs["source"],
+                attrs["target"],
+                **{BOND_KEY: _BOND_MAP[attrs["label"]]}
+            )
+    return g
 
 
-def _match_edge(line):
-    p = re.compile(
-        r"^\s+edge \[ source (?P<source>\d+) target (?P<target>\d+) label \"(?P<label>[-=:])\" ]$"
-    )
-    m = p.match(line)
-    if m:
-        return int(m.group("source")), int(m.group("target")), m.group("label")
-    return None
-
-
-def _match_node(line):
-    p = re.compile(r"^\s+node \[ id (?P<id>\d+) label \"(?P<label>[a-zA-Z\d+-]+)\" ]$")
-    m = p.match(line)
-    if m:
-        return int(m.group("id")), m.group("label")
-    return None
-
-
-def _is_end(line):
-    p = re.compile(r"^\s*]$")
-    return p.match(line) is not None
-
-
-def _parse_graph(lines: list[str]):
-    graph_name = _match_graph(lines.pop(0))
-    edges = []
-    nodes = []
-    while not _is_end(lines[0]):
-        line = lines.pop(0)
-        edge = _match_edge(line)
-        if edge is None:
-            node = _match_node(line)
-            if node is None:
-                raise ValueError(
-                    "Expected node or edge in graph not '{}'.".format(line)
-                )
-            nodes.append(node)
+def _to_dpo_rule(items) -> DPORule:
+    rule_id = None
+    graphs = {"left": nx.Graph(), "context": nx.Graph(), "right": nx.Graph()}
+    for key, value in items:
+        if key == "ruleID":
+            rule_id = str(value)
+        elif key in graphs and isinstance(value, list):
+            graphs[key] = _parse_gml_graph(value)
         else:
-            edges.append(edge)
-    lines.pop(0)
-    g = nx.Graph()
-    for n, sym in nodes:
-        g.add_node(n, **{SYMBOL_KEY: sym})
-    for u, v, bond in edges:
-        g.add_edge(u, v, **{BOND_KEY: _BOND_MAP[bond]})
-    return graph_name, g
+            raise ValueError("Unsupported GML rule attribute '{}'.".format(key))
+    if rule_id is None:
+        raise ValueError("GML rule has no ruleID.")
+    return DPORule(rule_id, graphs["left"], graphs["context"], graphs["right"])
+
+
+def iter_gml_dpo_rules(src):
+    """Lazily parse DPO rules from GML. The input can contain any number of
+    rules and is read in a single pass, i.e., only one rule is kept in
+    memory at a time.
+
+    :param src: A path to a ``.gml`` file, a GML string, an open file or an
+        iterable of lines.
+
+    :returns: Returns a generator of DPO rules.
+    """
+    for key, value in _iter_gml_elements(_iter_gml_lines(src)):
+        if key != "rule" or not isinstance(value, list):
+            raise ValueError("Expected GML rule not '{}'.".format(key))
+        yield _to_dpo_rule(value)
+
+
+def iter_gml_rules(src):
+    """Lazily load reaction rules from GML. Supported format is the M\u00D8D
+    GML rule format. The input can contain any number of rules. See
+    :py:func:`~fgutils.synthesis.rule_application.iter_gml_dpo_rules` for
+    the supported inputs.
+
+    Example::
+
+        >>> for rule in iter_gml_rules("rules.gml"):
+        >>>     print(rule.name)
+
+    :param src: A path to a ``.gml`` file, a GML string, an open file or an
+        iterable of lines.
+
+    :returns: Returns a generator of reaction rules.
+    """
+    for dpo_rule in iter_gml_dpo_rules(src):
+        yield ReactionRule(dpo_rule.to_rc_graph(), name=dpo_rule.rule_id)
 
 
 def parse_gml_dpo_rule(lines: list[str]) -> DPORule:
-    """Parse a GML string into a DPO rule object.
+    """Parse a GML string into a DPO rule object. The input must contain
+    exactly one rule.
 
     :param lines: The lines of the GML string.
 
     :returns: Returns the parsed DPO rule.
     """
-    start_line = lines.pop(0)
-    if not _is_start(start_line):
-        raise ValueError("Expected GML start not '{}'.".format(start_line))
-    id_line = lines.pop(0)
-    rule_id = _match_id(id_line)
-    if rule_id is None:
-        raise ValueError("Expected ruleID not '{}'.".format(id_line))
-    g_name, left = _parse_graph(lines)
-    if g_name != "left":
-        raise ValueError("Expected graph 'left' but got '{}'.".format(g_name))
-    g_name, context = _parse_graph(lines)
-    if g_name != "context":
-        raise ValueError("Expected graph 'context' but got '{}'.".format(g_name))
-    g_name, right = _parse_graph(lines)
-    if g_name != "right":
-        raise ValueError("Expected graph 'right' but got '{}'.".format(g_name))
-    end_line = lines.pop(0)
-    if not _is_end(end_line):
-        raise ValueError("Expected end line but got '{}'.".format(end_line))
-    if len(lines) > 0:
-        raise ValueError(
-            "Expected no more lines but found {} more lines.".format(len(lines))
-        )
-    rule = DPORule(rule_id, left, context, right)
-    return rule
+    rules = list(iter_gml_dpo_rules(lines))
+    if len(rules) != 1:
+        raise ValueError("Expected exactly one rule but found {}.".format(len(rules)))
+    return rules[0]
 
 
 class ReactionRule:
@@ -214,39 +486,497 @@ class ReactionRule:
         self.rc = rc_graph
         self.l, self.r = split_its(rc_graph)
         self.name = name
+        self.__reverse = None
+
+    def reverse(self) -> "ReactionRule":
+        """Get the reverse rule, i.e., the rule with L and R swapped. The
+        reverse rule is created once and cached.
+
+        :returns: Returns the reverse reaction rule.
+        """
+        if self.__reverse is None:
+            rc = self.rc.copy()
+            for _, _, d in rc.edges(data=True):
+                d[BOND_KEY] = d[BOND_KEY][::-1]
+            self.__reverse = ReactionRule(rc, name=self.name)
+            self.__reverse.__reverse = self
+        return self.__reverse
 
     @staticmethod
     def from_gml(src: str):
         """Load reaction rule from a GML file. Supported format is the M\u00D8D GML
-        rule format.
+        rule format. Use
+        :py:func:`~fgutils.synthesis.rule_application.iter_gml_rules` to load
+        files with multiple rules.
 
-        :param data: This can be either a file path or a GML string.
+        :param src: This can be either a file path or a GML string.
 
         :returns: Returns an instance of the ReactionRule class.
         """
-        if src.endswith(".gml"):
-            with open(src, "r") as f:
-                lines = f.readlines()
-        else:
-            lines = src.split("\n")
-        dpo_rule = parse_gml_dpo_rule(lines)
+        dpo_rule = parse_gml_dpo_rule(src)
         return ReactionRule(dpo_rule.to_rc_graph(), name=dpo_rule.rule_id)
 
 
-def _has_bonding_violation(its, rule, ctx2its_mapping):
-    # check non-bonding condition of new edges in the reactant
-    new_edges = [(u, v) for u, v, d in rule.rc.edges(data=True) if d[BOND_KEY][0] == 0]
-    for ur, vr in new_edges:
-        u = ctx2its_mapping[ur]
-        v = ctx2its_mapping[vr]
-        if its.has_edge(u, v):
-            return True
-    return False
+class PreparedReactant:
+    """Reactant graph prepared for rule application. The preparation
+    extracts the node labels, the adjacency with bond orders, the connected
+    components and the atom valences once so that many rules or matches can
+    reuse them.
+
+    :param g: The reactant graph.
+    """
+
+    def __init__(self, g: nx.Graph):
+        self.graph = g
+        self.symbols = {n: d[SYMBOL_KEY] for n, d in g.nodes(data=True)}
+        self.adj = {
+            n: {m: d[BOND_KEY] for m, d in nbrs.items()} for n, nbrs in g.adjacency()
+        }
+        self.nodes_by_symbol = collections.defaultdict(list)
+        for n, sym in self.symbols.items():
+            self.nodes_by_symbol[sym].append(n)
+        self.components = {}
+        self.component_cnt = 0
+        for i, component in enumerate(nx.connected_components(g)):
+            for n in component:
+                self.components[n] = i
+            self.component_cnt += 1
+        self.valence = ValenceChecker(g)
+        self.symbol_counts = collections.Counter(self.symbols.values())
+        self.bond_counts = collections.Counter(
+            b for _, _, b in g.edges(data=BOND_KEY)  # type: ignore
+        )
+        self.__colors = None
+        self.__leaves = {}
+        self.__core_adj = {}
+        self.__orbits = {}
+        self.__core_representatives = {}
+        self.__orbit_representatives = {}
+
+    def __refine(self, colorings: list[dict]) -> list[dict]:
+        # Jointly refine colorings of the reactant until they are stable.
+        # Equal colors in different colorings get the same id.
+        class_cnt = 0
+        while True:
+            color_ids = {}
+            colorings = [
+                {n: color_ids.setdefault(c, len(color_ids)) for n, c in colors.items()}
+                for colors in colorings
+            ]
+            if len(color_ids) == class_cnt:
+                return colorings
+            class_cnt = len(color_ids)
+            colorings = [
+                {
+                    n: (
+                        colors[n],
+                        tuple(
+                            sorted(
+                                (bond, colors[m])
+                                for m, bond in self.__core_adj[n].items()
+                                if m != n
+                            )
+                        ),
+                    )
+                    for n in colors
+                }
+                for colors in colorings
+            ]
+
+    def __get_cells(self, colors: dict) -> dict:
+        cells = collections.defaultdict(list)
+        for n, c in colors.items():
+            cells[c].append(n)
+        return cells
+
+    def __find_automorphism(self, colors1: dict, colors2: dict) -> dict | None:
+        # Individualization-refinement search for an automorphism that maps
+        # the coloring colors1 onto colors2.
+        colors1, colors2 = self.__refine([colors1, colors2])
+        cells1 = self.__get_cells(colors1)
+        cells2 = self.__get_cells(colors2)
+        if {c: len(v) for c, v in cells1.items()} != {
+            c: len(v) for c, v in cells2.items()
+        }:
+            return None
+        if len(cells1) == len(colors1):
+            mapping = {cells1[c][0]: cells2[c][0] for c in cells1}
+            for n, nbrs in self.__core_adj.items():
+                adj_n = self.__core_adj[mapping[n]]
+                if len(adj_n) != len(nbrs):
+                    return None
+                for m, bond in nbrs.items():
+                    if adj_n.get(mapping[m], None) != bond:
+                        return None
+            return mapping
+        color = min(
+            (c for c in cells1 if len(cells1[c]) > 1), key=lambda c: len(cells1[c])
+        )
+        x = cells1[color][0]
+        for y in cells2[color]:
+            _colors1 = dict(colors1)
+            _colors2 = dict(colors2)
+            _colors1[x] = _colors2[y] = -1
+            mapping = self.__find_automorphism(_colors1, _colors2)
+            if mapping is not None:
+                return mapping
+        return None
+
+    def __find_orbit(self, n):
+        while self.__orbits[n] != n:
+            self.__orbits[n] = self.__orbits[self.__orbits[n]]
+            n = self.__orbits[n]
+        return n
+
+    def __init_orbits(self):
+        # Leaves (e.g. hydrogens) are removed from the graph that is searched
+        # for automorphisms. The leaf types become part of the parent color.
+        # Leaves of the same type on the same parent are always equivalent.
+        self.__leaves = {}
+        leaf_types = collections.defaultdict(list)
+        for n, nbrs in self.adj.items():
+            if len(nbrs) == 1:
+                m, bond = next(iter(nbrs.items()))
+                if m != n and len(self.adj[m]) > 1:
+                    self.__leaves[n] = m
+                    leaf_types[m].append((bond, self.symbols[n]))
+        self.__core_adj = {
+            n: {m: b for m, b in nbrs.items() if m not in self.__leaves}
+            for n, nbrs in self.adj.items()
+            if n not in self.__leaves
+        }
+        init_colors = {
+            n: (self.symbols[n], self.adj[n].get(n, None), tuple(sorted(leaf_types[n])))
+            for n in self.__core_adj
+        }
+        self.__colors = self.__refine([init_colors])[0]
+        self.__orbits = {n: n for n in self.__core_adj}
+
+    def __get_core_representatives(self, symbol: str) -> set:
+        if symbol in self.__core_representatives:
+            return self.__core_representatives[symbol]
+        representatives = set()
+        cells = self.__get_cells(
+            {
+                n: self.__colors[n]
+                for n in self.nodes_by_symbol.get(symbol, [])
+                if n not in self.__leaves
+            }
+        )
+        for cell in cells.values():
+            cell_reps = []
+            for n in cell:
+                orbit = self.__find_orbit(n)
+                if any(self.__find_orbit(r) == orbit for r in cell_reps):
+                    continue
+                for r in cell_reps:
+                    colors1 = dict(self.__colors)
+                    colors2 = dict(self.__colors)
+                    colors1[r] = colors2[n] = -1
+                    mapping = self.__find_automorphism(colors1, colors2)
+                    if mapping is not None:
+                        for u, v in mapping.items():
+                            self.__orbits[self.__find_orbit(u)] = self.__find_orbit(v)
+                        break
+                else:
+                    cell_reps.append(n)
+            representatives.update(cell_reps)
+        self.__core_representatives[symbol] = representatives
+        return representatives
+
+    def get_orbit_representatives(self, symbol: str | None = None) -> set:
+        """Get one representative node for each orbit of the automorphism
+        group of the reactant graph. Two nodes are in the same orbit if an
+        automorphism (with respect to element symbols and bond orders) maps
+        one onto the other. Candidate orbits are the color classes of a WL
+        refinement. Nodes in the same class are checked for equivalence with
+        an individualization-refinement search and the class is split if the
+        check fails. Every automorphism found merges all orbits it connects.
+        Results are cached.
+
+        :param symbol: (optional) Only compute the representatives of nodes
+            with this element symbol. (Default: None)
+
+        :returns: Returns the set of representative nodes.
+        """
+        if symbol is None:
+            representatives = set()
+            for sym in self.nodes_by_symbol.keys():
+                representatives.update(self.get_orbit_representatives(sym))
+            return representatives
+        if symbol in self.__orbit_representatives:
+            return self.__orbit_representatives[symbol]
+        if self.__colors is None:
+            self.__init_orbits()
+        representatives = set(self.__get_core_representatives(symbol))
+        leaf_keys = set()
+        for n in self.nodes_by_symbol.get(symbol, []):
+            if n not in self.__leaves:
+                continue
+            parent = self.__leaves[n]
+            self.__get_core_representatives(self.symbols[parent])
+            key = (self.__find_orbit(parent), self.adj[n][parent])
+            if key not in leaf_keys:
+                leaf_keys.add(key)
+                representatives.add(n)
+        self.__orbit_representatives[symbol] = representatives
+        return representatives
+
+
+class CompiledRule:
+    """Reaction rule prepared for repeated application. The search order of
+    the left graph, the label constraints for each search step, the
+    non-bonding conditions and the valence change of each rule node are
+    computed once on construction.
+
+    :param rule: The reaction rule to compile.
+    """
+
+    def __init__(self, rule: ReactionRule):
+        self.rule = rule
+        self.name = rule.name
+        self.__reverse = None
+        left = rule.l
+        self.order = self.__get_search_order(left)
+        pos = {n: i for i, n in enumerate(self.order)}
+        self.symbols = [left.nodes[n][SYMBOL_KEY] for n in self.order]
+        self.degrees = [len(left.adj[n]) for n in self.order]
+        self.parents = []
+        self.edge_checks = []
+        self.nonbond_checks = []
+        self.loop_checks = []
+        self.nonloop_checks = []
+        for i, n in enumerate(self.order):
+            parent = None
+            edge_checks = []
+            for m, d in left.adj[n].items():
+                j = pos[m]
+                if j < i:
+                    if parent is None:
+                        parent = (j, d[BOND_KEY])
+                    else:
+                        edge_checks.append((j, d[BOND_KEY]))
+            self.parents.append(parent)
+            self.edge_checks.append(edge_checks)
+            self.loop_checks.append(
+                left.edges[n, n][BOND_KEY] if left.has_edge(n, n) else None
+            )
+            self.nonbond_checks.append([])
+            self.nonloop_checks.append(False)
+
+        self.rc_edges = []
+        self.new_edges = []
+        self.valence_delta = collections.defaultdict(int)
+        for u, v, d in rule.rc.edges(data=True):
+            bond = d[BOND_KEY]
+            self.rc_edges.append((pos[u], pos[v], bond))
+            if bond[0] == 0:
+                self.new_edges.append((pos[u], pos[v]))
+                if u == v:
+                    self.nonloop_checks[pos[u]] = True
+                else:
+                    i, j = max(pos[u], pos[v]), min(pos[u], pos[v])
+                    self.nonbond_checks[i].append(j)
+            g_bond, h_bond = bond[0], bond[1]
+            if u == v:
+                g_bond, h_bond = int(2 * g_bond), int(2 * h_bond)
+            delta = h_bond - g_bond
+            self.valence_delta[pos[u]] += delta
+            if u != v:
+                self.valence_delta[pos[v]] += delta
+        self.valence_delta = {
+            i: delta for i, delta in self.valence_delta.items() if delta != 0
+        }
+        self.symbol_counts = collections.Counter(self.symbols)
+        self.bond_counts = collections.Counter(
+            b for _, _, b in left.edges(data=BOND_KEY)  # type: ignore
+        )
+
+    def reverse(self) -> "CompiledRule":
+        """Get the compiled reverse rule. The reverse rule matches the right
+        graph of the rule. It is compiled once and cached.
+
+        :returns: Returns the compiled reverse rule.
+        """
+        if self.__reverse is None:
+            self.__reverse = CompiledRule(self.rule.reverse())
+            self.__reverse.__reverse = self
+        return self.__reverse
+
+    @staticmethod
+    def __get_search_order(left: nx.Graph) -> list:
+        order = []
+        node_idx = {n: i for i, n in enumerate(left.nodes)}
+        components = sorted(
+            nx.connected_components(left),
+            key=lambda c: (-len(c), min(node_idx[n] for n in c)),
+        )
+        for component in components:
+            ordered = set()
+            connections = {n: 0 for n in component}
+            while len(ordered) < len(component):
+                n = max(
+                    [n for n in component if n not in ordered],
+                    key=lambda n: (connections[n], len(left.adj[n]), -node_idx[n]),
+                )
+                order.append(n)
+                ordered.add(n)
+                for m in left.adj[n]:
+                    if m in connections:
+                        connections[m] += 1
+        return order
+
+    def can_match(self, reactant: PreparedReactant) -> bool:
+        """Quick check if the left graph can possibly embed into the reactant.
+        The element and bond type multisets of the left graph must be
+        contained in the respective multisets of the reactant.
+
+        :param reactant: The prepared reactant graph.
+
+        :returns: Returns false if the rule can not match the reactant.
+        """
+        for sym, cnt in self.symbol_counts.items():
+            if reactant.symbol_counts.get(sym, 0) < cnt:
+                return False
+        for bond, cnt in self.bond_counts.items():
+            if reactant.bond_counts.get(bond, 0) < cnt:
+                return False
+        return True
+
+    def __get_candidates(
+        self, reactant: PreparedReactant, i: int, mapping: list, roots
+    ):
+        sym = self.symbols[i]
+        parent = self.parents[i]
+        if parent is None:
+            for n in reactant.nodes_by_symbol.get(sym, []):
+                if i == 0 and roots is not None and n not in roots:
+                    continue
+                yield n
+        else:
+            j, bond = parent
+            for n, n_bond in reactant.adj[mapping[j]].items():
+                if n_bond == bond and reactant.symbols[n] == sym:
+                    yield n
+
+    def __is_feasible(self, reactant: PreparedReactant, i: int, n, mapping: list):
+        adj_n = reactant.adj[n]
+        if len(adj_n) < self.degrees[i]:
+            return False
+        loop = self.loop_checks[i]
+        if loop is not None and adj_n.get(n, None) != loop:
+            return False
+        if self.nonloop_checks[i] and n in adj_n:
+            return False
+        for j, bond in self.edge_checks[i]:
+            if adj_n.get(mapping[j], None) != bond:
+                return False
+        for j in self.nonbond_checks[i]:
+            if mapping[j] in adj_n:
+                return False
+        return True
+
+    def match(self, reactant: nx.Graph | PreparedReactant, roots=None):
+        """Find all embeddings of the left graph in the reactant graph that
+        satisfy the non-bonding conditions of the rule, i.e., new bonds must
+        not exist in the reactant.
+
+        :param reactant: The reactant graph.
+        :param roots: (optional) A set of reactant nodes. If set, the first
+            rule node in ``order`` is only mapped to these nodes, e.g., to
+            the orbit representatives of the reactant. (Default: None)
+
+        :returns: Yields lists of reactant nodes. The i-th entry is the image
+            of the i-th rule node in ``order``.
+        """
+        if not isinstance(reactant, PreparedReactant):
+            reactant = PreparedReactant(reactant)
+        if len(self.order) == 0:
+            return
+        mapping = [None] * len(self.order)
+        used = set()
+
+        def _match(i):
+            for n in self.__get_candidates(reactant, i, mapping, roots):
+                if n in used or not self.__is_feasible(reactant, i, n, mapping):
+                    continue
+                mapping[i] = n
+                if i + 1 == len(self.order):
+                    yield list(mapping)
+                else:
+                    used.add(n)
+                    yield from _match(i + 1)
+                    used.remove(n)
+            mapping[i] = None
+
+        yield from _match(0)
+
+    def has_valence_violation(self, reactant: PreparedReactant, mapping: list) -> bool:
+        """Check if the valence of the ITS graph of an embedding is invalid.
+        Only the valence change of the mapped reaction center atoms is
+        checked against the precomputed reactant valences.
+
+        :param reactant: The prepared reactant graph.
+        :param mapping: The embedding as returned by :py:meth:`match`.
+
+        :returns: Returns true if the valence of an atom in the reactant or
+            the product is exceeded.
+        """
+        delta = {mapping[i]: d for i, d in self.valence_delta.items()}
+        return not reactant.valence.check(delta)
+
+    def is_connected(self, reactant: PreparedReactant, mapping: list) -> bool:
+        """Check if the ITS graph of the embedding is connected.
+
+        :param reactant: The prepared reactant graph.
+        :param mapping: The embedding as returned by :py:meth:`match`.
+
+        :returns: Returns true if the ITS graph is connected.
+        """
+        if reactant.component_cnt <= 1:
+            return reactant.component_cnt == 1
+        parent = list(range(reactant.component_cnt))
+
+        def _find(c):
+            while parent[c] != c:
+                parent[c] = parent[parent[c]]
+                c = parent[c]
+            return c
+
+        merged = 1
+        for i, j in self.new_edges:
+            ci = _find(reactant.components[mapping[i]])
+            cj = _find(reactant.components[mapping[j]])
+            if ci != cj:
+                parent[ci] = cj
+                merged += 1
+        return merged == reactant.component_cnt
+
+    def to_its(self, reactant: PreparedReactant, mapping: list) -> nx.Graph:
+        """Build the ITS graph of an embedding.
+
+        :param reactant: The prepared reactant graph.
+        :param mapping: The embedding as returned by :py:meth:`match`.
+
+        :returns: Returns the ITS graph.
+        """
+        its = reactant.graph.copy()
+        its_edge_attrs = {
+            (u, v): [d[BOND_KEY], d[BOND_KEY]] for u, v, d in its.edges(data=True)
+        }
+        for i, j, bond in self.rc_edges:
+            u = mapping[i]
+            v = mapping[j]
+            if not its.has_edge(u, v):
+                its.add_edge(u, v)
+            its_edge_attrs[u, v] = bond
+        nx.set_edge_attributes(its, its_edge_attrs, BOND_KEY)
+        return its
 
 
 def apply_rule(
-    g: nx.Graph,
-    rule: ReactionRule,
+    g: nx.Graph | PreparedReactant,
+    rule: ReactionRule | CompiledRule,
     n: int | None = None,
     unique=True,
     connected_only=False,
@@ -257,13 +987,17 @@ def apply_rule(
     :param g: The reactant graph. This can be a disconnected graph for multiple
         reactant molecules.
 
-    :param rule: The reaction rule to apply to the reactant graph.
+    :param rule: The reaction rule to apply to the reactant graph. Pass a
+        :py:class:`~fgutils.synthesis.rule_application.CompiledRule` if the
+        rule is applied many times.
 
     :param n: (optional) Limits the maximum number of solutions. If n is set to
         an integer it will return once n solutions are found. (Default: None)
 
     :param unique: (optional) Flag to specify if isomorphic solutions should be
         returned as one solution. Isomorphism is checked with 3 iterations WL.
+        If set to true, embeddings that only differ by a symmetry of the
+        reactant are skipped before the ITS graph is built.
 
     :param connected_only: (optional) Flag to specify if the ITS graph must be
         connected. Setting this to true means that all reactants in g must take
@@ -271,34 +1005,24 @@ def apply_rule(
 
     :returns: Returns a list of ITS graphs.
     """
-    matcher = nx.algorithms.isomorphism.GraphMatcher(
-        g,
-        rule.l,
-        node_match=lambda d1, d2: d1[SYMBOL_KEY] == d2[SYMBOL_KEY],
-        edge_match=lambda d1, d2: d1[BOND_KEY] == d2[BOND_KEY],
-    )
+    if not isinstance(rule, CompiledRule):
+        rule = CompiledRule(rule)
+    reactant = g if isinstance(g, PreparedReactant) else PreparedReactant(g)
     its_graphs = {}
-    for its2ctx_mapping in matcher.subgraph_monomorphisms_iter():
-        ctx2its_mapping = {v: k for k, v in its2ctx_mapping.items()}
-        its = g.copy()
-        if _has_bonding_violation(its, rule, ctx2its_mapping):
+    if not rule.can_match(reactant):
+        return []
+    # Any embedding can be moved by an automorphism of the reactant such
+    # that the first rule node maps to an orbit representative. The moved
+    # embedding produces an isomorphic ITS graph.
+    roots = None
+    if unique is True and len(rule.order) > 0:
+        roots = reactant.get_orbit_representatives(rule.symbols[0])
+    for mapping in rule.match(reactant, roots=roots):
+        if rule.has_valence_violation(reactant, mapping):
             continue
-
-        its_edge_attrs = {
-            (u, v): [d[BOND_KEY], d[BOND_KEY]] for u, v, d in its.edges(data=True)
-        }
-        for ur, vr, dr in rule.rc.edges(data=True):
-            u = ctx2its_mapping[ur]
-            v = ctx2its_mapping[vr]
-            if not its.has_edge(u, v):
-                its.add_edge(u, v)
-            its_edge_attrs[u, v] = dr[BOND_KEY]
-
-        nx.set_edge_attributes(its, its_edge_attrs, BOND_KEY)
-        if connected_only and not nx.is_connected(its):
-            continue
-        if not _check_its_valence(its):
+        if connected_only and not rule.is_connected(reactant, mapping):
             continue
+        its = rule.to_its(reactant, mapping)
         if unique is True:
             wl_hash = nx.weisfeiler_lehman_graph_hash(
                 its, edge_attr=BOND_KEY, node_attr=SYMBOL_KEY, iterations=3
@@ -311,3 +1035,115 @@ def apply_rule(
             break
 
     return list(its_graphs.values())
+
+
+def apply_rule_reverse(
+    h: nx.Graph | PreparedReactant,
+    rule: ReactionRule | CompiledRule,
+    n: int | None = None,
+    unique=True,
+    connected_only=False,
+) -> list[ITS]:
+    """Apply a reaction rule in reverse direction to a product graph H. The
+    right graph of the rule is matched in H and the precursors are
+    generated. The returned ITS graphs are oriented like the rule, i.e.,
+    splitting an ITS graph gives the precursor graph G and the product
+    graph H. Pass a
+    :py:class:`~fgutils.synthesis.rule_application.CompiledRule` to reuse
+    the compiled reverse rule across calls.
+
+    :param h: The product graph.
+    :param rule: The reaction rule to apply in reverse direction.
+    :param n: (optional) Limits the maximum number of solutions. (Default: None)
+    :param unique: (optional) Flag to specify if isomorphic solutions should be
+        returned as one solution. (Default: True)
+    :param connected_only: (optional) Flag to specify if the ITS graph must be
+        connected, i.e., all molecules in H must take part in the reaction.
+        (Default: False)
+
+    :returns: Returns a list of ITS graphs.
+    """
+    if not isinstance(rule, CompiledRule):
+        rule = CompiledRule(rule)
+    its_graphs = apply_rule(
+        h, rule.reverse(), n=n, unique=unique, connected_only=connected_only
+    )
+    for its in its_graphs:
+        for _, _, d in its.graph.edges(data=True):
+            d[BOND_KEY] = d[BOND_KEY][::-1]
+    return its_graphs
+
+
+_apply_rules_worker_state = {}
+
+
+def _init_apply_rules_worker(reactant, kwargs):
+    _apply_rules_worker_state["reactant"] = reactant
+    _apply_rules_worker_state["kwargs"] = kwargs
+
+
+def _apply_rules_worker(rule):
+    reactant = _apply_rules_worker_state["reactant"]
+    kwargs = _apply_rules_worker_state["kwargs"]
+    return apply_rule(reactant, rule, **kwargs)
+
+
+def apply_rules(
+    g: nx.Graph | PreparedReactant,
+    rules: list[ReactionRule | CompiledRule],
+    n_jobs: int | None = None,
+    n: int | None = None,
+    unique=True,
+    connected_only=False,
+) -> list[list[ITS]]:
+    """Apply a list of reaction rules to a reactant graph G. The reactant is
+    prepared only once for all rules. Rules whose left graph has more atoms
+    of an element or more bonds of a type than the reactant are skipped
+    without matching.
+
+    :param g: The reactant graph. This can be a disconnected graph for multiple
+        reactant molecules.
+    :param rules: The list of reaction rules to apply.
+    :param n_jobs: (optional) The number of processes used to apply the
+        rules in parallel. Use -1 for all CPUs. (Default: None)
+    :param n: (optional) Limits the maximum number of solutions per rule.
+        (Default: None)
+    :param unique: (optional) Flag to specify if isomorphic solutions should be
+        returned as one solution (see
+        :py:func:`~fgutils.synthesis.rule_application.apply_rule`). If set to
+        true a solution is also removed if an earlier rule already found an
+        isomorphic ITS graph. Across rules, isomorphism is checked with the
+        exact key from :py:func:`~fgutils.dedupe.graph_key`. (Default: True)
+    :param connected_only: (optional) Flag to specify if the ITS graph must be
+        connected.
+
+    :returns: Returns a list with one list of ITS graphs for each rule.
+    """
+    reactant = g if isinstance(g, PreparedReactant) else PreparedReactant(g)
+    compiled_rules = [r if isinstance(r, CompiledRule) else CompiledRule(r) for r in rules]
+    candidate_idx = [i for i, r in enumerate(compiled_rules) if r.can_match(reactant)]
+    kwargs = {"n": n, "unique": unique, "connected_only": connected_only}
+    if unique:
+        for i in candidate_idx:
+            if len(compiled_rules[i].symbols) > 0:
+                reactant.get_orbit_representatives(compiled_rules[i].symbols[0])
+    results = [[] for _ in rules]
+    rule_results = parallel_imap(
+        _apply_rules_worker,
+        [compiled_rules[i] for i in candidate_idx],
+        n_jobs=n_jobs,
+        initializer=_init_apply_rules_worker,
+        initargs=(reactant, kwargs),
+    )
+    known_keys = set()
+    for i, its_graphs in zip(candidate_idx, rule_results):
+        if unique:
+            _its_graphs = []
+            for its in its_graphs:
+                key = graph_key(its.graph, "exact")
+                if key not in known_keys:
+                    known_keys.add(key)
+                    _its_graphs.append(its)
+            its_graphs = _its_graphs
+        results[i] = its_graphs
+    return results
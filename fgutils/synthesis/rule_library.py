@@ -0,0 +1,170 @@
+import os
+import bisect
+import pathlib
+import itertools
+import collections
+import networkx as nx
+
+from fgutils.its import ITS
+from fgutils.const import SYMBOL_KEY, BOND_KEY
+from .rule_application import (
+    ReactionRule,
+    CompiledRule,
+    iter_gml_rules,
+    PreparedReactant,
+    apply_rules,
+)
+
+
+def _get_graph_features(g: nx.Graph) -> collections.Counter:
+    """Count the element, bond type, labeled edge and labeled 2-path
+    features of a molecular graph. For every subgraph monomorphism from a
+    graph L into a graph G the feature counts of L are less or equal to the
+    feature counts of G."""
+    features = collections.Counter()
+    symbols = {n: d[SYMBOL_KEY] for n, d in g.nodes(data=True)}
+    for sym in symbols.values():
+        features["atom", sym] += 1
+    for u, v, bond in g.edges(data=BOND_KEY):  # type: ignore
+        features["bond", bond] += 1
+        if u == v:
+            continue
+        a, b = sorted([symbols[u], symbols[v]])
+        features["edge", a, bond, b] += 1
+    for c in g.nodes:
+        nbrs = [(n, d[BOND_KEY]) for n, d in g.adj[c].items() if n != c]
+        for (a, b1), (d, b2) in itertools.combinations(nbrs, 2):
+            path = (symbols[a], b1, symbols[c], b2, symbols[d])
+            path = min(path, path[::-1])
+            features[("path",) + path] += 1
+    return features
+
+
+class RuleLibrary:
+    """Collection of reaction rules with an inverted index on features of
+    the left rule graphs. The index is used to find the rules that can
+    possibly be applied to a reactant without running subgraph matching.
+    Indexed features are element counts, bond type counts, labeled edge
+    counts and labeled path counts of length 2.
+
+    :param rules: (optional) A list of reaction rules.
+    """
+
+    def __init__(self, rules: list[ReactionRule] | None = None):
+        self.rules: list[ReactionRule] = []
+        self.__compiled_rules: list[CompiledRule] = []
+        self.__feature_cnts: list[int] = []
+        self.__featureless: list[int] = []
+        self.__index = collections.defaultdict(list)
+        if rules is not None:
+            for rule in rules:
+                self.add(rule)
+
+    @staticmethod
+    def from_gml(src) -> "RuleLibrary":
+        """Load a rule library from MØD GML rule files. A file can
+        contain multiple rules.
+
+        :param src: A directory containing ``.gml`` files, a single file or a
+            list of files. Strings are always treated as paths, i.e., a
+            missing file raises a FileNotFoundError.
+
+        :returns: Returns the rule library.
+        """
+        if isinstance(src, (str, os.PathLike)) and os.path.isdir(src):
+            files = sorted(
+                os.path.join(src, f) for f in os.listdir(src) if f.endswith(".gml")
+            )
+        elif isinstance(src, list):
+            files = src
+        else:
+            files = [src]
+        files = [pathlib.Path(f) if isinstance(f, str) else f for f in files]
+        library = RuleLibrary()
+        for file in files:
+            for rule in iter_gml_rules(file):
+                library.add(rule)
+        return library
+
+    def add(self, rule: ReactionRule) -> int:
+        """Add a rule to the library.
+
+        :param rule: The reaction rule to add.
+
+        :returns: Returns the index of the rule in the library.
+        """
+        idx = len(self.rules)
+        features = _get_graph_features(rule.l)
+        for feature, cnt in features.items():
+            bisect.insort(self.__index[feature], (cnt, idx))
+        self.rules.append(rule)
+        self.__compiled_rules.append(CompiledRule(rule))
+        self.__feature_cnts.append(len(features))
+        if len(features) == 0:
+            self.__featureless.append(idx)
+        return idx
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __getitem__(self, index: int) -> ReactionRule:
+        return self.rules[index]
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def query_indices(self, g: nx.Graph | PreparedReactant) -> list[int]:
+        """Get the indices of all rules whose left graph can possibly embed
+        into the reactant graph.
+
+        :param g: The reactant graph.
+
+        :returns: Returns the sorted list of rule indices.
+        """
+        if isinstance(g, PreparedReactant):
+            g = g.graph
+        hits = collections.Counter()
+        for feature, cnt in _get_graph_features(g).items():
+            entries = self.__index.get(feature, None)
+            if entries is None:
+                continue
+            end = bisect.bisect_right(entries, (cnt, len(self.rules)))
+            hits.update(idx for _, idx in entries[:end])
+        indices = [i for i, h in hits.items() if h == self.__feature_cnts[i]]
+        return sorted(indices + self.__featureless)
+
+    def query(self, g: nx.Graph | PreparedReactant) -> list[ReactionRule]:
+        """Get all rules whose left graph can possibly embed into the
+        reactant graph.
+
+        :param g: The reactant graph.
+
+        :returns: Returns the list of candidate rules.
+        """
+        return [self.rules[i] for i in self.query_indices(g)]
+
+    def apply(
+        self, g: nx.Graph | PreparedReactant, n_jobs: int | None = None, **kwargs
+    ) -> list[tuple[ReactionRule, list[ITS]]]:
+        """Apply all candidate rules to a reactant graph. Keyword arguments
+        are passed to :py:func:`~fgutils.synthesis.rule_application.apply_rules`.
+
+        :param g: The reactant graph.
+        :param n_jobs: (optional) The number of processes. (Default: None)
+
+        :returns: Returns a list of tuples with the rule and the ITS graphs of
+            all candidate rules that produced at least one ITS graph.
+        """
+        reactant = g if isinstance(g, PreparedReactant) else PreparedReactant(g)
+        indices = self.query_indices(reactant)
+        results = apply_rules(
+            reactant,
+            [self.__compiled_rules[i] for i in indices],
+            n_jobs=n_jobs,
+            **kwargs
+        )
+        return [
+            (self.rules[i], its_graphs)
+            for i, its_graphs in zip(indices, results)
+            if len(its_graphs) > 0
+        ]
@@ -0,0 +1,153 @@
+import itertools
+
+from fgutils.utils import parallel_imap
+from .rule_application import (
+    ReactionRule,
+    get_rc_hash,
+    _normalize_rc,
+    _reaction_to_rc,
+)
+
+
+class TemplateCluster:
+    """A reaction template together with the reactions it was extracted
+    from.
+
+    :param rule: The reaction rule of the template.
+    :param members: The ids of the reactions in the cluster.
+    """
+
+    def __init__(self, rule: ReactionRule, members: list):
+        self.rule = rule
+        self.members = members
+
+    @property
+    def count(self) -> int:
+        """The number of reactions in the cluster."""
+        return len(self.members)
+
+    def __repr__(self):
+        return "TemplateCluster({}, count={})".format(self.rule.name, self.count)
+
+
+def _extract_template(reaction_id, reaction, radius, insert_hydrogens):
+    try:
+        rc = _normalize_rc(_reaction_to_rc(reaction, radius, insert_hydrogens))
+        return reaction_id, get_rc_hash(rc), rc
+    except Exception as e:
+        return reaction_id, None, "{}: {}".format(type(e).__name__, e)
+
+
+def _extract_template_worker(args):
+    chunk, radius, insert_hydrogens = args
+    return [_extract_template(i, r, radius, insert_hydrogens) for i, r in chunk]
+
+
+def _iter_with_ids(reactions, ids):
+    if ids is None:
+        yield from enumerate(reactions)
+        return
+    id_iter = iter(ids)
+    for reaction in reactions:
+        try:
+            reaction_id = next(id_iter)
+        except StopIteration:
+            raise ValueError("Number of ids must be equal to the number of reactions.")
+        yield reaction_id, reaction
+
+
+def _iter_chunks(iterable, chunk_size: int):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def extract_templates(
+    reactions,
+    radius: int = 0,
+    insert_hydrogens=True,
+    ids=None,
+    n_jobs: int | None = None,
+    chunk_size: int = 10000,
+    chunksize: int = 64,
+    on_error="skip",
+) -> list[TemplateCluster]:
+    """Extract reaction templates from reactions and cluster reactions with
+    the same template. For each reaction the ITS graph is built and pruned
+    to the reaction center with context (see
+    :py:func:`~fgutils.its.prune_its_to_rc`). Reactions are clustered by the
+    canonical hash of the pruned graph (see
+    :py:func:`~fgutils.synthesis.rule_application.get_rc_hash`), i.e., the
+    same hash that identifies rules in
+    :py:func:`~fgutils.synthesis.rule_application.export_gml_rules`. The reactions are read lazily and processed in parallel,
+    i.e., only about ``chunk_size`` pending reactions and one graph per
+    template are kept in memory.
+
+    Example::
+
+        >>> reader = CSVReactionLoader("data.csv", "rxn", mode="SMILES")
+        >>> clusters = extract_templates(reader, radius=1, n_jobs=-1)
+        >>> clusters = sorted(clusters, key=lambda c: c.count, reverse=True)
+
+    :param reactions: An iterable of atom-atom mapped reaction smiles, ITS
+        objects or ITS graphs.
+    :param radius: (optional) The context radius around the reaction
+        center. (Default: 0)
+    :param insert_hydrogens: (optional) If set to true, removed neighbors
+        of the kept atoms are replaced by hydrogen atoms, i.e., the template
+        also fixes the degree of the boundary atoms. (Default: True)
+    :param ids: (optional) An iterable of reaction ids in the same order as
+        the reactions. If not set, the index of the reaction in the input is
+        used as id. (Default: None)
+    :param n_jobs: (optional) The number of processes. Use -1 for all CPUs.
+        (Default: None)
+    :param chunk_size: (optional) The maximum number of reactions that are
+        read from the input ahead of the clustering. (Default: 10000)
+    :param chunksize: (optional) The number of reactions sent to a worker
+        at once. (Default: 64)
+    :param on_error: (optional) How to handle reactions that can not be
+        converted. Use ``"skip"`` to leave them out or ``"raise"`` to raise
+        a ValueError. (Default: "skip")
+
+    :returns: Returns the list of template clusters in the order of their
+        first reaction. The rules are named ``T<i>`` by this order.
+    """
+    if on_error not in ["skip", "raise"]:
+        raise ValueError(
+            "Unknown value '{}' for on_error. ".format(on_error)
+            + 'Use "skip" or "raise" instead.'
+        )
+    clusters_by_hash = {}
+    clusters = []
+    tasks = (
+        (chunk, radius, insert_hydrogens)
+        for chunk in _iter_chunks(_iter_with_ids(reactions, ids), chunksize)
+    )
+    results = itertools.chain.from_iterable(
+        parallel_imap(
+            _extract_template_worker,
+            tasks,
+            n_jobs=n_jobs,
+            max_pending=max(1, chunk_size // chunksize),
+        )
+    )
+    for reaction_id, rc_hash, rc in results:
+        if rc_hash is None:
+            if on_error == "raise":
+                raise ValueError(
+                    "Failed to extract template from reaction {}. {}".format(
+                        reaction_id, rc
+                    )
+                )
+            continue
+        if rc_hash in clusters_by_hash:
+            clusters_by_hash[rc_hash].members.append(reaction_id)
+        else:
+            rule = ReactionRule(rc, name="T{}".format(len(clusters)))
+            cluster = TemplateCluster(rule, [reaction_id])
+            clusters_by_hash[rc_hash] = cluster
+            clusters.append(cluster)
+    return clusters
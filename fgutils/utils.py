@@ -1,3 +1,6 @@
+import os
+import collections
+import multiprocessing
 import numpy as np
 import networkx as nx
 
@@ -149,38 +152,43 @@ def initialize_aam(graph: nx.Graph, offset=1):
         d[AAM_KEY] = n + offset
 
 
-def complete_aam(graph: nx.Graph, offset: None | int | str = None):
-    """Complete the atom-atom map on a graph based on node indices. This
-    function does not override an existing atom-atom map. It extends the
-    existing atom-atom map to all nodes. The numbering of the new nodes starts
-    at 1 or ``offset`` and skipps all existing mapping numbers.
-
-    :param graph: The graph where to complete the atom-atom map.
-    :param offset: (optional) The mapping offset. Offset is the first value
-        used for numbering. If set to ``"min"`` the offset will be set to the
-        lowest existing number.
-    """
-    mappings = [d[AAM_KEY] for _, d in graph.nodes(data=True) if AAM_KEY in d]
+def _get_aam_offset(mappings, offset: None | int | str) -> int:
     next_mapping = 1
     if offset is not None:
         if isinstance(offset, int):
             next_mapping = offset
         elif offset == "min":
             if len(mappings) > 0:
-                next_mapping = int(np.min(mappings))
+                next_mapping = int(min(mappings))
         else:
             raise ValueError(
                 (
                     "Unknown value '{}' for offset. " + 'Use integer or "min" instead.'
                 ).format(offset)
             )
-    for n, d in graph.nodes(data=True):
+    return next_mapping
+
+
+def complete_aam(graph: nx.Graph, offset: None | int | str = None):
+    """Complete the atom-atom map on a graph based on node indices. This
+    function does not override an existing atom-atom map. It extends the
+    existing atom-atom map to all nodes. The numbering of the new nodes starts
+    at 1 or ``offset`` and skipps all existing mapping numbers.
+
+    :param graph: The graph where to complete the atom-atom map.
+    :param offset: (optional) The mapping offset. Offset is the first value
+        used for numbering. If set to ``"min"`` the offset will be set to the
+        lowest existing number.
+    """
+    mappings = set(d[AAM_KEY] for _, d in graph.nodes(data=True) if AAM_KEY in d)
+    next_mapping = _get_aam_offset(mappings, offset)
+    for _, d in graph.nodes(data=True):
         if AAM_KEY in d or d[SYMBOL_KEY] == "H":
             continue
         while next_mapping in mappings:
             next_mapping += 1
-        graph.nodes[n][AAM_KEY] = next_mapping
-        mappings.append(next_mapping)
+        d[AAM_KEY] = next_mapping
+        next_mapping += 1
 
 
 def mol_equal(
@@ -343,3 +351,69 @@ def get_product(smiles: str) -> str:
         return smiles.split(">")[-1]
     else:
         return smiles
+
+
+def get_num_jobs(n_jobs: int | None) -> int:
+    """Resolve the number of parallel jobs. ``None`` means a single job and
+    negative values count backwards from the number of CPUs, i.e., ``-1``
+    uses all CPUs.
+
+    :param n_jobs: The requested number of jobs.
+
+    :returns: Returns the number of jobs as positive integer.
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        n_jobs = (os.cpu_count() or 1) + 1 + n_jobs
+    return max(1, n_jobs)
+
+
+def parallel_imap(
+    func,
+    iterable,
+    n_jobs: int | None = None,
+    chunksize=1,
+    initializer=None,
+    initargs=(),
+    max_pending: int | None = None,
+):
+    """Lazily apply a function to all items of an iterable using a process
+    pool. The results are returned in the order of the input. With a single
+    job the function runs in the calling process without a pool.
+
+    :param func: The function to apply. For more than one job the function
+        must be picklable, i.e., defined at module level.
+    :param iterable: The input items.
+    :param n_jobs: (optional) The number of processes. (Default: None)
+    :param chunksize: (optional) The number of items sent to a worker at
+        once. (Default: 1)
+    :param initializer: (optional) A function called once in each worker
+        (or once in the calling process for a single job).
+    :param initargs: (optional) The arguments for the initializer.
+    :param max_pending: (optional) The maximum number of items that are
+        submitted to the pool but not yet returned. If set, the input is
+        read only as fast as results are consumed, i.e., the memory is
+        bounded for large inputs. Items are submitted one at a time and
+        chunksize is ignored. (Default: None)
+
+    :returns: Yields the results in input order.
+    """
+    n_jobs = get_num_jobs(n_jobs)
+    if n_jobs == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in iterable:
+            yield func(item)
+    else:
+        with multiprocessing.Pool(n_jobs, initializer, initargs) as pool:
+            if max_pending is None:
+                yield from pool.imap(func, iterable, chunksize=chunksize)
+            else:
+                pending = collections.deque()
+                for item in iterable:
+                    pending.append(pool.apply_async(func, (item,)))
+                    if len(pending) >= max_pending:
+                        yield pending.popleft().get()
+                while len(pending) > 0:
+                    yield pending.popleft().get()
@@ -2,7 +2,12 @@ import pytest
 
 from fgutils.const import BOND_KEY
 from fgutils.parse import parse
-from fgutils.chem.valence import _check_mol_valence, _check_its_valence, check_valence
+from fgutils.chem.valence import (
+    _check_mol_valence,
+    _check_its_valence,
+    check_valence,
+    ValenceChecker,
+)
 from fgutils.its import ITS
 
 
@@ -106,3 +111,19 @@ def test_check_valence_with_its():
     its = ITS(parse("C<2,1>C"))
     result = check_valence(its)
     assert result is True
+
+
+@pytest.mark.parametrize(
+    "reactant,delta,expected",
+    [
+        ("HC(H)(H)H", {}, True),
+        ("HC(H)(H)H", {1: -1}, True),
+        ("HC(H)(H)H", {1: 1}, False),
+        ("HC(H)(H)(H)H", {}, False),
+        ("C=O", {1: 1}, False),
+        ("CO", {0: 1, 1: 1}, True),
+    ],
+)
+def test_valence_checker(reactant, delta, expected):
+    checker = ValenceChecker(parse(reactant))
+    assert expected == checker.check(delta)
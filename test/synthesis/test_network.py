@@ -0,0 +1,94 @@
+import itertools
+
+from fgutils.parse import parse
+from fgutils.binary import load_stream
+from fgutils.synthesis import ReactionRule, ReactionNetwork, expand_network
+from fgutils.synthesis.network import _get_reactant_sets
+from fgutils.rdkit import mol_smiles_to_graph
+
+from ..my_asserts import assert_graph_eq
+
+
+def _get_da_rule():
+    return ReactionRule(parse("C1<2,1>C<1,2>C<2,1>C<0,1>C<2,1>C<0,1>1"), name="DA")
+
+
+def test_expand_network():
+    molecules = [mol_smiles_to_graph("C=CC=C"), mol_smiles_to_graph("C=C")]
+    network = expand_network(molecules, [_get_da_rule()], generations=1)
+    assert 4 == len(network)
+    assert [0, 0, 1, 1] == network.generations
+    assert [((0, 0), (2,)), ((0, 1), (3,))] == [
+        (r.educts, r.products) for r in network.reactions
+    ]
+    assert_graph_eq(mol_smiles_to_graph("C1C=CCCC1"), network.molecules[3])
+    assert 3 == network.index_of(mol_smiles_to_graph("C1C=CCCC1"))
+
+
+def test_expand_network_deduplicates_molecules():
+    molecules = [mol_smiles_to_graph("C=CC=C"), mol_smiles_to_graph("C=CC=C")]
+    network = expand_network(molecules, [_get_da_rule()], generations=2)
+    assert 1 == network.generations.count(0)
+    assert (0, 0) == network.reactions[0].educts
+
+
+def test_expand_network_in_parallel():
+    molecules = [mol_smiles_to_graph("C=CC=C"), mol_smiles_to_graph("C=C")]
+    exp_network = expand_network(molecules, [_get_da_rule()], generations=2)
+    network = expand_network(molecules, [_get_da_rule()], generations=2, n_jobs=2)
+    assert exp_network.generations == network.generations
+    assert [(r.educts, r.products) for r in exp_network.reactions] == [
+        (r.educts, r.products) for r in network.reactions
+    ]
+
+
+def test_max_frontier_and_checkpoints(tmp_path):
+    molecules = [mol_smiles_to_graph("C=CC=C"), mol_smiles_to_graph("C=C")]
+    network = expand_network(
+        molecules,
+        [_get_da_rule()],
+        generations=2,
+        max_frontier=1,
+        checkpoint_dir=tmp_path,
+    )
+    assert 2 == len(list(load_stream(tmp_path / "generation_0.bin")))
+    frontier = list(load_stream(tmp_path / "generation_1.bin"))
+    assert 1 == len(frontier)
+    assert_graph_eq(network.molecules[2], frontier[0])
+    # Only the first new molecule of generation 1 is used as reactant
+    assert all(3 not in r.educts for r in network.reactions)
+
+
+def test_resume_from_checkpoint(tmp_path):
+    molecules = [mol_smiles_to_graph("C=CC=C"), mol_smiles_to_graph("C=C")]
+    exp_network = expand_network(molecules, [_get_da_rule()], generations=2)
+    expand_network(molecules, [_get_da_rule()], generations=1, checkpoint_dir=tmp_path)
+    network = expand_network(
+        [], [_get_da_rule()], generations=2, checkpoint_dir=tmp_path, resume=True
+    )
+    assert exp_network.generations == network.generations
+    assert [(r.educts, r.products) for r in exp_network.reactions] == [
+        (r.educts, r.products) for r in network.reactions
+    ]
+
+
+def test_wl_collision_is_not_merged():
+    # Decalin and bicyclopentyl have the same WL hash
+    network = ReactionNetwork()
+    idx1, _ = network.add_molecule(mol_smiles_to_graph("C1CCC2CCCCC2C1"), 0)
+    idx2, is_new = network.add_molecule(mol_smiles_to_graph("C1CCC(C1)C1CCCC1"), 0)
+    assert is_new
+    assert idx1 != idx2
+
+
+def test_reactant_sets_contain_frontier_molecule():
+    frontier = [1, 4]
+    pool = [0, 1, 2, 3, 4]
+    sets = list(_get_reactant_sets(frontier, pool, 3))
+    exp_sets = [
+        s
+        for s in itertools.combinations_with_replacement(pool, 3)
+        if 1 in s or 4 in s
+    ]
+    assert len(exp_sets) == len(sets)
+    assert set(exp_sets) == set(sets)
@@ -1,7 +1,22 @@
+import pytest
+import networkx as nx
+
 from fgutils.parse import parse
-from fgutils.synthesis import ReactionRule, apply_rule, its_to_gml
+from fgutils.synthesis import (
+    ReactionRule,
+    CompiledRule,
+    PreparedReactant,
+    apply_rule,
+    apply_rule_reverse,
+    apply_rules,
+    its_to_gml,
+    export_gml_rules,
+    iter_gml_rules,
+)
+from fgutils.synthesis.rule_application import get_rc_hash
 from fgutils.utils import add_implicit_hydrogens
 from fgutils.rdkit import mol_smiles_to_graph
+from fgutils.const import SYMBOL_KEY, BOND_KEY, LABELS_KEY, IS_LABELED_KEY
 
 from ..my_asserts import assert_graph_eq
 
@@ -115,3 +130,227 @@ def test_rc_to_gml():
     assert len(gml) == len(exp_gml)
     for i, (exp_l, l) in enumerate(zip(exp_gml, gml)):
         assert exp_l == l, "Line {} missmatch {} != {}".format(i, exp_l, l)
+
+
+def test_gml_round_trip():
+    rules = [parse("C1<2,1>C<1,2>C<2,1>C<0,1>C<2,1>C<0,1>1"), parse("C<3,2>N")]
+    gml = []
+    for i, rc in enumerate(rules):
+        gml.extend(its_to_gml(rc, "rule {}".format(i)))
+    loaded_rules = list(iter_gml_rules("\n".join(gml)))
+    assert ["rule 0", "rule 1"] == [r.name for r in loaded_rules]
+    for exp_rc, rule in zip(rules, loaded_rules):
+        exp_rule = ReactionRule(exp_rc)
+        assert_graph_eq(exp_rule.l, rule.l, ignore_keys=[LABELS_KEY, IS_LABELED_KEY])
+        assert_graph_eq(exp_rule.r, rule.r, ignore_keys=[LABELS_KEY, IS_LABELED_KEY])
+
+
+def test_parse_gml_with_charges():
+    gml = """
+    # Compact formatting and comments
+    rule [ ruleID "deprotonation"
+        left [ edge [ source 0 target 1 label "-" ] node [ id 0 label "O" ] ]
+        context [ node [ id 1 label "H" ] node [ id 2 label "N+" ] ]
+        right [ node [ id 0 label "O-" ] ]
+    ]
+    """
+    rule = ReactionRule.from_gml(gml)
+    assert "deprotonation" == rule.name
+    assert [-0.5, -0.5] == rule.rc.edges[2, 2][BOND_KEY]
+    assert [0, 0.5] == rule.rc.edges[0, 0][BOND_KEY]
+    assert "O" == rule.rc.nodes[0][SYMBOL_KEY]
+    loaded_rule = ReactionRule.from_gml("\n".join(its_to_gml(rule.rc, "0")))
+    assert_graph_eq(rule.rc, loaded_rule.rc)
+
+
+def test_parse_gml_rejects_multiple_rules():
+    gml = its_to_gml(parse("C<2,1>C"), "0") + its_to_gml(parse("C<1,2>C"), "1")
+    with pytest.raises(ValueError):
+        ReactionRule.from_gml("\n".join(gml))
+
+
+def test_compiled_rule_reuse():
+    rule = CompiledRule(ReactionRule(parse("C1<2,1>C<1,2>C<2,1>C<0,1>C<2,1>C<0,1>1")))
+    reactant = PreparedReactant(mol_smiles_to_graph("C=CC=C.C=C"))
+    its_graphs = apply_rule(reactant, rule)
+    assert 1 == len(its_graphs)
+    its_graphs = apply_rule(mol_smiles_to_graph("C=CC=CC=C"), rule)
+    assert 1 == len(its_graphs)
+    assert_graph_eq(mol_smiles_to_graph("C1C=CC2C1C2"), its_graphs[0].split()[1])
+
+
+def test_compiled_rule_match_respects_nonbonding_condition():
+    rule = CompiledRule(ReactionRule(parse("C1<1,2>C<0,1>C<1,0>1")))
+    assert 0 == len(list(rule.match(parse("C1CC1"))))
+    mappings = list(rule.match(parse("CCC")))
+    assert 2 == len(mappings)
+    for mapping in mappings:
+        assert 3 == len(set(mapping))
+
+
+def test_compiled_rule_respects_new_charge_condition():
+    rc = nx.Graph()
+    rc.add_node(0, **{SYMBOL_KEY: "O"})
+    rc.add_node(1, **{SYMBOL_KEY: "H"})
+    rc.add_edge(0, 1, **{BOND_KEY: (1, 0)})
+    rc.add_edge(0, 0, **{BOND_KEY: (0, 0.5)})
+    rc.add_edge(1, 1, **{BOND_KEY: (0, -0.5)})
+    rule = ReactionRule(rc)
+    hydronium = mol_smiles_to_graph("[OH3+]")
+    assert 0 == len(list(CompiledRule(rule).match(hydronium)))
+    assert 0 == len(apply_rule(hydronium, rule, unique=True))
+    assert 0 == len(apply_rule(hydronium, rule, unique=False))
+    assert 2 == len(list(CompiledRule(rule).match(mol_smiles_to_graph("[OH2]"))))
+
+
+def test_compiled_rule_valence_check():
+    rule = CompiledRule(ReactionRule(parse("C<1,2>O")))
+    reactant = PreparedReactant(add_implicit_hydrogens(parse("CO")))
+    mappings = list(rule.match(reactant))
+    assert 1 == len(mappings)
+    assert rule.has_valence_violation(reactant, mappings[0])
+    assert 0 == len(apply_rule(reactant, rule))
+
+
+@pytest.mark.parametrize("n_jobs", [None, 2])
+def test_apply_rules(n_jobs):
+    reactant = mol_smiles_to_graph("C=CC=C.C=C")
+    rules = [
+        ReactionRule(parse("C1<2,1>C<1,2>C<2,1>C<0,1>C<2,1>C<0,1>1"), name="DA"),
+        ReactionRule(parse("N<0,1>C"), name="no match"),
+        ReactionRule(parse("C1<2,1>C<1,2>C<2,1>C<0,1>C<2,1>C<0,1>1"), name="DA copy"),
+        ReactionRule(parse("C<2,1>C<0,1>C<2,1>C"), name="dimerization"),
+    ]
+    results = apply_rules(reactant, rules, n_jobs=n_jobs)
+    assert 4 == len(results)
+    assert 1 == len(results[0])
+    assert 0 == len(results[1])
+    assert 0 == len(results[2])
+    assert len(results[3]) > 0
+    results = apply_rules(reactant, rules, n_jobs=n_jobs, unique=False)
+    assert len(results[0]) == len(results[2])
+
+
+def test_apply_rules_keeps_wl_collisions_of_different_rules():
+    # Breaking the ring fusion of decalin or the central bond of
+    # bicyclopentyl gives ITS graphs with the same WL hash
+    reactant = mol_smiles_to_graph("C1CCCC2C1CCCC2.C1CCCC1C1CCCC1")
+    rules = [
+        ReactionRule(parse("C1CCCC2<1,0>C1CCCC2"), name="decalin"),
+        ReactionRule(parse("C1CCCC1<1,0>C1CCCC1"), name="bicyclopentyl"),
+    ]
+    results = apply_rules(reactant, rules)
+    assert [1, 1] == [len(r) for r in results]
+
+
+def test_compiled_rule_prefilter():
+    rule = CompiledRule(ReactionRule(parse("C<2,1>C<0,1>O")))
+    assert rule.can_match(PreparedReactant(parse("C=C.O")))
+    assert not rule.can_match(PreparedReactant(parse("CC.O")))
+    assert not rule.can_match(PreparedReactant(parse("C=C.N")))
+
+
+@pytest.mark.parametrize(
+    "smiles,symbol,exp_cnt",
+    [
+        ("c1ccccc1", "C", 1),
+        ("OCC(O)C(O)CO", "O", 2),
+        ("CC(C)(C)C", "H", 1),
+        # All carbons have the same WL color but are in two orbits
+        ("C1CCCCC1.C1CC1.C1CC1", "C", 2),
+    ],
+)
+def test_orbit_representatives(smiles, symbol, exp_cnt):
+    reactant = PreparedReactant(mol_smiles_to_graph(smiles, implicit_h=True))
+    representatives = reactant.get_orbit_representatives(symbol)
+    assert exp_cnt == len(representatives)
+    assert all(reactant.symbols[n] == symbol for n in representatives)
+
+
+@pytest.mark.parametrize(
+    "smiles,rule",
+    [
+        ("c1ccccc1", "C<1,0>H"),
+        ("OCC(O)C(O)C(O)CO", "C<1,0>O<1,0>H"),
+        ("C12CC3CC(CC(C3)C1)C2", "C<1,0>C<1,0>H"),
+        ("C=CC=CC=CC=C", "C1<2,1>C<1,2>C<2,1>C<0,1>C<2,1>C<0,1>1"),
+    ],
+)
+def test_unique_apply_rule_with_symmetric_reactant(smiles, rule):
+    reactant = mol_smiles_to_graph(smiles, implicit_h=True)
+    rule = ReactionRule(parse(rule))
+
+    def _hash(its):
+        return nx.weisfeiler_lehman_graph_hash(
+            its.graph, edge_attr=BOND_KEY, node_attr=SYMBOL_KEY, iterations=3
+        )
+
+    exp_hashes = set(_hash(its) for its in apply_rule(reactant, rule, unique=False))
+    hashes = [_hash(its) for its in apply_rule(reactant, rule, unique=True)]
+    assert len(hashes) == len(set(hashes))
+    assert exp_hashes == set(hashes)
+
+
+def test_reverse_rule_is_cached():
+    rule = ReactionRule(parse("C(<0,1>N)<1,0>O"), name="amide")
+    reverse_rule = rule.reverse()
+    assert reverse_rule is rule.reverse()
+    assert rule is reverse_rule.reverse()
+    assert_graph_eq(rule.l, reverse_rule.r)
+    assert_graph_eq(rule.r, reverse_rule.l)
+    compiled_rule = CompiledRule(rule)
+    assert compiled_rule.reverse() is compiled_rule.reverse()
+
+
+def test_apply_rule_reverse():
+    product = mol_smiles_to_graph("C1C=CCCC1")
+    rule = ReactionRule(parse("C1<2,1>C<1,2>C<2,1>C<0,1>C<2,1>C<0,1>1"))
+    its_graphs = apply_rule_reverse(product, rule)
+    assert 1 == len(its_graphs)
+    reactant, exp_product = its_graphs[0].split()
+    assert_graph_eq(mol_smiles_to_graph("C=CC=C.C=C"), reactant)
+    assert_graph_eq(product, exp_product)
+
+
+def test_apply_rule_reverse_inverts_forward_application():
+    reactant = add_implicit_hydrogens(parse("CC(=O)O.N"))
+    rule = CompiledRule(ReactionRule(parse("C1<0,1>N<1,0>H<0,1>O<1,0>1")))
+    its = apply_rule(reactant, rule)[0]
+    _, product = its.split()
+    its_graphs = apply_rule_reverse(product, rule, connected_only=True)
+    assert its.to_smiles(ignore_aam=True) in [
+        i.to_smiles(ignore_aam=True) for i in its_graphs
+    ]
+
+
+def test_export_gml_rules(tmp_path):
+    reactions = [
+        "[C:1]=[C:2][C:3]=[C:4].[C:5]=[C:6]>>[C:1]1[C:2]=[C:3][C:4][C:5][C:6]1",
+        "[C:1]=[C:2][C:3]=[C:4].[C:5]=[C:6]C>>[C:1]1[C:2]=[C:3][C:4][C:5][C:6]1C",
+        "invalid",
+        "[C:1][C:2](=[O:3])[OH:4].[NH3:5]>>[C:1][C:2](=[O:3])[NH2:5].[OH2:4]",
+        "[C:1]#[N:2]>>[C:1]=[N:2]",
+    ]
+    path = tmp_path / "rules.gml"
+    written = export_gml_rules(path, reactions, n_jobs=2, rule_id="R{}")
+    assert [0, 3, 4] == written
+    rules = list(iter_gml_rules(str(path)))
+    assert ["R0", "R3", "R4"] == [r.name for r in rules]
+    written = export_gml_rules(
+        tmp_path / "chunked.gml", reactions, n_jobs=2, chunksize=2
+    )
+    assert [0, 3, 4] == written
+    with pytest.raises(ValueError):
+        export_gml_rules(tmp_path / "failed.gml", reactions, on_error="raise")
+
+
+def test_rc_hash_distinguishes_wl_collisions():
+    # Decalin and bicyclopentyl shaped reaction centers have the same WL hash
+    rc1 = parse("C1CCCC2<1,2>C1CCCC2")
+    rc2 = parse("C1CCCC1<1,2>C1CCCC1")
+    assert nx.weisfeiler_lehman_graph_hash(
+        rc1, edge_attr=BOND_KEY, node_attr=SYMBOL_KEY, iterations=3
+    ) == nx.weisfeiler_lehman_graph_hash(
+        rc2, edge_attr=BOND_KEY, node_attr=SYMBOL_KEY, iterations=3
+    )
+    assert get_rc_hash(rc1) != get_rc_hash(rc2)
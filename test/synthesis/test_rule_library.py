@@ -0,0 +1,79 @@
+import pytest
+
+from fgutils.parse import parse
+from fgutils.synthesis import ReactionRule, RuleLibrary, its_to_gml, apply_rule
+from fgutils.rdkit import mol_smiles_to_graph
+
+
+def _get_rules():
+    return [
+        ReactionRule(parse("C1<2,1>C<1,2>C<2,1>C<0,1>C<2,1>C<0,1>1"), name="DA"),
+        ReactionRule(parse("C(<0,1>N)<1,0>O"), name="amide"),
+        ReactionRule(parse("C<2,1>C<0,1>O"), name="hydration"),
+        ReactionRule(parse("C<3,2>N"), name="nitrile"),
+    ]
+
+
+def test_query_candidates():
+    library = RuleLibrary(_get_rules())
+    assert 4 == len(library)
+    candidates = library.query(mol_smiles_to_graph("C=CC=C.C=C"))
+    assert ["DA"] == [r.name for r in candidates]
+    candidates = library.query(mol_smiles_to_graph("CC(=O)O.N"))
+    assert ["amide"] == [r.name for r in candidates]
+    candidates = library.query(mol_smiles_to_graph("C=CC=C.C=C.O"))
+    assert ["DA", "hydration"] == [r.name for r in candidates]
+
+
+def test_query_does_not_miss_applicable_rules():
+    rules = _get_rules()
+    library = RuleLibrary(rules)
+    for smiles in ["C=CC=C.C=C", "CC(=O)O.N", "C=CO", "CC#N", "C=CC=CC=C.O"]:
+        g = mol_smiles_to_graph(smiles)
+        candidates = library.query_indices(g)
+        for i, rule in enumerate(rules):
+            if len(apply_rule(g, rule)) > 0:
+                assert i in candidates
+
+
+def test_path_features_prefilter():
+    library = RuleLibrary([ReactionRule(parse("O<1,0>C<1,0>N"))])
+    assert 0 == len(library.query(parse("OC.CN")))
+    assert 1 == len(library.query(parse("OCN")))
+
+
+def test_apply_library():
+    library = RuleLibrary(_get_rules())
+    results = library.apply(mol_smiles_to_graph("C=CC=C.C=C"))
+    assert 1 == len(results)
+    rule, its_graphs = results[0]
+    assert "DA" == rule.name
+    assert 1 == len(its_graphs)
+
+
+def test_load_library_from_directory(tmp_path):
+    for i, rule in enumerate(_get_rules()):
+        with open(tmp_path / "rule_{}.gml".format(i), "w") as f:
+            f.write("\n".join(its_to_gml(rule.rc, "rule{}".format(i))))
+    library = RuleLibrary.from_gml(tmp_path)
+    assert 4 == len(library)
+    assert "rule0" == library[0].name
+
+
+def test_load_library_from_multi_rule_file(tmp_path):
+    path = tmp_path / "rules.gml"
+    with open(path, "w") as f:
+        for rule in _get_rules():
+            f.write("\n".join(its_to_gml(rule.rc, rule.name)) + "\n")
+    library = RuleLibrary.from_gml(str(path))
+    assert ["DA", "amide", "hydration", "nitrile"] == [r.name for r in library]
+
+
+def test_load_library_from_file_list(tmp_path):
+    path = tmp_path / "rules.txt"
+    with open(path, "w") as f:
+        f.write("\n".join(its_to_gml(_get_rules()[0].rc, "DA")))
+    library = RuleLibrary.from_gml([str(path)])
+    assert ["DA"] == [r.name for r in library]
+    with pytest.raises(FileNotFoundError):
+        RuleLibrary.from_gml([str(tmp_path / "missing.txt")])
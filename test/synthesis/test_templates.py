@@ -0,0 +1,69 @@
+import pytest
+
+from fgutils.its import ITS
+from fgutils.synthesis import extract_templates, apply_rule, export_gml_rules
+from fgutils.rdkit import mol_smiles_to_graph
+
+_REACTIONS = [
+    "[C:1]=[C:2][C:3]=[C:4].[C:5]=[C:6]>>[C:1]1[C:2]=[C:3][C:4][C:5][C:6]1",
+    "[C:1][C:2](=[O:3])[OH:4].[NH3:5]>>[C:1][C:2](=[O:3])[NH2:5].[OH2:4]",
+    "[C:1]=[C:2][C:3]=[C:4].[C:5]=[C:6][C:7]>>[C:1]1[C:2]=[C:3][C:4][C:5][C:6]1[C:7]",
+    "invalid",
+    "[O:1]=[C:2]([OH:3])[C:4]=[C:5][C:6]=[C:7].[C:8]=[C:9]>>"
+    + "[O:1]=[C:2]([OH:3])[C:4]1[C:5]=[C:6][C:7][C:8][C:9]1",
+]
+
+
+def test_extract_templates():
+    clusters = extract_templates(_REACTIONS, insert_hydrogens=False)
+    assert 2 == len(clusters)
+    assert [0, 2, 4] == clusters[0].members
+    assert [1] == clusters[1].members
+    assert ["T0", "T1"] == [c.rule.name for c in clusters]
+    its_graphs = apply_rule(mol_smiles_to_graph("C=CC=C.C=C"), clusters[0].rule)
+    assert 1 == len(its_graphs)
+
+
+def test_extract_templates_with_context():
+    clusters = extract_templates(_REACTIONS, radius=1, insert_hydrogens=False)
+    assert [[0], [1], [2], [4]] == [c.members for c in clusters]
+
+
+def test_extract_templates_with_hydrogen_boundary():
+    clusters = extract_templates(_REACTIONS)
+    assert [[0], [1], [2], [4]] == [c.members for c in clusters]
+    assert 7 == len(clusters[2].rule.rc.nodes)
+
+
+def test_extract_templates_in_parallel_chunks():
+    exp_clusters = extract_templates(_REACTIONS, radius=1)
+    ids = ["R{}".format(i) for i in range(len(_REACTIONS))]
+    clusters = extract_templates(
+        _REACTIONS, radius=1, ids=ids, n_jobs=2, chunk_size=2, chunksize=1
+    )
+    assert [[ids[i] for i in c.members] for c in exp_clusters] == [
+        c.members for c in clusters
+    ]
+
+
+def test_extract_templates_with_too_few_ids():
+    with pytest.raises(ValueError):
+        extract_templates(_REACTIONS, ids=[0, 1], n_jobs=2, chunksize=1)
+
+
+@pytest.mark.parametrize("radius", [0, 1])
+def test_templates_match_exported_rules(tmp_path, radius):
+    clusters = extract_templates(_REACTIONS, radius=radius)
+    written = export_gml_rules(tmp_path / "rules.gml", _REACTIONS, radius=radius)
+    assert written == [c.members[0] for c in clusters]
+
+
+def test_extract_templates_from_its():
+    its_graphs = [ITS.from_smiles(r) for r in _REACTIONS[:3]]
+    clusters = extract_templates(its_graphs, insert_hydrogens=False)
+    assert [2, 1] == [c.count for c in clusters]
+
+
+def test_extract_templates_raise_on_error():
+    with pytest.raises(ValueError):
+        extract_templates(_REACTIONS, on_error="raise")
@@ -0,0 +1,101 @@
+import io
+import pytest
+import networkx as nx
+
+from fgutils.binary import dumps, loads, dump, load, dump_stream, load_stream
+from fgutils.its import ITS
+from fgutils.parse import parse
+from fgutils.rdkit import mol_smiles_to_graph
+from fgutils.const import SYMBOL_KEY, BOND_KEY, AAM_KEY, IDX_MAP_KEY
+
+from test.my_asserts import assert_graph_eq
+
+
+def _assert_types_eq(exp_graph, graph):
+    for u, v, d in exp_graph.edges(data=True):
+        exp_bond = d[BOND_KEY]
+        bond = graph.edges[u, v][BOND_KEY]
+        if isinstance(exp_bond, (tuple, list)):
+            assert isinstance(bond, tuple)
+            assert [type(b) for b in exp_bond] == [type(b) for b in bond]
+        else:
+            assert type(exp_bond) is type(bond)
+
+
+@pytest.mark.parametrize(
+    "smiles",
+    [
+        "CC(=O)O",
+        "c1ccccc1C[O-]",
+        "[Na+].[Cl-]",
+        "[C:1][C:2](=[O:3])[O:4].[N:5]",
+        "[CH3:1]C#N",
+    ],
+)
+def test_mol_round_trip(smiles):
+    exp_graph = mol_smiles_to_graph(smiles, implicit_h=True)
+    graph = loads(dumps(exp_graph))
+    assert_graph_eq(exp_graph, graph, ignore_keys=[])
+    _assert_types_eq(exp_graph, graph)
+
+
+def test_its_round_trip():
+    its = ITS.from_smiles("[C:1][O:2].[C:3]>>[C:1].[O:2][C:3]")
+    its.standardize()
+    graph = loads(dumps(its))
+    assert_graph_eq(its.graph, graph, ignore_keys=[IDX_MAP_KEY])
+    _assert_types_eq(its.graph, graph)
+    assert ITS(graph).wl_hash == its.wl_hash
+
+
+def test_labeled_graph_round_trip():
+    exp_graph = parse("C{group}<2,1>R<0,1>c1ccccc1")
+    graph = loads(dumps(exp_graph))
+    assert_graph_eq(exp_graph, graph)
+
+
+def test_non_consecutive_node_ids():
+    exp_graph = nx.Graph()
+    exp_graph.add_node(7, **{SYMBOL_KEY: "C", AAM_KEY: 3})
+    exp_graph.add_node(2, **{SYMBOL_KEY: "O"})
+    exp_graph.add_edge(7, 2, **{BOND_KEY: 2})
+    graph = loads(dumps(exp_graph))
+    assert [7, 2] == list(graph.nodes)
+    assert_graph_eq(exp_graph, graph, ignore_keys=[])
+
+
+def test_load_labeled_graph_at_unaligned_offset():
+    exp_graph = parse("C<2,1>C{group}")
+    data = b"\0" * 3 + dumps(exp_graph)
+    assert_graph_eq(exp_graph, loads(data, 3))
+
+
+def test_dump_and_load_file(tmp_path):
+    exp_graph = mol_smiles_to_graph("CCO")
+    file = tmp_path / "graph.bin"
+    dump(exp_graph, file)
+    assert_graph_eq(exp_graph, load(file))
+
+
+def test_stream(tmp_path):
+    smiles = ["CCO", "C=C", "c1ccccc1", "[NH4+]"]
+    exp_graphs = [mol_smiles_to_graph(s) for s in smiles]
+    file = tmp_path / "graphs.bin"
+    offsets = dump_stream(exp_graphs, file)
+    assert len(smiles) == len(offsets)
+    graphs = list(load_stream(file))
+    assert len(exp_graphs) == len(graphs)
+    for exp_graph, graph in zip(exp_graphs, graphs):
+        assert_graph_eq(exp_graph, graph)
+    data = file.read_bytes()
+    assert_graph_eq(exp_graphs[2], loads(data, offsets[2]))
+
+
+def test_stream_from_file_object():
+    exp_graphs = [mol_smiles_to_graph(s) for s in ["CC", "O"]]
+    buffer = io.BytesIO()
+    dump_stream(exp_graphs, buffer)
+    buffer.seek(0)
+    graphs = list(load_stream(buffer))
+    assert 2 == len(graphs)
+    assert_graph_eq(exp_graphs[1], graphs[1])
@@ -0,0 +1,53 @@
+import pytest
+import networkx as nx
+
+from fgutils.parse import parse
+from fgutils.dedupe import graph_key, BloomFilter, DiskSet
+
+
+@pytest.mark.parametrize("method", ["wl", "exact"])
+@pytest.mark.parametrize(
+    "pattern1,pattern2,is_equal",
+    [
+        ("CCO", "OCC", True),
+        ("CCO", "COC", False),
+        ("c1ccccc1", "C1CCCCC1", False),
+        ("C<1,2>CO", "OC<2,1>C", False),
+        ("C<1,2>CO", "OC<1,2>C", True),
+    ],
+)
+def test_graph_key(method, pattern1, pattern2, is_equal):
+    key1 = graph_key(parse(pattern1), method=method)
+    key2 = graph_key(parse(pattern2), method=method)
+    assert is_equal == (key1 == key2)
+
+
+def test_exact_key_separates_wl_collision():
+    g1 = nx.disjoint_union(parse("C1CCCCC1"), parse("C1CCCCC1"))
+    g2 = parse("C1CCCCCCCCCCC1")
+    assert graph_key(g1) == graph_key(g2)
+    assert graph_key(g1, method="exact") != graph_key(g2, method="exact")
+
+
+def test_bloom_filter():
+    seen = BloomFilter(1000, error_rate=0.01)
+    keys = ["key_{}".format(i) for i in range(1000)]
+    assert all(seen.add(k) for k in keys[:500])
+    assert all(k in seen for k in keys[:500])
+    assert not seen.add(keys[0])
+    false_positives = sum(1 for k in keys[500:] if k in seen)
+    assert false_positives < 25
+
+
+def test_disk_set(tmp_path):
+    path = tmp_path / "seen.db"
+    with DiskSet(path, batch_size=2) as seen:
+        assert seen.add("a")
+        assert seen.add("b")
+        assert not seen.add("a")
+        assert "b" in seen
+        assert "c" not in seen
+        assert 2 == len(seen)
+    with DiskSet(path) as seen:
+        assert not seen.add("b")
+        assert 2 == len(seen)
@@ -1,7 +1,9 @@
+import pytest
 import networkx as nx
+import rdkit.Chem.rdChemReactions as rdChemReactions
 
 from fgutils.torch import its_from_torch, its_to_torch
-from fgutils.its import get_its, split_its, ITS
+from fgutils.its import get_its, split_its, ITS, FailedConversion
 from fgutils.parse import parse
 from fgutils.rdkit import smiles_to_graph
 from fgutils.const import (
@@ -112,3 +114,41 @@ def test_its_isomorphism2():
     its1.standardize()
     its2.standardize()
     assert its1.wl_hash == its2.wl_hash
+
+
+@pytest.mark.parametrize(
+    "smiles",
+    [
+        "[C:1][O:2].[C:3]>>[C:1].[O:2][C:3]",
+        "[CH3:1][C:2](=[O:3])[OH:4].[NH3:5]>>[CH3:1][C:2](=[O:3])[NH2:5].[OH2:4]",
+        "[CH3:1][C:2](=[O:3])[O-:4].[NH4+:5]>>[CH3:1][C:2](=[O:3])[OH:4].[NH3:5]",
+    ],
+)
+def test_its_to_rdkit_reaction(smiles):
+    its = ITS.from_smiles(smiles)
+    rxn = its.to_rdkit_reaction()
+    assert its.to_smiles() == rdChemReactions.ReactionToSmiles(rxn)
+    rxn = its.to_rdkit_reaction(ignore_aam=True)
+    assert its.to_smiles(ignore_aam=True) == rdChemReactions.ReactionToSmiles(rxn)
+
+
+@pytest.mark.parametrize("n_jobs", [None, 2])
+def test_its_from_smiles_many(n_jobs):
+    smiles = [
+        "[C:1][O:2].[C:3]>>[C:1].[O:2][C:3]",
+        "invalid>>smiles",
+        "[C:1]=[C:2]>>[C:1][C:2]",
+    ]
+    its_graphs = list(ITS.from_smiles_many(smiles, n_jobs=n_jobs, chunksize=2))
+    assert 2 == len(its_graphs)
+    assert ITS.from_smiles(smiles[2]).to_smiles() == its_graphs[1].to_smiles()
+    results = list(ITS.from_smiles_many(smiles, n_jobs=n_jobs, on_error="collect"))
+    assert 3 == len(results)
+    assert isinstance(results[0], ITS)
+    assert isinstance(results[1], FailedConversion)
+    assert 1 == results[1].index
+    assert "invalid>>smiles" == results[1].smiles
+    assert "ValueError" == results[1].error
+    assert ITS.from_smiles(smiles[2]).to_smiles() == results[2].to_smiles()
+    with pytest.raises(ValueError):
+        list(ITS.from_smiles_many(smiles, n_jobs=n_jobs, on_error="raise"))
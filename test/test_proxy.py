@@ -1,3 +1,6 @@
+import csv
+import json
+import pickle
 import pytest
 import numpy as np
 
@@ -8,10 +11,24 @@ from fgutils.proxy import (
     ReactionProxy,
     ProxyGroup,
     GraphSampler,
+    WeightedSampler,
+    StratifiedSampler,
+    ReservoirSampler,
     build_group_tree,
     build_graphs,
+    iter_graphs,
+    replace_node,
+    GraphBuilder,
+    ProxyGrammar,
+    ProxyConstraint,
+    MaxAtomCount,
+    ValenceBound,
+    MolProxy,
 )
 from fgutils.const import SYMBOL_KEY
+from fgutils.rdkit import graph_to_smiles
+from fgutils.chem import check_valence
+from fgutils.store import GraphStore
 
 from test.my_asserts import assert_graph_eq
 
@@ -267,6 +284,15 @@ def test_insert_aromatic_ring():
     assert_graph_eq(parser("c1ccc2c(c1)CCCC2"), graphs[1])
 
 
+def test_graph_sampler_subclass_without_group_name():
+    class FirstGraphSampler(GraphSampler):
+        def sample(self, graphs):
+            return [graphs[0]]
+
+    group = ProxyGroup("g", ["O", "N"], sampler=FirstGraphSampler())
+    assert ["CO"] == [_get_symbols(g) for g in Proxy("C{g}", group)]
+
+
 def test_graph_dependency_with_custom_sampler():
     class CustomSampler:
         def __init__(self, group1, group2):
@@ -312,3 +338,445 @@ def test_graph_dependency_with_custom_sampler():
     result_2 = next(proxy_2)
     assert_graph_eq(parser("CCC=O"), result_1)
     assert_graph_eq(parser("CCC=O"), result_2)
+
+
+def test_iter_graphs_depth_first():
+    parser = Parser()
+    core = ProxyGraph("{g1}C{g2}")
+    groups = {
+        "g1": ProxyGroup("g1", ["{g3}", "O"]),
+        "g2": ProxyGroup("g2", ["N", "S"]),
+        "g3": ProxyGroup("g3", "F"),
+    }
+    graphs = list(iter_graphs(core, groups, parser))
+    exp_graphs = ["FCN", "FCS", "OCN", "OCS"]
+    assert len(exp_graphs) == len(graphs)
+    for exp_graph, graph in zip(exp_graphs, graphs):
+        assert_graph_eq(parser(exp_graph), graph)
+    bfs_graphs = build_graphs(core, groups, parser)
+    assert len(bfs_graphs) == len(graphs)
+
+
+def test_iter_graphs_is_lazy():
+    calls = []
+
+    def _sampler(graphs):
+        calls.append(len(graphs))
+        return graphs
+
+    core = ProxyGraph("{g}{g}{g}")
+    groups = {"g": ProxyGroup("g", ["C", "O"], sampler=_sampler)}
+    generator = iter_graphs(core, groups, Parser())
+    graph = next(generator)
+    assert 3 == len(calls)
+    assert_graph_eq(pattern_to_graph("CCC"), graph)
+
+
+def test_iter_graphs_stops_if_sampler_is_exhausted():
+    core = ProxyGraph("{g}{g}{g}")
+    groups = {"g": ProxyGroup("g", ["C", "O"], unique=True)}
+    assert [] == list(iter_graphs(core, groups, Parser()))
+    assert [] == list(Proxy("{g}{g}{g}", ProxyGroup("g", ["C", "O"], unique=True)))
+
+
+def test_iter_graphs_yields_completed_graphs_if_sampler_is_exhausted():
+    core = ProxyGraph("{a}{b}")
+    groups = {
+        "a": ProxyGroup("a", ["C", "O"]),
+        "b": ProxyGroup("b", "N", unique=True),
+    }
+    graphs = list(iter_graphs(core, groups, Parser()))
+    assert 1 == len(graphs)
+    assert_graph_eq(pattern_to_graph("CN"), graphs[0])
+
+
+@pytest.mark.parametrize(
+    "core,groups,exp_cnt",
+    (
+        ("C", {}, 1),
+        (["{g1}C{g2}", "N{g1}"], {"g1": ["{g3}", "O"], "g2": ["N", "S"], "g3": "F"}, 6),
+        ("{g}{g}{g}", {"g": ["C", "O"]}, 8),
+        ("C{h,g}", {"g": ["C", "O"]}, 2),
+    ),
+)
+def test_count(core, groups, exp_cnt):
+    proxy = Proxy(core, [ProxyGroup(k, v) for k, v in groups.items()])
+    assert exp_cnt == proxy.count()
+    assert exp_cnt == len(list(proxy))
+    assert exp_cnt == proxy.count()
+
+
+def test_count_recursive_group():
+    with pytest.raises(ValueError):
+        Proxy("C{g}", ProxyGroup("g", ["C{g}", "O"])).count()
+
+
+def test_count_requires_default_sampler():
+    proxy = Proxy("C{g}", ProxyGroup("g", ["C", "O"], unique=True))
+    with pytest.raises(ValueError):
+        proxy.count()
+    proxy = Proxy("C{g}", ProxyGroup("g", ["C", "O"], sampler=lambda x: x))
+    with pytest.raises(ValueError):
+        proxy.count()
+
+
+def test_grammar_templates():
+    groups = {"g1": ProxyGroup("g1", ["O{g2}"]), "g2": ProxyGroup("g2", ["C", "N"])}
+    grammar = ProxyGrammar(groups, Parser())
+    nodes, edges, group_nodes = grammar.get_template("C{g1}C{g2}")
+    assert ["C", "#", "C", "#"] == [d[SYMBOL_KEY] for d in nodes]
+    assert 3 == len(edges)
+    assert [(1, "g1"), (3, "g2")] == group_nodes
+    assert ["g2"] == grammar.get_group_names("O{g2}")
+
+
+@pytest.mark.parametrize(
+    "core,groups,exp_err",
+    [
+        ("C{h}", {"g": ["C"]}, ValueError),
+        ("C{g}", {"g": ["C{h}"]}, ValueError),
+        ("C{g}", {"g": ["C{g}"]}, ValueError),
+        ("C{g}", {"g": ["C{g}", "O"]}, ValueError),
+        ("C{g}", {"g": ["C{h}", "O"], "h": ["N{g}"]}, ValueError),
+        ("C{g,h}", {"g": ["C"], "h": ["O"]}, RuntimeError),
+    ],
+)
+def test_invalid_grammar(core, groups, exp_err):
+    with pytest.raises(exp_err):
+        Proxy(core, [ProxyGroup(k, v) for k, v in groups.items()])
+
+
+def test_init_rejects_label_without_group():
+    with pytest.raises(ValueError):
+        ReactionProxy.from_dict({"core": "{A}", "groups": {"test": "BB"}})
+
+
+def test_invalid_grammar_from_dict():
+    with pytest.raises(ValueError):
+        Proxy.from_dict({"core": "C{g}", "groups": {"g": "C{h}"}})
+
+
+def test_set_invalid_groups_keeps_grammar():
+    proxy = Proxy("C{g}", ProxyGroup("g", ["C", "O"]))
+    with pytest.raises(ValueError):
+        proxy.groups = ProxyGroup("g", ["C{h}"])
+    assert ["CC", "CO"] == [_get_symbols(g) for g in proxy]
+
+
+def test_grammar_ignores_unused_groups():
+    groups = [ProxyGroup("g", ["C", "O"]), ProxyGroup("unused", ["C{undefined}"])]
+    assert 2 == len(list(Proxy("C{g}", groups)))
+
+
+def test_grammar_allows_sampled_recursion():
+    group = ProxyGroup("g", ["C{g}", "O"], sampler=lambda x: [x[1]])
+    assert ["CO"] == [_get_symbols(g) for g in Proxy("C{g}", group)]
+
+
+def test_set_groups_recompiles_grammar():
+    proxy = Proxy("C{g}", ProxyGroup("g", ["C", "O"]))
+    grammar = proxy.grammar
+    proxy.groups = ProxyGroup("g", ["N"])
+    assert grammar is not proxy.grammar
+    assert ["CN"] == [_get_symbols(g) for g in proxy]
+
+
+def test_random_access():
+    groups = [
+        ProxyGroup("g1", ["{g3}", "O"]),
+        ProxyGroup("g2", ["N", "S", "C{g1}"]),
+        ProxyGroup("g3", ["F", "Cl"]),
+    ]
+    proxy = Proxy(["{g1}C{g2}", "N{g2}"], groups, enable_aam=False)
+    exp_graphs = list(Proxy(["{g1}C{g2}", "N{g2}"], groups, enable_aam=False))
+    assert len(exp_graphs) == proxy.count()
+    for i, exp_graph in enumerate(exp_graphs):
+        assert_graph_eq(exp_graph, proxy[i])
+    assert_graph_eq(exp_graphs[-1], proxy[-1])
+    with pytest.raises(IndexError):
+        proxy[len(exp_graphs)]
+
+
+def test_sample_is_reproducible():
+    proxy = Proxy("{g}{g}{g}", ProxyGroup("g", ["C", "O", "N"]))
+    samples = proxy.sample(5, seed=42)
+    assert 5 == len(samples)
+    for exp_graph, graph in zip(samples, proxy.sample(5, seed=42)):
+        assert_graph_eq(exp_graph, graph)
+    symbols = set(
+        "".join(d[SYMBOL_KEY] for _, d in sorted(g.nodes(data=True))) for g in samples
+    )
+    assert 5 == len(symbols)
+
+
+def test_reaction_proxy_random_access():
+    proxy = ReactionProxy("C<1,2>C{g}", ProxyGroup("g", ["C", "O"]))
+    exp_g, exp_h = list(ReactionProxy("C<1,2>C{g}", ProxyGroup("g", ["C", "O"])))[1]
+    g, h = proxy[1]
+    assert_graph_eq(exp_g, g)
+    assert_graph_eq(exp_h, h)
+
+
+def _get_symbols(graph):
+    return "".join(d[SYMBOL_KEY] for _, d in sorted(graph.nodes(data=True)))
+
+
+@pytest.mark.parametrize("num_shards", [1, 2, 3, 7, 50])
+def test_iter_shard(num_shards):
+    groups = [
+        ProxyGroup("g1", ["{g3}", "O"]),
+        ProxyGroup("g2", ["N", "S", "C{g1}"]),
+        ProxyGroup("g3", ["F", "Cl"]),
+    ]
+    proxy = Proxy(["{g1}C{g2}", "N{g2}", "C"], groups)
+    exp_symbols = sorted(_get_symbols(g) for g in proxy)
+    symbols = []
+    for i in range(num_shards):
+        symbols.extend(_get_symbols(g) for g in proxy.iter_shard(i, num_shards))
+    assert exp_symbols == sorted(symbols)
+    with pytest.raises(ValueError):
+        next(proxy.iter_shard(num_shards, num_shards))
+
+
+def test_iter_parallel_keeps_order():
+    groups = [ProxyGroup("g", ["C", "O", "N{h}"]), ProxyGroup("h", ["F", "Cl"])]
+    exp_graphs = list(Proxy("{g}C{g}", groups))
+    graphs = list(Proxy("{g}C{g}", groups).iter_parallel(n_jobs=2, units_per_job=2))
+    assert len(exp_graphs) == len(graphs)
+    for exp_graph, graph in zip(exp_graphs, graphs):
+        assert_graph_eq(exp_graph, graph)
+
+
+def test_pickle_proxy():
+    proxy = Proxy("C{g}", ProxyGroup("g", ["C", "O"]))
+    proxy = pickle.loads(pickle.dumps(proxy))
+    assert ["CC", "CO"] == [_get_symbols(g) for g in proxy]
+
+
+def test_graph_builder_is_equal_to_replace_node():
+    parser = Parser()
+    sub_graph = ProxyGraph("C1CC({g})CC1", anchor=[0, 3])
+    builder = GraphBuilder("N{g}(O)C=C", parser)
+    exp_graph = replace_node(parser("N{g}(O)C=C"), 1, sub_graph, parser)
+    builder.replace_node(1, sub_graph)
+    assert_graph_eq(exp_graph, builder.to_graph())
+    exp_graph = replace_node(exp_graph, 7, ProxyGraph("Cl"), parser)
+    builder.replace_node(builder.get_next_group_node({"g": None}), ProxyGraph("Cl"))
+    graph = builder.to_graph()
+    assert_graph_eq(exp_graph, graph)
+    assert [list(exp_graph.adj[n]) for n in exp_graph.nodes] == [
+        list(graph.adj[n]) for n in graph.nodes
+    ]
+
+
+def test_graph_builder_undo():
+    parser = Parser()
+    builder = GraphBuilder("C{g}C", parser)
+    token = builder.replace_node(1, ProxyGraph("OC{g}", anchor=[0, 1]))
+    assert_graph_eq(parser("COC({g})C"), builder.to_graph())
+    assert 5 == builder.get_next_group_node({"g": None})
+    builder.undo(token)
+    assert_graph_eq(parser("C{g}C"), builder.to_graph())
+    builder.replace_node(1, ProxyGraph("N"))
+    assert_graph_eq(parser("CNC"), builder.to_graph())
+
+
+def test_unique_sampler_with_many_graphs():
+    graphs = [ProxyGraph("C") for _ in range(1000)]
+    sampler = GraphSampler(unique=True)
+    samples = [sampler(graphs)[0] for _ in range(1000)]
+    assert graphs == samples
+    assert sampler(graphs) is None
+    new_graphs = graphs + [ProxyGraph("O")]
+    assert [new_graphs[-1]] == sampler(new_graphs)
+
+
+def test_sampler_signature_is_inspected_once():
+    calls = []
+
+    def _sampler(graphs, group_name=None):
+        calls.append(group_name)
+        return graphs
+
+    group = ProxyGroup("g", ["C", "O"], sampler=_sampler)
+    group.sample_graphs()
+    group.sampler = lambda graphs: graphs[:1]
+    assert 1 == len(group.sample_graphs())
+    assert ["g"] == calls
+
+
+def test_weighted_sampler():
+    graphs = [ProxyGraph("C", weight=0), ProxyGraph("O"), ProxyGraph("N", weight=0)]
+    sampler = WeightedSampler(k=3, seed=0)
+    assert [graphs[1]] * 3 == sampler(graphs)
+
+
+def test_stratified_sampler():
+    graphs = [
+        ProxyGraph("C", stratum="a"),
+        ProxyGraph("O", stratum="b"),
+        ProxyGraph("N", stratum="a"),
+        ProxyGraph("S", stratum="b"),
+        ProxyGraph("F", stratum="c"),
+    ]
+    sampler = StratifiedSampler(k=2, seed=0)
+    samples = sampler(graphs)
+    assert 5 == len(samples)
+    assert ["a", "a", "b", "b", "c"] == [g["stratum"] for g in samples]
+    assert ["a", "b", "c"] == [g["stratum"] for g in StratifiedSampler()(graphs)]
+
+
+def test_reservoir_sampler():
+    graphs = [ProxyGraph("C", idx=i) for i in range(100)]
+    samples = ReservoirSampler(k=10, seed=1)(graphs)
+    assert 10 == len(set(samples))
+    idx = [g["idx"] for g in samples]
+    assert sorted(idx) == idx
+    assert samples == ReservoirSampler(k=10, seed=1)(graphs)
+    assert graphs[:3] == ReservoirSampler(k=5)(graphs[:3])
+
+
+def test_proxy_with_random_sampler():
+    sampler = ReservoirSampler(k=2)
+    proxy = Proxy("C{g}", ProxyGroup("g", ["C", "O", "N", "S"], sampler=sampler))
+    assert 2 == len(list(proxy))
+
+
+@pytest.mark.parametrize("dedupe", [True, "exact"])
+def test_dedupe_proxy(dedupe):
+    groups = [ProxyGroup("g", ["C", "{h}"]), ProxyGroup("h", ["C", "O"])]
+    assert 9 == len(list(Proxy("{g}C{g}", groups)))
+    graphs = list(Proxy("{g}C{g}", groups, dedupe=dedupe))
+    assert ["CCC", "CCO", "COO"] == [_get_symbols(g) for g in graphs]
+
+
+def test_dedupe_parallel_proxy():
+    groups = [ProxyGroup("g", ["C", "{h}"]), ProxyGroup("h", ["C", "O"])]
+    proxy = Proxy("{g}C{g}", groups, dedupe=True)
+    graphs = list(proxy.iter_parallel(n_jobs=2, units_per_job=2))
+    assert ["CCC", "CCO", "COO"] == [_get_symbols(g) for g in graphs]
+
+
+def test_invalid_dedupe_method():
+    with pytest.raises(ValueError):
+        Proxy("C{g}", ProxyGroup("g", "C"), dedupe="smiles")
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_export_jsonl(tmp_path, n_jobs):
+    path = tmp_path / "samples.jsonl"
+    proxy = MolProxy("C{g}", ProxyGroup("g", ["C", "O", "N"]))
+    assert 3 == proxy.export(path, n_jobs=n_jobs, chunk_size=2, id_fmt="M_{}")
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert [
+        {"index": "M_0", "smiles": "CC"},
+        {"index": "M_1", "smiles": "CO"},
+        {"index": "M_2", "smiles": "CN"},
+    ] == records
+
+
+def test_export_reactions_csv(tmp_path):
+    path = tmp_path / "samples.csv"
+    proxy = ReactionProxy("C<2,1>C{g}", ProxyGroup("g", ["C", "O"]))
+    exp_smiles = [
+        "{}>>{}".format(graph_to_smiles(g), graph_to_smiles(h)) for g, h in proxy
+    ]
+    proxy = ReactionProxy("C<2,1>C{g}", ProxyGroup("g", ["C", "O"]))
+    assert 2 == proxy.export(path, fmt="csv")
+    with open(path) as f:
+        rows = list(csv.reader(f))
+    assert ["index", "reaction"] == rows[0]
+    assert exp_smiles == [r[1] for r in rows[1:]]
+
+
+def test_export_binary(tmp_path):
+    path = tmp_path / "samples.bin"
+    proxy = ReactionProxy("C<2,1>C{g}", ProxyGroup("g", ["C", "O"]))
+    assert 2 == proxy.export(path, fmt="binary", id_fmt="R{}")
+    store = GraphStore(path, as_its=True)
+    assert ["R0", "R1"] == store.keys()
+    assert "[CH2:1]=[CH:2][OH:3]>>[CH3:1][CH2:2][OH:3]" == store["R1"].to_smiles()
+
+
+def _get_constraint_groups():
+    return [
+        ProxyGroup("g", ["C", "C(=O)=O", "C(=O){h}", "N{h}"]),
+        ProxyGroup("h", ["C", "O", "C(=C)=C"]),
+    ]
+
+
+def test_grammar_min_size():
+    groups = {
+        "g": ProxyGroup("g", ["CC{h}", "H{h}"]),
+        "h": ProxyGroup("h", ["H", "OO"]),
+        "k": ProxyGroup("k", ["C{g}"]),
+    }
+    grammar = ProxyGrammar(groups, Parser())
+    assert 2 == grammar.get_min_size("g")
+    assert 0 == grammar.get_min_size("g", heavy_only=True)
+    assert 3 == grammar.get_min_size("k")
+    assert 1 == grammar.get_min_size("k", heavy_only=True)
+
+
+def test_valence_bound():
+    proxy = MolProxy("C{g}", _get_constraint_groups())
+    exp_symbols = [_get_symbols(g) for g in proxy if check_valence(g)]
+    assert len(exp_symbols) < 8
+    proxy = MolProxy("C{g}", _get_constraint_groups(), constraints=[ValenceBound()])
+    assert exp_symbols == [_get_symbols(g) for g in proxy]
+
+
+def test_valence_bound_on_reaction():
+    groups = ProxyGroup("g", ["C", "C(=C)=C"])
+    proxy = ReactionProxy(
+        "C<2,1>C{g}", groups, enable_aam=False, constraints=[ValenceBound()]
+    )
+    assert ["C=CC>>CCC"] == [
+        "{}>>{}".format(graph_to_smiles(g), graph_to_smiles(h)) for g, h in proxy
+    ]
+
+
+@pytest.mark.parametrize("max_count", [1, 2, 3, 4])
+def test_max_atom_count(max_count):
+    proxy = MolProxy("C{g}", _get_constraint_groups())
+    exp_symbols = [_get_symbols(g) for g in proxy if len(g.nodes) <= max_count]
+    proxy = MolProxy(
+        "C{g}", _get_constraint_groups(), constraints=[MaxAtomCount(max_count)]
+    )
+    assert exp_symbols == [_get_symbols(g) for g in proxy]
+
+
+def test_constraint_prunes_branches():
+    class NoNitrogen(ProxyConstraint):
+        def __init__(self):
+            self.graphs = 0
+
+        def check(self, builder, nodes):
+            if builder.get_next_group_node() is None:
+                self.graphs += 1
+            return all(builder.get_node(n)[SYMBOL_KEY] != "N" for n in nodes)
+
+    constraint = NoNitrogen()
+    proxy = MolProxy("C{g}", _get_constraint_groups(), constraints=[constraint])
+    assert 5 == len(list(proxy))
+    assert 5 == constraint.graphs
+
+
+@pytest.mark.parametrize("num_shards", [1, 3])
+def test_iter_shard_with_constraints(num_shards):
+    constraints = [ValenceBound()]
+    proxy = MolProxy("C{g}", _get_constraint_groups(), constraints=constraints)
+    exp_symbols = sorted(_get_symbols(g) for g in proxy)
+    symbols = []
+    for i in range(num_shards):
+        symbols.extend(_get_symbols(g) for g in proxy.iter_shard(i, num_shards))
+    assert exp_symbols == sorted(symbols)
+
+
+def test_random_access_with_constraints():
+    proxy = MolProxy("C{g}", _get_constraint_groups(), constraints=[ValenceBound()])
+    with pytest.raises(ValueError):
+        proxy[0]
+    with pytest.raises(ValueError):
+        proxy.sample(1)
@@ -2,7 +2,10 @@ import pytest
 import networkx as nx
 
 from fgutils.parse import parse
-from fgutils.rdkit import graph_to_smiles, smiles_to_graph, graph_to_mol
+import rdkit.Chem as Chem
+
+from fgutils.its import split_its
+from fgutils.rdkit import graph_to_smiles, smiles_to_graph, graph_to_mol, its_to_mols
 
 
 def test_simple_graph():
@@ -86,3 +89,12 @@ def test_smiles_to_graph_without_H2():
     g = smiles_to_graph(smiles, h_nodes=False)
     assert 2 == len(g.nodes)
     assert 1 == len(g.edges)
+
+
+def test_its_to_mols_with_scalar_bonds():
+    its = parse("C<2,1>CO")
+    its.edges[1, 2]["bond"] = 1
+    g, h = its_to_mols(its)
+    exp_g, exp_h = (graph_to_smiles(x) for x in split_its(its))
+    assert exp_g == Chem.MolToSmiles(g)
+    assert exp_h == Chem.MolToSmiles(h)
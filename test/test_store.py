@@ -0,0 +1,90 @@
+import pickle
+import pytest
+
+from fgutils.store import GraphStore, GraphStoreWriter
+from fgutils.its import ITS
+from fgutils.rdkit import mol_smiles_to_graph
+
+from test.my_asserts import assert_graph_eq
+
+
+def test_random_access(tmp_path):
+    smiles = ["CCO", "C=C", "c1ccccc1", "[NH4+]"]
+    exp_graphs = [mol_smiles_to_graph(s) for s in smiles]
+    store = GraphStore.write(tmp_path / "graphs.bin", exp_graphs)
+    assert len(smiles) == len(store)
+    assert store.keys() is None
+    assert_graph_eq(exp_graphs[2], store[2])
+    assert_graph_eq(exp_graphs[0], store[0])
+    assert_graph_eq(exp_graphs[3], store[-1])
+    with pytest.raises(IndexError):
+        store[4]
+    for exp_graph, graph in zip(exp_graphs, store):
+        assert_graph_eq(exp_graph, graph)
+    store.close()
+
+
+def test_access_by_key(tmp_path):
+    smiles = ["[C:1][O:2]>>[C:1]=[O:2]", "[C:1]=[C:2]>>[C:1][C:2]"]
+    its_graphs = [ITS.from_smiles(s) for s in smiles]
+    path = tmp_path / "its.bin"
+    with GraphStoreWriter(path) as writer:
+        for i, its in enumerate(its_graphs):
+            assert i == writer.add(its, key="R{}".format(i))
+    store = GraphStore(path, as_its=True)
+    assert ["R0", "R1"] == store.keys()
+    assert 1 == store.index_of("R1")
+    its = store["R1"]
+    assert isinstance(its, ITS)
+    assert its_graphs[1].to_smiles() == its.to_smiles()
+
+
+def test_key_lookup(tmp_path):
+    keys = ["k{}".format(i) for i in [5, 3, 10, 0, 42]]
+    graphs = [mol_smiles_to_graph("C" * (i + 1)) for i in range(len(keys))]
+    store = GraphStore.write(tmp_path / "graphs.bin", graphs, keys=keys)
+    assert keys == store.keys()
+    for i, key in enumerate(keys):
+        assert i == store.index_of(key)
+    for key in ["k1", "k100", "k42000", ""]:
+        with pytest.raises(KeyError):
+            store.index_of(key)
+    assert not (tmp_path / "graphs.bin.idx.tmp").exists()
+    assert not (tmp_path / "graphs.bin.keys.tmp").exists()
+
+
+def test_keys_required_for_all_graphs(tmp_path):
+    with pytest.raises(ValueError):
+        with GraphStoreWriter(tmp_path / "graphs.bin") as writer:
+            writer.add(mol_smiles_to_graph("C"), key="a")
+            writer.add(mol_smiles_to_graph("O"))
+
+
+def test_rejected_add_writes_no_record(tmp_path):
+    path = tmp_path / "graphs.bin"
+    with GraphStoreWriter(path) as writer:
+        writer.add(mol_smiles_to_graph("C"), key="a")
+        with pytest.raises(ValueError):
+            writer.add(mol_smiles_to_graph("O"))
+        writer.add(mol_smiles_to_graph("N"), key="b")
+    store = GraphStore(path)
+    assert ["a", "b"] == store.keys()
+    assert_graph_eq(mol_smiles_to_graph("N"), store["b"])
+    assert 2 == len(list(GraphStore(path)))
+
+
+def test_duplicate_keys_write_no_index(tmp_path):
+    path = tmp_path / "graphs.bin"
+    with pytest.raises(ValueError):
+        with GraphStoreWriter(path) as writer:
+            writer.add(mol_smiles_to_graph("C"), key="a")
+            writer.add(mol_smiles_to_graph("O"), key="a")
+    assert not (tmp_path / "graphs.bin.idx.npy").exists()
+
+
+def test_pickle_store(tmp_path):
+    exp_graph = mol_smiles_to_graph("CC(=O)O")
+    store = GraphStore.write(tmp_path / "graphs.bin", [exp_graph])
+    assert_graph_eq(exp_graph, store[0])
+    store = pickle.loads(pickle.dumps(store))
+    assert_graph_eq(exp_graph, store[0])
@@ -12,6 +12,8 @@ from fgutils.utils import (
     get_unreachable_nodes,
     get_reactant,
     get_product,
+    get_num_jobs,
+    parallel_imap,
 )
 from fgutils.its import get_rc
 from fgutils.const import SYMBOL_KEY
@@ -268,3 +270,33 @@ def test_product_from_rxn_smiles():
     smiles = "CCO>>CC(=O)O"
     output = get_product(smiles)
     assert "CC(=O)O" == output
+
+
+def _square(x):
+    return x * x
+
+
+@pytest.mark.parametrize("n_jobs", [None, 1, 2])
+def test_parallel_imap_keeps_order(n_jobs):
+    result = list(parallel_imap(_square, range(20), n_jobs=n_jobs, chunksize=3))
+    assert [x * x for x in range(20)] == result
+
+
+def test_parallel_imap_with_bounded_input():
+    consumed = []
+
+    def _items():
+        for x in range(20):
+            consumed.append(x)
+            yield x
+
+    results = parallel_imap(_square, _items(), n_jobs=2, max_pending=3)
+    assert 0 == next(results)
+    assert len(consumed) <= 4
+    assert [x * x for x in range(1, 20)] == list(results)
+
+
+def test_get_num_jobs():
+    assert 1 == get_num_jobs(None)
+    assert 3 == get_num_jobs(3)
+    assert get_num_jobs(-1) >= 1